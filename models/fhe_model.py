@@ -7,37 +7,55 @@ fraud transactions, applies homomorphic encryption to the trained model using
 Concrete ML, and saves the necessary files for later deployment.
 
 The following steps are performed:
-1. Data loading and preprocessing
-2. Balancing the dataset
+1. Data loading and class balancing, in a single pass over the chunks of the dataset
+2. Separating the features and the target
 3. Feature scaling
 4. Model training
 5. Homomorphic encryption and model deployment
+
+The model is saved as a version of the artifact store (models/artifacts, see
+src.library.models.artifact_store), named after the hash of the training data, the
+model class and hyperparameters, and the Concrete ML version. When the store already
+holds this version, the model is neither fitted nor compiled again: the version just
+becomes the latest one, served by default by the server and the client.
+
+Along with the deployment files, a version holds the scaler, the model dumped to
+clear_model.json, which the server evaluates in plaintext in the "clear" execution
+mode, and the static cost of its circuit (bit-width, PBS count, key sizes and
+predicted latency, see src.library.models.circuit_cost), printed and saved to
+circuit_cost.json.
 """
 
 import os
-import pandas as pd
 import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from concrete.ml.sklearn.rf import RandomForestClassifier
-from concrete.ml.deployment import FHEModelDev
+from src.library.models.artifact_store import (
+    ArtifactStore,
+    artifact_version,
+    fingerprint_data,
+)
+from src.library.models.circuit_cost import (
+    circuit_cost_report,
+    load_report,
+    save_report,
+)
+from src.library.preprocessing.data_preprocessing import load_balanced_data, split_data
 
-# Load the data (100,000 rows only)
+# Load a class-balanced sample of the whole dataset, read chunk by chunk with compact
+# dtypes (see src.library.preprocessing.data_preprocessing). MAX_ROWS_PER_CLASS bounds
+# the size of the sample, and the memory used to load it.
 DATA_PATH = os.path.join(os.path.abspath(os.getcwd()), "dataset", "card_transdata.csv")
-df = pd.read_csv(DATA_PATH, nrows=100000)  # Limit to 100,000 rows
-
-# Check for missing values
-if df.isnull().sum().any():
-    df = df.dropna()
-
-# Handle class imbalance
-fraud = df[df["fraud"] == 1]
-non_fraud = df[df["fraud"] == 0].sample(n=len(fraud), random_state=42)
-balanced_df = pd.concat([fraud, non_fraud])
+MAX_ROWS_PER_CLASS = os.environ.get("MAX_ROWS_PER_CLASS")
+balanced_df = load_balanced_data(
+    DATA_PATH,
+    max_per_class=int(MAX_ROWS_PER_CLASS) if MAX_ROWS_PER_CLASS else None,
+)
 
 # Separate features and target
-X = balanced_df.drop(columns=["fraud"])
-y = balanced_df["fraud"].astype(int)
+X, y = split_data(balanced_df, balanced=True)
+y = y.astype(int)
 
 # Split into training and validation sets
 X_train, X_val, y_train, y_val = train_test_split(
@@ -49,20 +67,39 @@ scaler = StandardScaler()
 X_train_scaled = scaler.fit_transform(X_train)
 X_val_scaled = scaler.transform(X_val)
 
-# Save the scaler for later use
-SCALER_PATH = os.path.join(os.path.abspath(os.getcwd()), "models", "scaler.pkl")
-joblib.dump(scaler, SCALER_PATH)
-
-# Train the Random Forest model with Concrete ML
+# Random Forest model with Concrete ML, and the version of its build in the artifact store
 model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train_scaled, y_train)
+DATA_FINGERPRINT = fingerprint_data(X_train_scaled, y_train)
+VERSION = artifact_version(DATA_FINGERPRINT, model)
+store = ArtifactStore()
+
+if store.manifest(VERSION) is not None:
+    # Same data, model, hyperparameters and Concrete ML version: nothing to rebuild
+    store.set_latest(VERSION)
+    cost_report = load_report(store.path(VERSION))
+    print(f"Model version {VERSION} up to date in {store.path(VERSION)}")
+else:
+    # Train the model and compile it for homomorphic encryption
+    model.fit(X_train_scaled, y_train)
+    model.compile(X_train_scaled)
 
-# Compile the model for homomorphic encryption
-model.compile(X_train_scaled)
+    # Report the cost of the compiled circuit before deploying it
+    cost_report = circuit_cost_report(model)
 
-# Save the model and necessary files for client and server
-FHE_DIRECTORY = os.path.join(os.path.abspath(os.getcwd()), "models", "fhe_files")
-dev = FHEModelDev(path_dir=FHE_DIRECTORY, model=model)
-dev.save()
+    # Save the client and server files, the model for the plaintext evaluation of the
+    # "clear" execution mode, the scaler and the cost report as a new version
+    store.save_model(
+        VERSION,
+        model,
+        DATA_FINGERPRINT,
+        writers=[
+            lambda path_dir: joblib.dump(scaler, os.path.join(path_dir, "scaler.pkl")),
+            lambda path_dir: save_report(cost_report, path_dir),
+        ],
+    )
+    print(
+        f"Model version {VERSION} trained, compiled, and saved in {store.path(VERSION)}"
+    )
 
-print("Model trained, compiled, and saved.")
+for name, value in cost_report.items():
+    print(f"{name}: {value:g}")
@@ -0,0 +1,618 @@
+"""
+Load benchmark of the FHE prediction pipeline.
+
+This module sends prediction requests to the client gateway (which scales, encrypts, calls the
+FHE server and decrypts) or directly to the FHE server (with inputs encrypted beforehand), and
+measures the latency, throughput, bytes on the wire and the time spent in each stage of the
+pipeline, read from the Server-Timing headers of the responses.
+
+Two load models are available:
+    - closed loop (--concurrency): a fixed number of simulated users, each sending a request as
+      soon as it got the answer to the previous one;
+    - open loop (--rate): requests arriving at random (Poisson arrivals) at a fixed mean rate,
+      whatever the response times. Latencies are measured from the planned arrival times.
+
+The requests are drawn from a mix of endpoints (--mix predict=0.8,predict_batch=0.2), the batch
+requests holding --batch-size transactions. With the client target, --mode selects the
+execution mode of the predictions (clear, simulate or execute), to load test the gateway at
+production rates without paying for FHE, or to compare the cost of the modes. The results are
+written as JSON to --output, with the git commit and the parameters of the run, so that runs can
+be compared across commits.
+
+Usage:
+    python -m src.benchmark.load_benchmark --target client --concurrency 8 --requests 200
+    python -m src.benchmark.load_benchmark --target server --rate 2 --duration 300
+
+Functions:
+    - parse_mix: Parses a request mix.
+    - parse_server_timing: Parses a Server-Timing header.
+    - summarize: Summarizes the recorded requests.
+    - main: Runs the benchmark from the command line.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+# Order of the features expected by the client and the model
+FEATURE_NAMES = [
+    "distance_from_home",
+    "distance_from_last_transaction",
+    "ratio_to_median_purchase_price",
+    "repeat_retailer",
+    "used_chip",
+    "used_pin_number",
+    "online_order",
+]
+ENDPOINTS = ("predict", "predict_batch")
+BENCHMARK_CLIENT_ID = "load-benchmark"
+OCTET_STREAM_HEADERS = {"Content-Type": "application/octet-stream"}
+
+
+def parse_mix(text):
+    """
+    Parse a request mix such as "predict=0.8,predict_batch=0.2".
+
+    Args:
+        text (str): Comma-separated `endpoint=weight` pairs.
+
+    Returns:
+        dict: The probability of each endpoint, summing to 1.
+
+    Raises:
+        ValueError: If an endpoint is unknown or the weights are not positive.
+    """
+    weights = {}
+    for entry in text.split(","):
+        endpoint, _, weight = entry.partition("=")
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise ValueError(
+                f"Unknown endpoint '{endpoint}', expected one of {ENDPOINTS}"
+            )
+        weights[endpoint] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0 or any(weight < 0 for weight in weights.values()):
+        raise ValueError(f"Invalid request mix '{text}'")
+    return {endpoint: weight / total for endpoint, weight in weights.items()}
+
+
+def parse_server_timing(header):
+    """
+    Parse a Server-Timing header.
+
+    Args:
+        header (str): The header value, e.g. "scale;dur=0.120, encrypt;dur=35.002", or None.
+
+    Returns:
+        dict: The duration of each stage, in milliseconds.
+    """
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name and duration:
+            timings[name] = float(duration)
+    return timings
+
+
+def random_transactions(rng, count):
+    """
+    Draw random transactions with roughly the distribution of the dataset.
+
+    Args:
+        rng (numpy.random.Generator): The random generator.
+        count (int): The number of transactions.
+
+    Returns:
+        list of dict: The transactions, as JSON bodies of the client /predict endpoint.
+    """
+    columns = {
+        "distance_from_home": rng.lognormal(2.3, 1.2, count),
+        "distance_from_last_transaction": rng.lognormal(0.0, 1.5, count),
+        "ratio_to_median_purchase_price": rng.lognormal(0.0, 0.9, count),
+        "repeat_retailer": rng.binomial(1, 0.88, count),
+        "used_chip": rng.binomial(1, 0.35, count),
+        "used_pin_number": rng.binomial(1, 0.1, count),
+        "online_order": rng.binomial(1, 0.65, count),
+    }
+    return [
+        {name: columns[name][index].item() for name in FEATURE_NAMES}
+        for index in range(count)
+    ]
+
+
+def load_transactions(path, rng, count):
+    """
+    Sample transactions from the dataset.
+
+    Args:
+        path (str): Path of the dataset CSV file.
+        rng (numpy.random.Generator): The random generator.
+        count (int): The number of transactions.
+
+    Returns:
+        list of dict: The transactions, as JSON bodies of the client /predict endpoint.
+    """
+    data = np.genfromtxt(path, delimiter=",", names=True, max_rows=100_000)
+    rows = data[rng.integers(0, len(data), count)]
+    return [
+        {
+            name: (int(row[name]) if name in FEATURE_NAMES[3:] else float(row[name]))
+            for name in FEATURE_NAMES
+        }
+        for row in rows
+    ]
+
+
+class ClientTarget:
+    """
+    Sends requests to the client gateway, which encrypts them and calls the FHE server.
+    """
+
+    def __init__(self, transactions, mode=None):
+        self.transactions = transactions
+        self.params = {"mode": mode} if mode else {}
+
+    async def prepare(self, http_client):
+        """
+        Nothing to prepare: the client gateway holds the keys.
+        """
+
+    def request(self, endpoint, rng, batch_size):
+        """
+        Build a request to an endpoint of the client gateway.
+
+        Returns:
+            tuple: The path and the keyword arguments of `httpx.AsyncClient.post`.
+        """
+        indices = rng.integers(0, len(self.transactions), batch_size)
+        if endpoint == "predict":
+            return "/predict", {
+                "json": self.transactions[indices[0]],
+                "params": self.params,
+            }
+        return "/predict_batch", {
+            "json": [self.transactions[i] for i in indices],
+            "params": self.params,
+        }
+
+
+class ServerTarget:
+    """
+    Sends requests directly to the FHE server, with inputs encrypted beforehand.
+
+    The keys come from the client key cache (see `src.client.key_cache`) and are bound to, or
+    uploaded to, the server under the id of the benchmark.
+    """
+
+    def __init__(self, transactions, fhe_directory, key_cache_directory):
+        self.transactions = transactions
+        self.fhe_directory = fhe_directory
+        self.key_cache_directory = key_cache_directory
+        self.encrypted_inputs = []
+
+    async def prepare(self, http_client):
+        """
+        Encrypt the transactions and make sure the server holds the evaluation keys.
+
+        Args:
+            http_client (httpx.AsyncClient): The client connected to the FHE server.
+        """
+        # Imported here so that benchmarking the client gateway does not need Concrete ML
+        import joblib  # pylint: disable=import-outside-toplevel
+        from src.client.key_cache import (  # pylint: disable=import-outside-toplevel
+            load_client_keys,
+        )
+        from src.library.models.artifact_store import (  # pylint: disable=import-outside-toplevel
+            resolve_deployment_directory,
+        )
+
+        if self.fhe_directory is None:
+            _, self.fhe_directory = resolve_deployment_directory()
+        client_keys = load_client_keys(self.fhe_directory, self.key_cache_directory)
+        # The scaler of the version, or the one saved before the artifact store
+        scaler_path = os.path.join(self.fhe_directory, "scaler.pkl")
+        if not os.path.exists(scaler_path):
+            scaler_path = os.path.join(os.getcwd(), "models", "scaler.pkl")
+        scaler = joblib.load(scaler_path)
+        inputs = scaler.transform(
+            np.array(
+                [[row[name] for name in FEATURE_NAMES] for row in self.transactions]
+            )
+        )
+        self.encrypted_inputs = [
+            client_keys.client.quantize_encrypt_serialize(row.reshape(1, -1))
+            for row in inputs
+        ]
+
+        response = await http_client.post(
+            "/bind_evaluation_keys",
+            json={
+                "digest": client_keys.evaluation_keys_digest,
+                "client_id": BENCHMARK_CLIENT_ID,
+            },
+        )
+        if response.status_code == 404:
+            response = await http_client.post(
+                "/evaluation_keys_binary",
+                params={"client_id": BENCHMARK_CLIENT_ID},
+                content=client_keys.read_evaluation_keys(),
+                headers=OCTET_STREAM_HEADERS,
+            )
+        response.raise_for_status()
+
+    def request(self, endpoint, rng, batch_size):
+        """
+        Build a request to an endpoint of the FHE server.
+
+        Returns:
+            tuple: The path and the keyword arguments of `httpx.AsyncClient.post`.
+        """
+        indices = rng.integers(0, len(self.encrypted_inputs), batch_size)
+        if endpoint == "predict":
+            return "/predict_binary", {
+                "params": {"client_id": BENCHMARK_CLIENT_ID},
+                "content": self.encrypted_inputs[indices[0]],
+                "headers": OCTET_STREAM_HEADERS,
+            }
+        return "/predict_batch", {
+            "json": {
+                "data": [self.encrypted_inputs[i].hex() for i in indices],
+                "client_id": BENCHMARK_CLIENT_ID,
+            }
+        }
+
+
+@dataclass
+class BenchmarkRun:
+    """
+    What the requests of a run are sent with, and where their records go.
+
+    Attributes:
+        http_client (httpx.AsyncClient): The client connected to the target.
+        target (ClientTarget or ServerTarget): The target of the benchmark.
+        rng (numpy.random.Generator): The random generator picking the endpoints and the
+            transactions.
+        args (argparse.Namespace): The parameters of the run.
+        records (list): The records of the requests sent so far.
+    """
+
+    http_client: httpx.AsyncClient
+    target: object
+    rng: np.random.Generator
+    args: argparse.Namespace
+    records: list = field(default_factory=list)
+
+
+async def send_request(run, endpoint, start=None):
+    """
+    Send one request and record its outcome.
+
+    Args:
+        run (BenchmarkRun): The run, to whose records the record of the request is appended.
+        endpoint (str): The endpoint of the mix to call.
+        start (float, optional): The planned arrival time of the request
+            (`time.perf_counter()` value), for open-loop runs. Defaults to now.
+    """
+    batch_size = run.args.batch_size if endpoint == "predict_batch" else 1
+    path, kwargs = run.target.request(endpoint, run.rng, batch_size)
+    start = time.perf_counter() if start is None else start
+    record = {"endpoint": endpoint, "rows": batch_size, "ok": False}
+    try:
+        response = await run.http_client.post(path, **kwargs)
+        record.update(
+            ok=response.is_success,
+            status=response.status_code,
+            bytes_sent=len(response.request.content),
+            bytes_received=len(response.content),
+            stages=parse_server_timing(response.headers.get("Server-Timing")),
+        )
+    except httpx.HTTPError as error:
+        record["status"] = type(error).__name__
+    record["latency"] = time.perf_counter() - start
+    run.records.append(record)
+
+
+async def closed_loop(run, mix):
+    """
+    Run simulated users, each one sending requests one after the other.
+    """
+    endpoints, probabilities = list(mix), list(mix.values())
+    deadline = time.perf_counter() + run.args.duration if run.args.duration else None
+    remaining = [run.args.requests]
+
+    async def user():
+        while deadline is None or time.perf_counter() < deadline:
+            if deadline is None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            endpoint = str(run.rng.choice(endpoints, p=probabilities))
+            await send_request(run, endpoint)
+
+    await asyncio.gather(*(user() for _ in range(run.args.concurrency)))
+
+
+async def open_loop(run, mix):
+    """
+    Send requests at Poisson arrival times, without waiting for the responses.
+    """
+    endpoints, probabilities = list(mix), list(mix.values())
+    begin = time.perf_counter()
+    arrival, tasks = begin, []
+    while True:
+        arrival += run.rng.exponential(1 / run.args.rate)
+        if run.args.duration and arrival - begin > run.args.duration:
+            break
+        if not run.args.duration and len(tasks) >= run.args.requests:
+            break
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        endpoint = str(run.rng.choice(endpoints, p=probabilities))
+        tasks.append(asyncio.create_task(send_request(run, endpoint, start=arrival)))
+    await asyncio.gather(*tasks)
+
+
+def _distribution(values):
+    """
+    Return the mean, the percentiles and the maximum of values, in the unit of the values.
+    """
+    if not values:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "mean": float(values.mean()),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(values.max()),
+    }
+
+
+def summarize(records, duration):
+    """
+    Summarize recorded requests.
+
+    Args:
+        records (list of dict): The records of the requests, as built by `send_request`.
+        duration (float): The duration of the run, in seconds.
+
+    Returns:
+        dict: The number of requests and errors (by status), the throughput in requests and
+        rows per second, the latency distribution in milliseconds (mean, p50, p95, p99, max),
+        the bytes sent and received, and the distribution of the duration of each stage
+        reported in the Server-Timing headers, in milliseconds.
+    """
+    successes = [record for record in records if record["ok"]]
+    errors = {}
+    for record in records:
+        if not record["ok"]:
+            errors[str(record["status"])] = errors.get(str(record["status"]), 0) + 1
+    stages = {}
+    for record in successes:
+        for stage, duration_ms in record["stages"].items():
+            stages.setdefault(stage, []).append(duration_ms)
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "throughput_rps": len(successes) / duration if duration else 0.0,
+        "rows_per_s": (
+            sum(record["rows"] for record in successes) / duration if duration else 0.0
+        ),
+        "latency_ms": _distribution([record["latency"] * 1000 for record in successes]),
+        "bytes_sent": sum(record.get("bytes_sent", 0) for record in records),
+        "bytes_received": sum(record.get("bytes_received", 0) for record in records),
+        "stages_ms": {stage: _distribution(values) for stage, values in stages.items()},
+    }
+
+
+def _git_commit():
+    """
+    Return the current git commit, or None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args):
+    """
+    Run the benchmark described by the command line arguments.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        dict: The report of the run, as written to the output file.
+    """
+    rng = np.random.default_rng(args.seed)
+    mix = parse_mix(args.mix)
+    transactions = (
+        load_transactions(args.dataset, rng, args.distinct_inputs)
+        if args.dataset
+        else random_transactions(rng, args.distinct_inputs)
+    )
+    if args.target == "client":
+        target = ClientTarget(transactions, args.mode)
+        url = args.url or "http://127.0.0.1:8001"
+    else:
+        target = ServerTarget(
+            transactions, args.fhe_directory, args.key_cache_directory
+        )
+        url = args.url or "http://127.0.0.1:8000"
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=timeout
+    ) as client:
+        await target.prepare(client)
+
+        warmup = BenchmarkRun(client, target, rng, args)
+        for _ in range(args.warmup):
+            endpoint = str(rng.choice(list(mix), p=list(mix.values())))
+            await send_request(warmup, endpoint)
+
+        run = BenchmarkRun(client, target, rng, args)
+        begin = time.perf_counter()
+        if args.rate:
+            await open_loop(run, mix)
+        else:
+            await closed_loop(run, mix)
+        duration = time.perf_counter() - begin
+        records = run.records
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "host": platform.node(),
+        "parameters": {**vars(args), "url": url, "mix": mix},
+        "duration_s": duration,
+        "overall": summarize(records, duration),
+        "endpoints": {
+            endpoint: summarize(
+                [record for record in records if record["endpoint"] == endpoint],
+                duration,
+            )
+            for endpoint in mix
+        },
+    }
+
+
+def print_report(report):
+    """
+    Print the main figures of a report.
+
+    Args:
+        report (dict): The report of a run, as returned by `run_benchmark`.
+    """
+    print(f"Duration: {report['duration_s']:.1f} s")
+    for name, summary in [("overall", report["overall"]), *report["endpoints"].items()]:
+        latency = summary["latency_ms"]
+        print(
+            f"{name}: {summary['requests']} requests, errors {summary['errors']}, "
+            f"{summary['throughput_rps']:.2f} req/s, {summary['rows_per_s']:.2f} rows/s, "
+            f"sent {summary['bytes_sent']} B, received {summary['bytes_received']} B"
+        )
+        if latency:
+            print(
+                f"  latency ms: p50 {latency['p50']:.1f}, p95 {latency['p95']:.1f}, "
+                f"p99 {latency['p99']:.1f}, max {latency['max']:.1f}"
+            )
+        for stage, distribution in summary["stages_ms"].items():
+            print(
+                f"  {stage}: mean {distribution['mean']:.1f} ms, "
+                f"p95 {distribution['p95']:.1f} ms"
+            )
+
+
+def main():
+    """
+    Parse the command line, run the benchmark and write its report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--target",
+        choices=["client", "server"],
+        default="client",
+        help="send requests to the client gateway or directly to the FHE server",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["clear", "simulate", "execute"],
+        help="execution mode of the predictions of the client target "
+        "(defaults to the PREDICTION_MODE of the client)",
+    )
+    parser.add_argument(
+        "--url", help="base URL of the target (defaults to its port 8001/8000)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of simulated users of a closed-loop run",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="mean arrival rate in requests per second, for an open-loop run",
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=100,
+        help="number of requests, if no duration is set",
+    )
+    parser.add_argument(
+        "--duration", type=float, help="duration of the run, in seconds"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=0, help="requests sent before measuring"
+    )
+    parser.add_argument(
+        "--mix",
+        default="predict=1",
+        help="request mix, e.g. predict=0.8,predict_batch=0.2",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=10, help="rows per batch request"
+    )
+    parser.add_argument(
+        "--dataset",
+        help="CSV file to sample transactions from (random transactions by default)",
+    )
+    parser.add_argument(
+        "--distinct-inputs",
+        type=int,
+        default=32,
+        help="number of distinct transactions (encrypted once each with --target server)",
+    )
+    parser.add_argument(
+        "--fhe-directory",
+        help="FHE deployment files, with --target server (default: the version of the "
+        "artifact store pinned by MODEL_VERSION, or the latest one)",
+    )
+    parser.add_argument(
+        "--key-cache-directory",
+        default=os.path.join("models", "client_keys"),
+        help="client key cache, with --target server",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="request timeout, in seconds"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the random generator"
+    )
+    parser.add_argument(
+        "--output",
+        default="load_benchmark.json",
+        help="JSON file to which the report is written",
+    )
+    args = parser.parse_args()
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    report = asyncio.run(run_benchmark(args))
+    with open(args.output, "w", encoding="utf-8") as file_handler:
+        json.dump(report, file_handler, indent=2)
+    print_report(report)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,59 +9,667 @@ Modules:
 - FastAPI for API creation and routing.
 - Concrete-ML for FHE operations.
 - Scikit-learn for preprocessing.
-- Requests for HTTP requests.
+- HTTPX for asynchronous HTTP requests.
 
 Endpoints:
 - POST /predict: Handles prediction requests.
+- POST /predict_batch: Handles a list of prediction requests in one go.
+- GET /metrics: Exposes the Prometheus metrics of the client (see `src.client.metrics`).
+
+The prediction endpoints take an execution mode ("execute", "simulate" or
+"clear", see `ExecutionMode`) and report the duration of their stages in a
+Server-Timing response header. The transports to the server, the compression,
+the key cache and the result cache are configured with environment variables,
+documented in the README.
 """
 
+import asyncio
+import json
+import logging
 import os
-import requests
+import socket
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from typing import List, Literal
+import httpx
 import numpy as np
 import joblib
-from concrete.ml.deployment import FHEModelClient
 from pydantic import BaseModel
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import uvicorn
+from src.client.crypto_pool import CryptoWorkerPool
+from src.client.key_cache import load_client_keys
+from src.client.prediction_stream import PredictionStream
+from src.client.result_cache import ResultCache
+from src.client.metrics import (
+    COMPRESSION_CPU_SECONDS,
+    COMPRESSION_RATIO,
+    IN_FLIGHT,
+    PREDICTION_SECONDS,
+    STAGE_SECONDS,
+)
+from src.library.compression import (
+    IDENTITY,
+    compress,
+    decompress,
+    negotiate,
+    parse_codecs,
+)
+from src.library.models.artifact_store import resolve_deployment_directory
+from src.library.request_ids import (
+    REQUEST_ID_HEADER,
+    request_id_middleware,
+    request_id_var,
+)
 
 app = FastAPI()
+logger = logging.getLogger("uvicorn.error")
 
-# Load the scaler
-scaler_path = os.path.join(os.path.abspath(os.getcwd()), "models", "scaler.pkl")
+# FHE model files: the version of the artifact store pinned by MODEL_VERSION, or the
+# latest one
+model_version, fhe_directory = resolve_deployment_directory()
+
+# Load the scaler of the version, or the one saved before the artifact store
+scaler_path = os.path.join(fhe_directory, "scaler.pkl")
+if not os.path.exists(scaler_path):
+    scaler_path = os.path.join(os.path.abspath(os.getcwd()), "models", "scaler.pkl")
 scaler = joblib.load(scaler_path)
 
-# Initialize the FHE client (only once)
-fhe_directory = os.path.join(os.path.abspath(os.getcwd()), "models", "fhe_files")
-client = FHEModelClient(path_dir=fhe_directory, key_dir=fhe_directory)
-serialized_evaluation_keys = client.get_serialized_evaluation_keys()
+# Initialize the FHE client (only once), loading the keys shared by the crypto workers
+# from the key cache, or generating them on the first start
+KEY_CACHE_DIRECTORY = os.environ.get(
+    "KEY_CACHE_DIRECTORY",
+    os.path.join(os.path.abspath(os.getcwd()), "models", "client_keys"),
+)
+client_keys = load_client_keys(fhe_directory, KEY_CACHE_DIRECTORY)
+CRYPTO_WORKERS = int(os.environ.get("CRYPTO_WORKERS", os.cpu_count() or 1))
+app.state.crypto_pool = None
+
+# Send ciphertexts and keys as raw bytes rather than hex strings in JSON
+BINARY_TRANSPORT = os.environ.get("BINARY_TRANSPORT", "1") == "1"
+
+# Compression codecs of the client, e.g. "zstd:3,lz4,gzip:1", in order of preference;
+# compression is disabled if unset
+COMPRESSION_CODECS = parse_codecs(os.environ.get("COMPRESSION_CODECS", ""))
+ACCEPT_ENCODING = ", ".join([*COMPRESSION_CODECS, IDENTITY])
+# Smallest request body worth compressing, in bytes
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "256"))
+# Codec of the request bodies, negotiated with the Accept-Encoding header of the server
+app.state.request_codec = None
+
+# Chunked uploads of the evaluation keys: parts sent at once, and retries of a failed part
+KEY_UPLOAD_CONCURRENCY = int(os.environ.get("KEY_UPLOAD_CONCURRENCY", "4"))
+KEY_UPLOAD_RETRIES = int(os.environ.get("KEY_UPLOAD_RETRIES", "5"))
+
+# Id under which the server stores the evaluation keys of this client
+CLIENT_ID = os.environ.get("CLIENT_ID", socket.gethostname())
+# Name of the served model the requests route to, the default model of the server if unset
+SERVER_MODEL = os.environ.get("SERVER_MODEL")
+# Query parameters of the binary endpoints
+SERVER_PARAMS = {"client_id": CLIENT_ID}
+if SERVER_MODEL:
+    SERVER_PARAMS["model"] = SERVER_MODEL
+
+# Connection pool to the FHE server
+SERVER_URL = os.environ.get("SERVER_URL", "http://127.0.0.1:8000")
+SERVER_LIMITS = httpx.Limits(
+    max_connections=int(os.environ.get("SERVER_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(
+        os.environ.get("SERVER_MAX_KEEPALIVE_CONNECTIONS", "20")
+    ),
+)
+SERVER_TIMEOUT = httpx.Timeout(
+    connect=float(os.environ.get("SERVER_CONNECT_TIMEOUT", "5")),
+    write=float(os.environ.get("SERVER_WRITE_TIMEOUT", "60")),
+    read=float(os.environ.get("SERVER_READ_TIMEOUT", "500")),
+    pool=float(os.environ.get("SERVER_POOL_TIMEOUT", "60")),
+)
+app.state.http_client = None
+
+# Run the encrypted predictions as jobs of the server, whose results are long-polled
+JOB_TRANSPORT = os.environ.get("JOB_TRANSPORT", "0") == "1"
+# Time the server may hold a poll for a job result, in seconds
+JOB_POLL_WAIT = float(os.environ.get("JOB_POLL_WAIT", "25"))
+
+# Stream the encrypted predictions over a WebSocket session rather than one request each
+STREAM_TRANSPORT = os.environ.get("STREAM_TRANSPORT", "0") == "1"
+STREAM_URL = (
+    f"ws{SERVER_URL.removeprefix('http')}/predict_stream?{urlencode(SERVER_PARAMS)}"
+)
+app.state.prediction_stream = None
+
+# Cache of the encrypted predictions, keyed by their plaintext inputs: results kept at
+# most (0 disables the cache) and time in seconds each is kept
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "0"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "300"))
+app.state.result_cache = (
+    ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL) if RESULT_CACHE_SIZE > 0 else None
+)
+
+# Execution mode of the predictions that do not name one
+ExecutionMode = Literal["clear", "simulate", "execute"]
+PREDICTION_MODE = os.environ.get("PREDICTION_MODE", "execute")
+if PREDICTION_MODE not in ExecutionMode.__args__:
+    raise ValueError(f"Invalid PREDICTION_MODE: {PREDICTION_MODE}")
+
+
+async def post_to_server(path, timings, content, content_type, params=None):
+    """
+    Posts a body to the server, compressed with the codec negotiated with it.
+
+    The body is compressed, off the event loop, if it has at least
+    COMPRESSION_MIN_SIZE bytes and the server accepts one of the codecs of the
+    client, as advertised in the Accept-Encoding header of its responses, and
+    sent uncompressed if compression does not make it smaller. The response body
+    is read raw and decompressed by the client, so that the CPU time spent is
+    measured. A body rejected with 415 (e.g. by a restarted server without the
+    codec) is sent again with the codecs advertised in the rejection.
+
+    :param path: The path of the endpoint.
+    :param timings: Dictionary to which the durations of the compress and
+        decompress stages are added, in seconds.
+    :param content: The uncompressed request body.
+    :param content_type: The media type of the request body.
+    :param params: The query parameters of the request.
+
+    :return:
+        tuple: The response (httpx.Response), whose body is already read, and
+        its body (bytes), decompressed.
+
+    :raises:
+        httpx.HTTPError: If the request fails.
+    """
+    headers = {"Content-Type": content_type, "Accept-Encoding": ACCEPT_ENCODING}
+    body = content
+    codec = app.state.request_codec
+    if codec is not None and len(content) >= COMPRESSION_MIN_SIZE:
+        with timed(timings, "compress"):
+            compressed, cpu_seconds = await asyncio.to_thread(
+                compress, content, codec, COMPRESSION_CODECS[codec]
+            )
+        COMPRESSION_RATIO.labels(codec, "request").observe(
+            len(content) / len(compressed)
+        )
+        COMPRESSION_CPU_SECONDS.labels(codec, "request").inc(cpu_seconds)
+        if len(compressed) < len(content):
+            body = compressed
+            headers["Content-Encoding"] = codec
+
+    request = app.state.http_client.build_request(
+        "POST", path, content=body, params=params, headers=headers
+    )
+    response = await app.state.http_client.send(request, stream=True)
+    try:
+        raw_body = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+        await response.aclose()
+
+    accept_encoding = response.headers.get("Accept-Encoding")
+    if accept_encoding is not None or response.status_code == 415:
+        app.state.request_codec = negotiate(accept_encoding, COMPRESSION_CODECS)
+    if response.status_code == 415 and "Content-Encoding" in headers:
+        return await post_to_server(path, timings, content, content_type, params)
+
+    codec = response.headers.get("Content-Encoding", IDENTITY)
+    if codec == IDENTITY:
+        return response, raw_body
+    with timed(timings, "decompress"):
+        response_body, cpu_seconds = await asyncio.to_thread(
+            decompress, raw_body, codec
+        )
+    COMPRESSION_RATIO.labels(codec, "response").observe(
+        len(response_body) / max(len(raw_body), 1)
+    )
+    COMPRESSION_CPU_SECONDS.labels(codec, "response").inc(cpu_seconds)
+    return response, response_body
+
+
+async def post_json_to_server(path, timings, payload, params=None):
+    """
+    Posts a JSON body to the server, see `post_to_server`.
+
+    :param path: The path of the endpoint.
+    :param timings: Dictionary to which the durations of the compress and
+        decompress stages are added, in seconds.
+    :param payload: The JSON-serializable request body.
+    :param params: The query parameters of the request.
+
+    :return:
+        tuple: The response (httpx.Response) and its decompressed body (bytes).
+
+    :raises:
+        httpx.HTTPError: If the request fails.
+    """
+    return await post_to_server(
+        path,
+        timings,
+        json.dumps(payload).encode("utf-8"),
+        "application/json",
+        params=params,
+    )
+
+
+async def upload_evaluation_keys_in_parts(serialized_evaluation_keys, timings):
+    """
+    Uploads the evaluation keys to the server in parts, resuming the upload of
+    the same keys if a previous one was interrupted.
+
+    The server answers the start of the upload with the parts it already holds,
+    and only the missing ones are sent, KEY_UPLOAD_CONCURRENCY at a time. A part
+    whose transfer fails is sent again, up to KEY_UPLOAD_RETRIES times with an
+    exponential backoff, before the upload is committed with the digest of the
+    keys.
+
+    :param serialized_evaluation_keys: The serialized evaluation keys.
+    :param timings: Dictionary to which the durations of the compress and
+        decompress stages are added, in seconds.
+
+    :raises:
+        httpx.HTTPError: If a request fails, after the retries for the parts.
+    """
+    response, body = await post_json_to_server(
+        "/evaluation_keys/uploads",
+        timings,
+        {
+            "size": len(serialized_evaluation_keys),
+            "digest": client_keys.evaluation_keys_digest,
+            "client_id": CLIENT_ID,
+            "model": SERVER_MODEL,
+        },
+    )
+    response.raise_for_status()
+    upload = json.loads(body)
+    if "upload_id" not in upload:
+        return
+    upload_path = f"/evaluation_keys/uploads/{upload['upload_id']}"
+    params = {"model": SERVER_MODEL} if SERVER_MODEL else {}
+    part_size = upload["part_size"]
+    semaphore = asyncio.Semaphore(KEY_UPLOAD_CONCURRENCY)
+
+    async def send_part(index):
+        part_start = index * part_size
+        part_end = part_start + part_size
+        part = serialized_evaluation_keys[part_start:part_end]
+        async with semaphore:
+            for attempt in range(KEY_UPLOAD_RETRIES + 1):
+                try:
+                    response = await app.state.http_client.put(
+                        f"{upload_path}/parts/{index}",
+                        params=params,
+                        content=part,
+                        headers={"Content-Type": "application/octet-stream"},
+                    )
+                    response.raise_for_status()
+                    return
+                except httpx.TransportError:
+                    if attempt == KEY_UPLOAD_RETRIES:
+                        raise
+                    logger.warning("Upload of key part %d failed, retrying", index)
+                    await asyncio.sleep(2**attempt)
+
+    missing = sorted(set(range(upload["parts"])) - set(upload["received"]))
+    logger.info(
+        "Uploading %d of the %d parts of the evaluation keys",
+        len(missing),
+        upload["parts"],
+    )
+    await asyncio.gather(*(send_part(index) for index in missing))
+    response, _ = await post_json_to_server(
+        f"{upload_path}/commit",
+        timings,
+        {"digest": client_keys.evaluation_keys_digest},
+        params=params,
+    )
+    response.raise_for_status()
+
+
+async def send_evaluation_keys():
+    """
+    Sends the FHE evaluation keys to the server, unless it already holds them.
+
+    This function first asks the server to bind the keys with the digest of the
+    cached evaluation keys to this client. Only if the server does not hold them
+    are the serialized evaluation keys read from the key cache and sent to the
+    server, in resumable parts with the binary transport (see
+    `upload_evaluation_keys_in_parts`), or in one hex-encoded JSON request.
+
+    :raises:
+        httpx.HTTPError: If a request fails.
+    """
+    response, _ = await post_json_to_server(
+        "/bind_evaluation_keys",
+        {},
+        {
+            "digest": client_keys.evaluation_keys_digest,
+            "client_id": CLIENT_ID,
+            "model": SERVER_MODEL,
+        },
+    )
+    if response.status_code != 404:
+        response.raise_for_status()
+        logger.info("Evaluation keys already on the server, upload skipped")
+        return
+
+    timings = {}
+    with timed(timings, "key_upload"):
+        serialized_evaluation_keys = await asyncio.to_thread(
+            client_keys.read_evaluation_keys
+        )
+        if BINARY_TRANSPORT:
+            await upload_evaluation_keys_in_parts(serialized_evaluation_keys, timings)
+        else:
+            response, _ = await post_json_to_server(
+                "/evaluation_keys",
+                timings,
+                {
+                    "keys": serialized_evaluation_keys.hex(),
+                    "client_id": CLIENT_ID,
+                    "model": SERVER_MODEL,
+                },
+            )
+            response.raise_for_status()
+    logger.info(
+        "Evaluation keys uploaded to the server: %s", format_server_timing(timings)
+    )
+
+
+async def run_server_job(encrypted_data, priority, timings):
+    """
+    Runs a prediction as a job of the server: submits the encrypted input to
+    the job queue, then long-polls the encrypted prediction.
+
+    A submission rejected with 429, the queue of the priority class being full,
+    is sent again after the Retry-After delay of the server, and the result is
+    polled, as long as the SERVER_READ_TIMEOUT deadline is not over.
+
+    :param encrypted_data: The serialized encrypted input.
+    :param priority: The priority class of the job, "realtime" or "batch".
+    :param timings: Dictionary to which the stage durations reported by the
+        server are added, prefixed by "server.".
+
+    :return:
+        bytes: The serialized encrypted prediction.
+
+    :raises:
+        httpx.HTTPError: If a request fails, the queue stays full or the job
+            does not finish until the deadline, or the job fails.
+    """
+    deadline = time.monotonic() + SERVER_TIMEOUT.read
+    while True:
+        response, body = await post_to_server(
+            "/jobs",
+            timings,
+            encrypted_data,
+            "application/octet-stream",
+            params={**SERVER_PARAMS, "priority": priority},
+        )
+        retry_after = float(response.headers.get("Retry-After", "1"))
+        if response.status_code != 429 or time.monotonic() + retry_after > deadline:
+            break
+        await asyncio.sleep(retry_after)
+    response.raise_for_status()
+    job_id = json.loads(body)["job_id"]
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise httpx.ReadTimeout(
+                f"Job {job_id} not finished within {SERVER_TIMEOUT.read} s"
+            )
+        response = await app.state.http_client.get(
+            f"/jobs/{job_id}/result",
+            params={"wait": min(JOB_POLL_WAIT, remaining)},
+        )
+        if response.status_code != 202:
+            break
+    response.raise_for_status()
+    timings.update(parse_server_timing(response.headers.get("Server-Timing")))
+    return response.content
+
+
+async def send_encrypted_data(encrypted_data, timings, priority="realtime"):
+    """
+    Sends encrypted data to the server for prediction.
+
+    :param encrypted_data: The serialized encrypted input.
+    :param timings: Dictionary to which the stage durations reported by the
+        server are added, prefixed by "server.".
+    :param priority: The priority class of the prediction with the job
+        transport, "realtime" or "batch".
+
+    :return:
+        bytes: The serialized encrypted prediction returned by the server.
+
+    :raises:
+        httpx.HTTPError: If the POST request fails.
+        RuntimeError: If the FHE model failed on the input, with the stream
+            transport.
+        ConnectionError: If the prediction session closed before answering.
+    """
+    if app.state.prediction_stream is not None:
+        return await app.state.prediction_stream.predict(encrypted_data)
+    if JOB_TRANSPORT:
+        return await run_server_job(encrypted_data, priority, timings)
+
+    if BINARY_TRANSPORT:
+        response, body = await post_to_server(
+            "/predict_binary",
+            timings,
+            encrypted_data,
+            "application/octet-stream",
+            params=SERVER_PARAMS,
+        )
+        response.raise_for_status()
+        timings.update(parse_server_timing(response.headers.get("Server-Timing")))
+        return body
+
+    response, body = await post_json_to_server(
+        "/predict",
+        timings,
+        {
+            "data": encrypted_data.hex(),
+            "client_id": CLIENT_ID,
+            "model": SERVER_MODEL,
+        },
+    )
+    response.raise_for_status()
+    timings.update(parse_server_timing(response.headers.get("Server-Timing")))
+    return bytes.fromhex(json.loads(body)["prediction"])
+
+
+async def send_encrypted_batch(encrypted_inputs, timings):
+    """
+    Sends several encrypted inputs to the server for prediction in a single request,
+    or concurrently with the stream transport (pipelined on the prediction
+    session) and the job transport (as jobs of the "batch" priority class).
+
+    :param encrypted_inputs: The serialized encrypted inputs.
+    :param timings: Dictionary to which the stage durations reported by the
+        server are added, prefixed by "server.".
+
+    :return:
+        list: One `(encrypted_prediction, error)` pair per input, in order, where
+        `encrypted_prediction` is the serialized encrypted prediction (bytes) or None
+        if the server reported an error for this input.
 
+    :raises:
+        httpx.HTTPError: If the POST request fails.
+    """
+    if app.state.prediction_stream is not None or JOB_TRANSPORT:
+        results = await asyncio.gather(
+            *[
+                send_encrypted_data(encrypted_data, {}, priority="batch")
+                for encrypted_data in encrypted_inputs
+            ],
+            return_exceptions=True,
+        )
+        return [
+            (None, str(result)) if isinstance(result, Exception) else (result, None)
+            for result in results
+        ]
 
-def send_evaluation_keys():
+    response, body = await post_json_to_server(
+        "/predict_batch",
+        timings,
+        {
+            "data": [encrypted_data.hex() for encrypted_data in encrypted_inputs],
+            "client_id": CLIENT_ID,
+            "model": SERVER_MODEL,
+        },
+    )
+    response.raise_for_status()
+    timings.update(parse_server_timing(response.headers.get("Server-Timing")))
+    return [
+        (
+            (bytes.fromhex(result["prediction"]), None)
+            if "prediction" in result
+            else (None, result["error"])
+        )
+        for result in json.loads(body)["predictions"]
+    ]
+
+
+async def send_plaintext_data(input_data_scaled, mode, timings):
     """
-    Sends the FHE evaluation keys to the server.
+    Sends scaled plaintext inputs to the server for prediction in the clear or
+    simulate execution mode.
 
-    This function retrieves the serialized evaluation keys from the FHE client
-    and sends them to the server via an HTTP POST request.
+    :param input_data_scaled: The scaled inputs, one row per sample.
+    :param mode: "clear" or "simulate".
+    :param timings: Dictionary to which the stage durations reported by the
+        server are added, prefixed by "server.".
+
+    :return:
+        numpy.ndarray: The probability of each class, one row per sample.
 
     :raises:
-        requests.exceptions.RequestException: If the POST request fails.
+        HTTPException: With the status code and detail of the server, if it
+            rejects the request, e.g. 503 if it cannot run the mode.
+        httpx.HTTPError: If the POST request fails.
+    """
+    response, body = await post_json_to_server(
+        "/predict_plaintext",
+        timings,
+        {"data": input_data_scaled.tolist(), "mode": mode, "model": SERVER_MODEL},
+    )
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as error:
+        try:
+            detail = json.loads(body)["detail"]
+        except (ValueError, KeyError, TypeError):
+            detail = body.decode("utf-8", "replace")
+        raise HTTPException(status_code=response.status_code, detail=detail) from error
+    timings.update(parse_server_timing(response.headers.get("Server-Timing")))
+    return np.array(json.loads(body)["predictions"])
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Measures the duration of a block of code, and records it in the stage
+    histogram.
+
+    :param timings: Dictionary in which the duration is stored, in seconds.
+    :param stage: Key under which the duration is stored, and label of the
+        histogram.
+    """
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+    STAGE_SECONDS.labels(stage).observe(timings[stage])
+
+
+def parse_server_timing(header):
     """
-    requests.post(
-        "http://127.0.0.1:8000/evaluation_keys",
-        json={"keys": serialized_evaluation_keys.hex()},
-        timeout=500,
+    Parses the Server-Timing header of a response of the server.
+
+    :param header: The header value, e.g. "keys;dur=0.050, run;dur=3502.120", or
+        None if the server did not send one.
+
+    :return:
+        dict: The stage durations in seconds, the stage names prefixed by "server.".
+    """
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name and duration:
+            timings[f"server.{name}"] = float(duration) / 1000
+    return timings
+
+
+def format_server_timing(timings):
+    """
+    Formats stage durations as the value of a Server-Timing header.
+
+    :param timings: Dictionary of stage durations, in seconds.
+
+    :return:
+        str: The header value, e.g. "scale;dur=0.120, encrypt;dur=35.002"
+        (durations in milliseconds).
+    """
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items()
     )
 
 
+async def add_request_id(request):
+    """
+    Adds the id of the request being processed to a request sent to the server.
+
+    :param request: The httpx request about to be sent.
+    """
+    request_id = request_id_var.get()
+    if request_id is not None:
+        request.headers[REQUEST_ID_HEADER] = request_id
+
+
 @app.on_event("startup")
 async def startup_event():
     """
-    Event triggered on application startup to send evaluation keys to the server.
+    Event triggered on application startup to start the crypto worker pool, open
+    the connection pool to the server and send evaluation keys to the server if
+    it does not already hold them. With the stream transport, the prediction
+    session is opened by the first prediction.
 
     This ensures the server has the necessary keys for encrypted predictions
-    before handling any requests.
+    before handling any requests. The worker pool is created here rather than at
+    import time so that the spawned workers, which re-import their entry module,
+    do not start pools of their own.
+    """
+    app.state.crypto_pool = CryptoWorkerPool(
+        fhe_directory, client_keys.keys_path, workers=CRYPTO_WORKERS
+    )
+    app.state.http_client = httpx.AsyncClient(
+        base_url=SERVER_URL,
+        limits=SERVER_LIMITS,
+        timeout=SERVER_TIMEOUT,
+        event_hooks={"request": [add_request_id]},
+    )
+    await send_evaluation_keys()
+    if STREAM_TRANSPORT:
+        app.state.prediction_stream = PredictionStream(
+            STREAM_URL, SERVER_TIMEOUT.connect, SERVER_TIMEOUT.read
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Event triggered on application shutdown to close the prediction session and
+    the connection pool to the server, and stop the crypto worker pool.
     """
-    send_evaluation_keys()
+    if app.state.prediction_stream is not None:
+        await app.state.prediction_stream.aclose()
+    await app.state.http_client.aclose()
+    app.state.crypto_pool.shutdown()
+
+
+# Give each request a request id, count the requests in flight, and log the stage
+# durations of the predictions with the request id
+app.middleware("http")(request_id_middleware(logger, IN_FLIGHT))
 
 
 class PredictionRequest(BaseModel):
@@ -87,63 +695,251 @@ class PredictionRequest(BaseModel):
     online_order: int
 
 
+# Order of the features expected by the scaler and the model
+FEATURE_NAMES = list(PredictionRequest.model_fields)
+
+
+def to_input_matrix(prediction_requests):
+    """
+    Builds the input matrix of the model from prediction requests.
+
+    :param prediction_requests: The `PredictionRequest` objects, one per row.
+
+    :return:
+        numpy.ndarray: A matrix of shape (len(prediction_requests), len(FEATURE_NAMES)).
+    """
+    return np.array(
+        [
+            [getattr(request, name) for name in FEATURE_NAMES]
+            for request in prediction_requests
+        ],
+        dtype=np.float64,
+    )
+
+
+async def run_encrypted_prediction(input_data_scaled, timings):
+    """
+    Runs a prediction in FHE: encrypts the scaled input, sends it to the server
+    and decrypts the result.
+
+    :param input_data_scaled: The scaled input, as a matrix of one row.
+    :param timings: Dictionary to which the durations of the encrypt, transfer
+        and decrypt stages are added, with the stages reported by the server.
+
+    :return:
+        numpy.ndarray: The probability of each class, of shape (1, n_classes).
+    """
+    # Encrypt the data
+    with timed(timings, "encrypt"):
+        (encrypted_data,) = await app.state.crypto_pool.encrypt(input_data_scaled)
+
+    # Send encrypted data to the server for prediction
+    with timed(timings, "transfer"):
+        encrypted_prediction = await send_encrypted_data(encrypted_data, timings)
+
+    # Decrypt the result
+    with timed(timings, "decrypt"):
+        (prediction,) = await app.state.crypto_pool.decrypt([encrypted_prediction])
+    return prediction
+
+
+def lookup_cached_predictions(input_matrix):
+    """
+    Looks the rows of a batch up in the result cache.
+
+    :param input_matrix: The unscaled inputs, one row per prediction.
+
+    :return:
+        tuple: The predictions of the rows, `{"prediction": <int>}` for a cached
+        row and None for a row to compute, and the cache key of each row, or None
+        if the result cache is disabled.
+    """
+    predictions = [None] * len(input_matrix)
+    result_cache = app.state.result_cache
+    if result_cache is None:
+        return predictions, None
+    keys = [ResultCache.key(row, model_version) for row in input_matrix]
+    for index, key in enumerate(keys):
+        prediction_value = result_cache.get(key)
+        if prediction_value is not None:
+            predictions[index] = {"prediction": int(np.argmax(prediction_value[0]))}
+    return predictions, keys
+
+
+async def run_encrypted_batch(input_data_scaled, timings):
+    """
+    Runs the rows of a batch in FHE: encrypts each row, sends the ciphertexts to
+    the server and decrypts the successful results.
+
+    :param input_data_scaled: The scaled inputs, one row per prediction.
+    :param timings: Dictionary to which the durations of the encrypt, transfer
+        and decrypt stages are added, with the stages reported by the server.
+
+    :return:
+        list: One `(prediction, error)` tuple per row, in order: the probability
+        of each class, of shape (1, n_classes), and None, or None and the error
+        reported by the server.
+    """
+    # Encrypt each row across the crypto workers: the FHE circuit takes one
+    # sample per ciphertext
+    with timed(timings, "encrypt"):
+        encrypted_inputs = await app.state.crypto_pool.encrypt(input_data_scaled)
+
+    # Send all the encrypted rows to the server in a single round trip, or
+    # concurrently with the stream and job transports
+    with timed(timings, "transfer"):
+        results = await send_encrypted_batch(encrypted_inputs, timings)
+
+    # Decrypt the successful results at once
+    succeeded = [
+        encrypted_prediction for encrypted_prediction, error in results if error is None
+    ]
+    prediction_values = []
+    if succeeded:
+        with timed(timings, "decrypt"):
+            prediction_values = await app.state.crypto_pool.decrypt(succeeded)
+    decrypted = iter(prediction_values)
+    return [
+        (next(decrypted), None) if error is None else (None, error)
+        for _, error in results
+    ]
+
+
 @app.post("/predict")
-async def predict(request: PredictionRequest):
+async def predict(
+    request: PredictionRequest,
+    response: Response,
+    mode: ExecutionMode = PREDICTION_MODE,
+):
     """
     Endpoint to handle prediction requests.
 
     This endpoint accepts input data, processes it, and uses an FHE-based system
     to make secure predictions. The process involves scaling the data, encrypting it,
-    sending it to a server for computation, and decrypting the result.
+    sending it to a server for computation, and decrypting the result. In the clear
+    and simulate modes, the scaled data is sent to the server without encryption.
 
     :param request: Input data for prediction, wrapped in a `PredictionRequest` object.
+    :param response: The response, to which the Server-Timing header is added.
+    :param mode: The execution mode, "clear", "simulate" or "execute".
 
     :return:
         dict: A dictionary containing the binary prediction result, in the format:
             {
-                "prediction": <int>
+                "prediction": <int>,
+                "mode": <str>
             }
         where the prediction is 0 or 1 (binary classification).
     """
-    # Retrieve user-input data
-    input_data = np.array(
-        [
-            request.distance_from_home,
-            request.distance_from_last_transaction,
-            request.ratio_to_median_purchase_price,
-            request.repeat_retailer,
-            request.used_chip,
-            request.used_pin_number,
-            request.online_order,
-        ]
-    ).reshape(1, -1)
-
-    # Apply the scaler
-    input_data_scaled = scaler.transform(input_data)
-
-    # Encrypt the data
-    encrypted_data = client.quantize_encrypt_serialize(input_data_scaled)
-
-    # Send encrypted data to the server for prediction
-    response = requests.post(
-        "http://127.0.0.1:8000/predict",
-        json={"data": encrypted_data.hex()},
-        timeout=500,
-    )
-    encrypted_prediction = bytes.fromhex(response.json()["prediction"])
+    start = time.perf_counter()
+    timings = {}
+
+    # Retrieve user-input data and apply the scaler
+    with timed(timings, "scale"):
+        input_matrix = to_input_matrix([request])
+        input_data_scaled = scaler.transform(input_matrix)
+
+    if mode == "execute" and app.state.result_cache is not None:
+        # Answer a repeated input from the cache, without encrypting it again
+        prediction = await app.state.result_cache.get_or_run(
+            ResultCache.key(input_matrix[0], model_version),
+            lambda: run_encrypted_prediction(input_data_scaled, timings),
+        )
+    elif mode == "execute":
+        prediction = await run_encrypted_prediction(input_data_scaled, timings)
+    else:
+        with timed(timings, "transfer"):
+            prediction = await send_plaintext_data(input_data_scaled, mode, timings)
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    PREDICTION_SECONDS.labels(mode).observe(time.perf_counter() - start)
+
+    # The prediction holds the probability of each class: choose the highest one
+    binary_prediction = int(np.argmax(prediction[0]))
+
+    return {"prediction": binary_prediction, "mode": mode}
+
+
+@app.post("/predict_batch")
+async def predict_batch(
+    prediction_requests: List[PredictionRequest],
+    response: Response,
+    mode: ExecutionMode = PREDICTION_MODE,
+):
+    """
+    Endpoint to handle a list of prediction requests at once.
 
-    # Decrypt the result
-    prediction = client.deserialize_decrypt_dequantize(encrypted_prediction)
+    The rows are scaled in a single vectorized call, each row is encrypted, all
+    the ciphertexts are sent to the server in one request, and the results are
+    decrypted and turned into binary predictions together. In the clear and
+    simulate modes, the scaled rows are sent to the server without encryption.
 
-    # Extract the scalar value
-    prediction_value = prediction[0]
-    print(f"Type of prediction_value: {type(prediction_value)}")
-    print(f"Value of prediction_value: {prediction_value}")
+    :param prediction_requests: Input data for prediction, one `PredictionRequest`
+        object per row.
+    :param response: The response, to which the Server-Timing header is added.
+    :param mode: The execution mode, "clear", "simulate" or "execute".
 
-    # If the array contains two elements, choose the highest value
-    binary_prediction = int(np.argmax(prediction_value))
+    :return:
+        dict: A dictionary containing one result per row, in order, in the format:
+            {
+                "predictions": [{"prediction": <int>} or {"error": <str>}, ...],
+                "mode": <str>
+            }
+        where an error is reported for a row the server failed to compute.
+    """
+    if not prediction_requests:
+        return {"predictions": [], "mode": mode}
+
+    start = time.perf_counter()
+    timings = {}
+
+    # Scale all the rows at once
+    with timed(timings, "scale"):
+        input_matrix = to_input_matrix(prediction_requests)
+        input_data_scaled = scaler.transform(input_matrix)
+
+    if mode != "execute":
+        with timed(timings, "transfer"):
+            prediction_values = await send_plaintext_data(
+                input_data_scaled, mode, timings
+            )
+        response.headers["Server-Timing"] = format_server_timing(timings)
+        PREDICTION_SECONDS.labels(mode).observe(time.perf_counter() - start)
+        return {
+            "predictions": [
+                {"prediction": int(binary_prediction)}
+                for binary_prediction in np.argmax(prediction_values, axis=1)
+            ],
+            "mode": mode,
+        }
+
+    # Answer the rows already in the result cache, and compute the others only
+    predictions, keys = lookup_cached_predictions(input_matrix)
+    rows = [index for index, prediction in enumerate(predictions) if prediction is None]
+    if rows:
+        results = await run_encrypted_batch(input_data_scaled[rows], timings)
+        for row, (prediction_value, error) in zip(rows, results):
+            if error is not None:
+                predictions[row] = {"error": error}
+                continue
+            predictions[row] = {"prediction": int(np.argmax(prediction_value[0]))}
+            if keys is not None:
+                app.state.result_cache.put(keys[row], prediction_value)
+
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    PREDICTION_SECONDS.labels(mode).observe(time.perf_counter() - start)
+    return {"predictions": predictions, "mode": mode}
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Endpoint exposing the Prometheus metrics of the client.
 
-    return {"prediction": binary_prediction}
+    :return:
+        Response: The metrics in the Prometheus text format: the stage duration
+        histograms and the number of requests in flight.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+"""
+Worker pool running the client-side FHE encryption and decryption.
+
+``FHEModelClient.quantize_encrypt_serialize`` and ``deserialize_decrypt_dequantize`` are
+CPU-heavy. Running them inline in the request handlers of the client limits the whole gateway
+to one core, so this module runs them in a pool of worker processes. Each worker loads the FHE
+client and its keys once, from the key file where the parent process saved them (see
+`src.client.key_cache`).
+
+Classes:
+    - CryptoWorkerPool: Process pool encrypting inputs and decrypting predictions.
+"""
+
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+from concrete.ml.deployment import FHEModelClient
+
+from src.library.process_pool import spawn_executor
+
+# FHE client loaded once in each worker process by `_init_worker`
+_CLIENT = None
+
+
+def _init_worker(path_dir, keys_path):
+    """
+    Load the FHE client and its keys in a freshly started worker process.
+
+    Args:
+        path_dir (str): Directory containing the FHE deployment files (client.zip).
+        keys_path (str): File holding the keys saved by the parent process.
+    """
+    global _CLIENT  # pylint: disable=global-statement
+    _CLIENT = FHEModelClient(path_dir=path_dir)
+    _CLIENT.client.keys.load(keys_path)
+
+
+def _encrypt(input_rows):
+    """
+    Quantize, encrypt and serialize input rows, inside a worker process.
+
+    Args:
+        input_rows (numpy.ndarray): The scaled inputs, one sample per row.
+
+    Returns:
+        list of bytes: One serialized encrypted input per row.
+    """
+    return [
+        _CLIENT.quantize_encrypt_serialize(row.reshape(1, -1)) for row in input_rows
+    ]
+
+
+def _decrypt(encrypted_outputs):
+    """
+    Deserialize, decrypt and dequantize encrypted predictions, inside a worker process.
+
+    Args:
+        encrypted_outputs (list of bytes): The serialized encrypted predictions.
+
+    Returns:
+        list of numpy.ndarray: One decrypted prediction of shape (1, n_classes) per input.
+    """
+    return [
+        _CLIENT.deserialize_decrypt_dequantize(encrypted_output)
+        for encrypted_output in encrypted_outputs
+    ]
+
+
+class CryptoWorkerPool:
+    """
+    Pool of worker processes encrypting inputs and decrypting predictions.
+
+    If a worker dies, the tasks it was running fail and the workers are restarted for the
+    following tasks.
+
+    Attributes:
+        workers (int): Number of worker processes.
+    """
+
+    def __init__(self, path_dir, keys_path, workers=None):
+        """
+        Start the worker pool.
+
+        The keys must already be saved in `keys_path` (e.g. by
+        `src.client.key_cache.load_client_keys`), so that all the workers share them.
+
+        Args:
+            path_dir (str): Directory containing the FHE deployment files.
+            keys_path (str): File holding the keys of the client.
+            workers (int, optional): Number of worker processes. Defaults to the number of
+                CPUs of the machine.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self._initargs = (path_dir, keys_path)
+        self._executor = self._start_executor()
+
+    def _start_executor(self):
+        return spawn_executor(self.workers, _init_worker, self._initargs)
+
+    async def _map(self, function, items):
+        """
+        Apply a worker function to items, split into one chunk per worker.
+
+        Args:
+            function (Callable): Worker function taking a chunk of items and returning one
+                result per item.
+            items (Sequence): The items to process.
+
+        Returns:
+            list: One result per item, in order.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        chunk_size = -(-len(items) // self.workers)
+        chunks = []
+        for start in range(0, len(items), chunk_size):
+            end = start + chunk_size
+            chunks.append(items[start:end])
+        try:
+            chunk_results = await asyncio.gather(
+                *(loop.run_in_executor(executor, function, chunk) for chunk in chunks)
+            )
+        except BrokenProcessPool:
+            # Replace the broken executor, unless another task already did
+            if self._executor is executor:
+                self._executor = self._start_executor()
+                executor.shutdown(wait=False)
+            raise
+        return [result for chunk_result in chunk_results for result in chunk_result]
+
+    async def encrypt(self, input_rows):
+        """
+        Quantize, encrypt and serialize input rows in the worker processes.
+
+        Args:
+            input_rows (numpy.ndarray): The scaled inputs, one sample per row.
+
+        Returns:
+            list of bytes: One serialized encrypted input per row.
+        """
+        return await self._map(_encrypt, input_rows)
+
+    async def decrypt(self, encrypted_outputs):
+        """
+        Deserialize, decrypt and dequantize encrypted predictions in the worker processes.
+
+        Args:
+            encrypted_outputs (list of bytes): The serialized encrypted predictions.
+
+        Returns:
+            list of numpy.ndarray: One decrypted prediction of shape (1, n_classes) per input.
+        """
+        return await self._map(_decrypt, encrypted_outputs)
+
+    def shutdown(self):
+        """
+        Wait for the pending tasks and stop the worker processes.
+        """
+        self._executor.shutdown(wait=True)
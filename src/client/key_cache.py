@@ -0,0 +1,127 @@
+"""
+Persistent cache of the FHE keys of the client.
+
+Generating the keys of the client and serializing its evaluation keys is slow, and so is
+uploading the evaluation keys to the server. This module saves the generated keys together with
+the serialized evaluation keys and their SHA-256 digest, in a directory named after a
+fingerprint of the client specs (the hash of client.zip). A restart with the same FHE model
+reloads them instead of generating new ones, and the digest lets the client ask the server
+whether it already holds these evaluation keys before uploading them.
+
+The cached keys include the private keys of the client: the cache directory is created readable
+by its owner only.
+
+Classes:
+    - ClientKeys: The FHE client with its keys, and the location of its cached evaluation keys.
+
+Functions:
+    - fingerprint_client_specs: Computes the fingerprint of the client specs.
+    - load_client_keys: Loads the keys of the client from the cache, generating them on a miss.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from concrete.ml.deployment import FHEModelClient
+
+KEYS_FILE = "keys"
+EVALUATION_KEYS_FILE = "serialized_evaluation_keys.ekl"
+DIGEST_FILE = "serialized_evaluation_keys.sha256"
+
+
+@dataclass
+class ClientKeys:
+    """
+    The FHE client with its keys, and the location of its cached evaluation keys.
+
+    Attributes:
+        client (FHEModelClient): The FHE client, with its keys loaded.
+        keys_path (str): File holding all the keys of the client, private keys included.
+        evaluation_keys_path (str): File holding the serialized evaluation keys.
+        evaluation_keys_digest (str): SHA-256 hex digest of the serialized evaluation keys.
+        from_cache (bool): Whether the keys were loaded from the cache rather than generated.
+    """
+
+    client: FHEModelClient
+    keys_path: str
+    evaluation_keys_path: str
+    evaluation_keys_digest: str
+    from_cache: bool
+
+    def read_evaluation_keys(self):
+        """
+        Read the serialized evaluation keys from the cache.
+
+        Returns:
+            bytes: The serialized evaluation keys.
+        """
+        with open(self.evaluation_keys_path, "rb") as file_handler:
+            return file_handler.read()
+
+
+def fingerprint_client_specs(path_dir):
+    """
+    Compute the fingerprint of the client specs of an FHE model.
+
+    Args:
+        path_dir (str): Directory containing the FHE deployment files (client.zip).
+
+    Returns:
+        str: The SHA-256 hex digest of client.zip.
+    """
+    sha256 = hashlib.sha256()
+    with open(os.path.join(path_dir, "client.zip"), "rb") as file_handler:
+        for block in iter(lambda: file_handler.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _write_file(path, content):
+    """
+    Write a file through a temporary name, so that an interrupted write never leaves a
+    truncated file behind.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file_handler:
+        file_handler.write(content)
+    os.replace(tmp_path, path)
+
+
+def load_client_keys(path_dir, cache_dir):
+    """
+    Load the FHE client with its keys from the cache, generating and caching them on a miss.
+
+    Args:
+        path_dir (str): Directory containing the FHE deployment files (client.zip).
+        cache_dir (str): Root directory of the key cache, holding one sub-directory per client
+            specs fingerprint.
+
+    Returns:
+        ClientKeys: The FHE client with its keys.
+    """
+    key_dir = os.path.join(cache_dir, fingerprint_client_specs(path_dir))
+    keys_path = os.path.join(key_dir, KEYS_FILE)
+    evaluation_keys_path = os.path.join(key_dir, EVALUATION_KEYS_FILE)
+    digest_path = os.path.join(key_dir, DIGEST_FILE)
+
+    client = FHEModelClient(path_dir=path_dir)
+
+    # The digest file is written last: its presence means the entry is complete
+    if os.path.exists(digest_path):
+        client.client.keys.load(keys_path)
+        with open(digest_path, "r", encoding="utf-8") as file_handler:
+            digest = file_handler.read().strip()
+        return ClientKeys(client, keys_path, evaluation_keys_path, digest, True)
+
+    os.makedirs(key_dir, mode=0o700, exist_ok=True)
+    serialized_evaluation_keys = client.get_serialized_evaluation_keys()
+    digest = hashlib.sha256(serialized_evaluation_keys).hexdigest()
+
+    tmp_keys_path = f"{keys_path}.tmp"
+    client.client.keys.serialize_to_file(Path(tmp_keys_path))
+    os.replace(tmp_keys_path, keys_path)
+    _write_file(evaluation_keys_path, serialized_evaluation_keys)
+    _write_file(digest_path, digest.encode("utf-8"))
+    return ClientKeys(client, keys_path, evaluation_keys_path, digest, False)
@@ -0,0 +1,48 @@
+"""
+Prometheus metrics of the client, exposed by its /metrics endpoint.
+
+Stage durations are recorded in a histogram labelled by stage (scale, encrypt, transfer,
+decrypt, key_upload, compress, decompress), fed by the `timed` blocks of the client. The server
+side of the transfer stage is broken down by the metrics of the server. The compression of the
+request and response bodies is measured by its ratio and CPU time, by codec. The lookups of the
+result cache are counted by outcome (see `src.client.result_cache`).
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_SECONDS = Histogram(
+    "fhe_client_stage_seconds",
+    "Duration of the stages of the predictions of the client.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+PREDICTION_SECONDS = Histogram(
+    "fhe_client_prediction_seconds",
+    "Duration of the prediction requests of the client, by execution mode.",
+    ["mode"],
+    buckets=(0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+COMPRESSION_RATIO = Histogram(
+    "fhe_client_compression_ratio",
+    "Uncompressed over compressed size of the bodies compressed (request) and decompressed "
+    "(response) by the client.",
+    ["codec", "direction"],
+    buckets=(1, 1.1, 1.25, 1.5, 2, 2.5, 3, 4, 8),
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    "fhe_client_compression_cpu_seconds",
+    "CPU time spent compressing request bodies and decompressing response bodies.",
+    ["codec", "direction"],
+)
+IN_FLIGHT = Gauge(
+    "fhe_client_requests_in_flight",
+    "Prediction requests being processed by the client.",
+)
+RESULT_CACHE_LOOKUPS = Counter(
+    "fhe_client_result_cache_lookups",
+    "Lookups of the result cache, by outcome (hit, coalesced or miss).",
+    ["result"],
+)
+RESULT_CACHE_ENTRIES = Gauge(
+    "fhe_client_result_cache_entries", "Prediction results held in the result cache."
+)
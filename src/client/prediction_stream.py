@@ -0,0 +1,186 @@
+"""
+Persistent prediction session of the client with the server, over a WebSocket.
+
+Rather than one HTTP request per encrypted prediction, the client can keep one session open on
+the /predict_stream endpoint of the server (see `src.library.stream_protocol`), bound to its
+evaluation keys, and multiplex all its predictions on it: each ciphertext is sent as soon as it
+is encrypted, tagged with a request id, and the prediction waiting for it is resumed when the
+result with the same id comes back, in whatever order the server completes them.
+
+The session is opened on the first prediction and reopened after it closes, e.g. when the server
+restarts or replaces its model. The predictions left unanswered by a closed session are sent
+again once on a new session. The client keeps at most the number of predictions in flight
+announced by the server when the session starts, so that a burst of predictions waits on the
+client rather than stalling the session.
+
+Classes:
+    - PredictionStream: The prediction session of the client, reopened on demand.
+"""
+
+import asyncio
+import itertools
+import json
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from src.library.stream_protocol import pack_frame, unpack_frame
+
+
+class PredictionStream:  # pylint: disable=too-many-instance-attributes
+    """
+    The prediction session of the client with the server, opened on demand.
+
+    Attributes:
+        url (str): The URL of the streaming endpoint, with its query string.
+        open_timeout (float): Timeout of the opening of a session, in seconds.
+        timeout (float): Timeout of a prediction once sent, in seconds.
+        max_in_flight (int): Maximum number of predictions in flight, as announced by the
+            server.
+        model (str): The name of the model of the session, as announced by the server.
+        model_version (str): The version of the model of the session.
+    """
+
+    def __init__(self, url, open_timeout, timeout):
+        """
+        Create the session, without opening it.
+
+        Args:
+            url (str): The URL of the streaming endpoint, e.g.
+                "ws://127.0.0.1:8000/predict_stream?client_id=alice".
+            open_timeout (float): Timeout of the opening of a session, in seconds.
+            timeout (float): Timeout of a prediction once sent, in seconds.
+        """
+        self.url = url
+        self.open_timeout = open_timeout
+        self.timeout = timeout
+        self.max_in_flight = 1
+        self.model = None
+        self.model_version = None
+        self._connection = None
+        self._opening = asyncio.Lock()
+        self._reader = None
+        self._request_ids = itertools.count()
+        # request id -> future of its result, for the predictions in flight
+        self._pending = {}
+        self._window = asyncio.Condition()
+
+    async def _open(self):
+        """
+        Return the open WebSocket of the session, opening a new one if needed.
+
+        Returns:
+            ClientConnection: The WebSocket.
+
+        Raises:
+            OSError: If the server cannot be reached.
+            websockets.exceptions.ConnectionClosed: If the server refuses the session, e.g. with
+                code 4404 if it holds no evaluation keys for the client.
+        """
+        async with self._opening:
+            if self._connection is None:
+                # Ciphertexts do not compress: skip per-message deflate
+                connection = await connect(
+                    self.url,
+                    open_timeout=self.open_timeout,
+                    compression=None,
+                    max_size=None,
+                )
+                session = json.loads(await connection.recv())
+                self.model = session["model"]
+                self.model_version = session["model_version"]
+                self.max_in_flight = session["max_in_flight"]
+                self._connection = connection
+                self._reader = asyncio.create_task(self._read(connection))
+                async with self._window:
+                    self._window.notify_all()
+            return self._connection
+
+    async def _read(self, connection):
+        """
+        Resume the predictions waiting for the results received on a WebSocket, and fail
+        those left unanswered when it closes.
+
+        Args:
+            connection (ClientConnection): The WebSocket of the session.
+        """
+        try:
+            async for message in connection:
+                if isinstance(message, bytes):
+                    request_id, result = unpack_frame(message)
+                    future = self._pending.get(request_id)
+                    if future is not None and not future.done():
+                        future.set_result(result)
+                else:
+                    error = json.loads(message)
+                    future = self._pending.get(error["id"])
+                    if future is not None and not future.done():
+                        future.set_exception(RuntimeError(error["error"]))
+        except ConnectionClosed:
+            pass
+        finally:
+            if self._connection is connection:
+                self._connection = None
+            closed = ConnectionError(
+                f"Prediction stream closed ({connection.close_code}): "
+                f"{connection.close_reason}"
+            )
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(closed)
+
+    async def predict(self, encrypted_data):
+        """
+        Run the model of the server on one encrypted input, pipelined with the other
+        predictions of the session.
+
+        Args:
+            encrypted_data (bytes): The serialized encrypted input.
+
+        Returns:
+            bytes: The serialized encrypted prediction.
+
+        Raises:
+            RuntimeError: If the FHE model failed on the input.
+            ConnectionError: If the session closed before answering, twice.
+            TimeoutError: If the server did not answer within `timeout` seconds.
+            OSError: If the server cannot be reached.
+        """
+        try:
+            return await self._predict_once(encrypted_data)
+        except (ConnectionError, ConnectionClosed):
+            # The session closed before answering: send the input again on a new one
+            return await self._predict_once(encrypted_data)
+
+    async def _predict_once(self, encrypted_data):
+        """
+        Send one encrypted input on the session, within its window, and wait for its result.
+        """
+        connection = await self._open()
+        async with self._window:
+            await self._window.wait_for(lambda: len(self._pending) < self.max_in_flight)
+            if self._connection is not connection:
+                raise ConnectionError("Prediction stream closed")
+            request_id = next(self._request_ids)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+        try:
+            await connection.send(pack_frame(request_id, encrypted_data))
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError as error:
+            raise TimeoutError(
+                f"No prediction from the server within {self.timeout} s"
+            ) from error
+        finally:
+            del self._pending[request_id]
+            async with self._window:
+                self._window.notify()
+
+    async def aclose(self):
+        """
+        Close the session, if open.
+        """
+        connection = self._connection
+        if connection is not None:
+            await connection.close()
+            await self._reader
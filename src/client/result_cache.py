@@ -0,0 +1,163 @@
+"""
+Cache of the encrypted predictions of the client, keyed by their plaintext inputs.
+
+FHE ciphertexts are randomized: two encryptions of the same transaction differ, so the server
+cannot recognize a repeated input. The client sees the plaintext features before encrypting them
+and can: retried requests and duplicate authorization messages are answered from this cache,
+without an encrypt, run and decrypt cycle. Identical inputs arriving while the first one is
+being computed wait for its result rather than computing it again.
+
+Entries are keyed by a digest of the normalized feature vector and of the model version, so that
+the cache holds no transaction data and a new model version never serves the results of the
+previous one. At most `max_entries` results are kept, the least recently used ones being evicted
+first, each for at most `ttl` seconds. Failed predictions are not cached.
+
+Lookups are counted by outcome in the metrics of the client: "hit" (answered from the cache),
+"coalesced" (answered by an identical prediction in flight) or "miss".
+
+Classes:
+    - ResultCache: LRU cache of prediction results with a time to live.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.client.metrics import RESULT_CACHE_ENTRIES, RESULT_CACHE_LOOKUPS
+
+
+class ResultCache:
+    """
+    LRU cache of prediction results with a time to live, keyed by input and model version.
+
+    The cache must be used from the event loop of the client.
+
+    Attributes:
+        max_entries (int): Maximum number of results kept.
+        ttl (float): Time in seconds a result is kept.
+    """
+
+    def __init__(self, max_entries, ttl):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries (int): Maximum number of results kept.
+            ttl (float): Time in seconds a result is kept.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (result, expiry time), from least to most recently used
+        self._entries = OrderedDict()
+        # key -> task computing the result
+        self._in_flight = {}
+
+    @staticmethod
+    def key(features, model_version):
+        """
+        Return the cache key of an input.
+
+        The features are normalized to 64-bit floats, so that e.g. 1 and 1.0, or 0.0 and -0.0,
+        have the same key.
+
+        Args:
+            features (Sequence[float]): The plaintext feature vector, in the order of the model.
+            model_version (str): The version of the model computing the result.
+
+        Returns:
+            bytes: The key, a digest of the features and the model version.
+        """
+        normalized = np.asarray(features, dtype=np.float64) + 0.0
+        digest = hashlib.blake2b(str(model_version).encode("utf-8"), digest_size=16)
+        digest.update(normalized.tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Return the cached result of an input, recording the lookup.
+
+        Args:
+            key (bytes): The key of the input, see `key`.
+
+        Returns:
+            The result, or None if it is not cached or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        RESULT_CACHE_LOOKUPS.labels("miss" if entry is None else "hit").inc()
+        RESULT_CACHE_ENTRIES.set(len(self._entries))
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, result):
+        """
+        Cache the result of an input, evicting the least recently used results beyond
+        `max_entries`.
+
+        Args:
+            key (bytes): The key of the input, see `key`.
+            result: The result, not None.
+        """
+        self._entries[key] = (result, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        RESULT_CACHE_ENTRIES.set(len(self._entries))
+
+    async def get_or_run(self, key, run):
+        """
+        Return the cached result of an input, or wait for the identical input in flight, or
+        compute and cache the result.
+
+        The result is computed in a task of the cache, so that a caller cancelled while waiting
+        for it, e.g. when its HTTP client disconnects, does not cancel it for the identical
+        inputs waiting for the same result.
+
+        Args:
+            key (bytes): The key of the input, see `key`.
+            run (Callable): Coroutine function computing the result, called without arguments.
+
+        Returns:
+            The result.
+
+        Raises:
+            Exception: Whatever `run` raises, also for the identical inputs waiting for it.
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            RESULT_CACHE_LOOKUPS.labels("coalesced").inc()
+        else:
+            result = self.get(key)
+            if result is not None:
+                return result
+            task = asyncio.create_task(self._run(key, run))
+            task.add_done_callback(_retrieve_exception)
+            self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, key, run):
+        """
+        Compute the result of an input and cache it, see `get_or_run`.
+        """
+        try:
+            result = await run()
+        finally:
+            del self._in_flight[key]
+        self.put(key, result)
+        return result
+
+
+def _retrieve_exception(task):
+    """
+    Mark the error of a computation as retrieved: only the callers waiting for it, if any,
+    report it.
+    """
+    if not task.cancelled():
+        task.exception()
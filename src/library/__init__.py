@@ -10,6 +10,9 @@ def load_and_preprocess_data(data_path):
     """
     Load and preprocess the data from the given path.
 
+    The processed data is cached, keyed by the content of the file: the data is only
+    preprocessed again when the file or the preprocessing changes.
+
     Args:
         data_path (str): Path to the data file.
 
@@ -17,10 +20,7 @@ def load_and_preprocess_data(data_path):
         tuple: A tuple containing the preprocessed training,
                validation, and test sets
                for features (X_train, X_val, X_test) and targets
-               (y_train, y_val, y_test).
+               (y_train, y_val, y_test), as memory-mapped arrays.
     """
-    data = data_preprocessing.load_data(data_path)
-    x_train, x_val, x_test, y_train, y_val, y_test = data_preprocessing.preprocess_data(
-        data
-    )
-    return x_train, x_val, x_test, y_train, y_val, y_test
+    processed_data = data_preprocessing.prepare_processed_data(data_path)
+    return tuple(processed_data.values())
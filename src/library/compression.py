@@ -0,0 +1,198 @@
+"""
+Compression codecs of the bodies exchanged by the client and the server.
+
+The codecs are named after the HTTP content codings of their format: "zstd" (Zstandard), "lz4"
+(LZ4 frames) and "gzip". Zstandard and LZ4 are fast enough to compress ciphertexts and
+evaluation keys in line with the requests, and are used when the zstandard and lz4 packages
+are installed; gzip, from the standard library, is always available as a fallback.
+
+A list of codecs is configured as comma-separated names in order of preference, each with an
+optional level, e.g. "zstd:3,lz4,gzip:1" (see `parse_codecs`). Without a level, a codec uses
+its default one. The sender compresses a body with a codec the receiver accepts, as negotiated
+from an Accept-Encoding header (see `negotiate`), and both sides measure the CPU time spent.
+
+The module only depends on the standard library and the optional codec packages, so that both
+the client and the server can import it.
+
+Functions:
+    - available_codecs: Lists the codecs that can be used.
+    - parse_codecs: Parses a configured list of codecs and levels.
+    - negotiate: Chooses the codec of a body from an Accept-Encoding header.
+    - compress: Compresses a body.
+    - decompress: Decompresses a body, within a maximum size.
+"""
+
+import gzip
+import io
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+IDENTITY = "identity"
+# Default level of each codec: the default of the library for the fast codecs, the fastest
+# one for gzip, which is only a fallback
+DEFAULT_LEVELS = {"zstd": 3, "lz4": 0, "gzip": 1}
+# Size of the chunks read when decompressing, to stop at the maximum size
+CHUNK_SIZE = 1 << 20
+# Errors raised by the codecs on invalid bodies
+DECOMPRESSION_ERRORS = (OSError, EOFError, RuntimeError, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+def available_codecs():
+    """
+    List the codecs whose package is installed.
+
+    Returns:
+        list: The names of the codecs, from the fastest to the slowest.
+    """
+    codecs = []
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4_frame is not None:
+        codecs.append("lz4")
+    codecs.append("gzip")
+    return codecs
+
+
+def parse_codecs(text):
+    """
+    Parse a configured list of codecs.
+
+    Args:
+        text (str): Comma-separated codec names in order of preference, each optionally
+            followed by ":" and a level, e.g. "zstd:3,lz4,gzip:1". An empty text disables
+            compression.
+
+    Returns:
+        dict: The level of each codec by name (None for the default level), in order of
+        preference.
+
+    Raises:
+        ValueError: If a codec is unknown or its package is not installed, or a level is not an
+            integer.
+    """
+    codecs = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.strip().partition(":")
+        if name not in available_codecs():
+            raise ValueError(
+                f"Unavailable compression codec '{name}', use one of {available_codecs()}"
+            )
+        codecs[name] = int(level) if level else None
+    return codecs
+
+
+def negotiate(accept_encoding, codecs):
+    """
+    Choose the codec of a body from the Accept-Encoding header of its receiver.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header, e.g. "zstd, gzip;q=0.5", None if
+            absent.
+        codecs (Iterable): The codecs of the sender, in order of preference.
+
+    Returns:
+        str: The accepted codec with the highest quality value, the first one in the order of
+        the sender on ties, or None if the receiver accepts none of them.
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+
+    best_codec, best_quality = None, 0.0
+    for codec in codecs:
+        quality = qualities.get(codec, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best_codec, best_quality = codec, quality
+    return best_codec
+
+
+def compress(data, codec, level=None):
+    """
+    Compress a body.
+
+    Args:
+        data (bytes): The body.
+        codec (str): The name of the codec.
+        level (int): The compression level, None for the default level of the codec.
+
+    Returns:
+        tuple: The compressed body (bytes) and the CPU time spent, in seconds, measured on the
+        calling thread.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    start = time.thread_time()
+    if codec == "zstd":
+        compressed = zstandard.ZstdCompressor(level=level).compress(data)
+    elif codec == "lz4":
+        compressed = lz4_frame.compress(data, compression_level=level)
+    else:
+        compressed = gzip.compress(data, compresslevel=level)
+    return compressed, time.thread_time() - start
+
+
+def decompress(data, codec, max_size=None):
+    """
+    Decompress a body, reading it in chunks so that a body expanding beyond `max_size` is
+    rejected before it fills the memory.
+
+    Args:
+        data (bytes): The compressed body.
+        codec (str): The name of the codec.
+        max_size (int): The maximum size of the decompressed body, in bytes, None for no
+            limit.
+
+    Returns:
+        tuple: The decompressed body (bytes) and the CPU time spent, in seconds, measured on
+        the calling thread.
+
+    Raises:
+        ValueError: If the codec is not available, the body is not valid for the codec or it
+            expands beyond `max_size`.
+    """
+    if codec not in available_codecs():
+        raise ValueError(f"Unavailable compression codec '{codec}'")
+    start = time.thread_time()
+    if codec == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(data)
+    elif codec == "lz4":
+        reader = lz4_frame.LZ4FrameFile(io.BytesIO(data))
+    else:
+        reader = gzip.GzipFile(fileobj=io.BytesIO(data))
+
+    chunks, size = [], 0
+    try:
+        with reader:
+            while chunk := reader.read(CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(
+                        f"Body expands beyond the maximum size of {max_size} bytes"
+                    )
+                chunks.append(chunk)
+    except DECOMPRESSION_ERRORS as error:
+        raise ValueError(f"Invalid {codec} body: {error}") from error
+    return b"".join(chunks), time.thread_time() - start
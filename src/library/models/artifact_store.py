@@ -0,0 +1,274 @@
+"""
+Versioned store of the FHE deployment files.
+
+Each build of an FHE model is saved in its own version directory of the store, named after the
+hash of everything the build depends on: the training data, the class and hyperparameters of the
+model, and the versions of Concrete ML and Concrete. A build whose version is already in the
+store has nothing to do: it skips fitting and compiling the model, so that a retraining with
+unchanged inputs takes seconds, and the files of previous versions are kept instead of being
+overwritten.
+
+A version directory holds the client.zip and server.zip saved by `FHEModelDev`, the files added
+by the build (e.g. clear_model.json, circuit_cost.json, scaler.pkl) and a manifest.json written
+last, whose presence means the version is complete. The LATEST file of the store names the last
+built version. The server and the client serve the version named by the MODEL_VERSION
+environment variable, to pin a version, or the latest one (see `resolve_deployment_directory`).
+
+The module only depends on the standard library and Concrete ML, so that both the library
+(`library.models.artifact_store`) and the applications (`src.library.models.artifact_store`)
+can import it.
+
+Classes:
+    - ArtifactStore: The version directories of the store.
+
+Functions:
+    - fingerprint_data: Computes the fingerprint of the training data.
+    - artifact_version: Computes the version of a build.
+    - resolve_deployment_directory: Returns the deployment files to serve.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from importlib.metadata import version as package_version
+
+import numpy as np
+from concrete.ml.deployment import FHEModelDev
+
+ARTIFACT_STORE_DIRECTORY = os.environ.get(
+    "ARTIFACT_STORE_DIRECTORY",
+    os.path.join(os.path.abspath(os.getcwd()), "models", "artifacts"),
+)
+# Version served by the server and the client, the latest one if unset
+MODEL_VERSION = os.environ.get("MODEL_VERSION")
+# Deployment files of the models trained before the store
+LEGACY_FHE_DIRECTORY = os.path.join(os.path.abspath(os.getcwd()), "models", "fhe_files")
+
+MANIFEST_FILE = "manifest.json"
+LATEST_FILE = "LATEST"
+# Length of the version names, a prefix of the hex digest of the build inputs
+VERSION_LENGTH = 16
+
+
+def fingerprint_data(*arrays):
+    """
+    Compute the fingerprint of the training data of a build.
+
+    Args:
+        *arrays (array-like): The training features and targets.
+
+    Returns:
+        str: The SHA-256 hex digest of the shapes, dtypes and content of the arrays.
+    """
+    sha256 = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha256.update(f"{array.shape};{array.dtype};".encode("utf-8"))
+        sha256.update(array.tobytes())
+    return sha256.hexdigest()
+
+
+def artifact_version(data_fingerprint, fhe_model):
+    """
+    Compute the version of the build of an FHE model.
+
+    Args:
+        data_fingerprint (str): The fingerprint of the training data, see `fingerprint_data`.
+        fhe_model (BaseEstimator): The unfitted Concrete ML model, whose class and
+            hyperparameters are part of the version.
+
+    Returns:
+        str: The first VERSION_LENGTH characters of the SHA-256 hex digest of the build inputs.
+    """
+    model_class = type(fhe_model)
+    sha256 = hashlib.sha256()
+    sha256.update(data_fingerprint.encode("utf-8"))
+    sha256.update(
+        f"{model_class.__module__}.{model_class.__qualname__};".encode("utf-8")
+    )
+    sha256.update(repr(sorted(fhe_model.get_params().items())).encode("utf-8"))
+    for package in ("concrete-ml", "concrete-python"):
+        sha256.update(f"{package}={package_version(package)};".encode("utf-8"))
+    return sha256.hexdigest()[:VERSION_LENGTH]
+
+
+class ArtifactStore:
+    """
+    The version directories of the store, under its root directory.
+    """
+
+    def __init__(self, root=ARTIFACT_STORE_DIRECTORY):
+        """
+        Open the store.
+
+        Args:
+            root (str): The root directory of the store, created on the first build.
+        """
+        self.root = root
+
+    def path(self, version):
+        """
+        Return the directory of a version.
+
+        Args:
+            version (str): The name of the version.
+
+        Returns:
+            str: The directory of the version, which may not exist.
+        """
+        return os.path.join(self.root, version)
+
+    def manifest(self, version):
+        """
+        Return the manifest of a version, or None if the store does not hold it.
+
+        Args:
+            version (str): The name of the version.
+
+        Returns:
+            dict: The build inputs and metadata of the version.
+        """
+        path = os.path.join(self.path(version), MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as file_handler:
+            return json.load(file_handler)
+
+    def versions(self):
+        """
+        List the complete versions of the store.
+
+        Returns:
+            list: The manifests of the versions, from the oldest to the newest build.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        manifests = [self.manifest(name) for name in os.listdir(self.root)]
+        return sorted(
+            (manifest for manifest in manifests if manifest is not None),
+            key=lambda manifest: manifest["created_at"],
+        )
+
+    def latest(self):
+        """
+        Return the name of the last built version, or None if the store is empty.
+        """
+        path = os.path.join(self.root, LATEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as file_handler:
+            return file_handler.read().strip()
+
+    def set_latest(self, version):
+        """
+        Make a version of the store the latest one.
+
+        Args:
+            version (str): The name of the version.
+        """
+        path = os.path.join(self.root, LATEST_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file_handler:
+            file_handler.write(version)
+        os.replace(f"{path}.tmp", path)
+
+    @contextmanager
+    def build(self, version, metadata):
+        """
+        Create a version: yield an empty directory to fill with its files, which becomes the
+        version directory, with its manifest, once the block completes.
+
+        The directory is a temporary one until then, so that an interrupted build leaves no
+        partial version behind. The new version becomes the latest one.
+
+        Args:
+            version (str): The name of the version.
+            metadata (dict): JSON-serializable build inputs and metadata, saved in the manifest.
+
+        Yields:
+            str: The directory to fill with the files of the version.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix=".build-")
+        try:
+            yield tmp_dir
+            manifest = {"version": version, "created_at": time.time(), **metadata}
+            manifest_path = os.path.join(tmp_dir, MANIFEST_FILE)
+            with open(manifest_path, "w", encoding="utf-8") as file_handler:
+                json.dump(manifest, file_handler, indent=2, default=repr)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        try:
+            os.rename(tmp_dir, self.path(version))
+        except OSError:
+            # Another build of the same version completed first
+            shutil.rmtree(tmp_dir)
+        self.set_latest(version)
+
+    def save_model(self, version, fhe_model, data_fingerprint, writers=()):
+        """
+        Create the version of a compiled FHE model, with its deployment files and its dump
+        (clear_model.json, for the "clear" execution mode of the server).
+
+        Args:
+            version (str): The name of the version, see `artifact_version`.
+            fhe_model (BaseEstimator): The compiled Concrete ML model.
+            data_fingerprint (str): The fingerprint of the training data, see
+                `fingerprint_data`.
+            writers (list): Functions adding other files to the version, called with the
+                directory to write them to.
+
+        Returns:
+            str: The directory of the version.
+        """
+        model_class = type(fhe_model)
+        metadata = {
+            "model_class": f"{model_class.__module__}.{model_class.__qualname__}",
+            "params": fhe_model.get_params(),
+            "data_fingerprint": data_fingerprint,
+            "concrete-ml": package_version("concrete-ml"),
+            "concrete-python": package_version("concrete-python"),
+        }
+        with self.build(version, metadata) as build_dir:
+            FHEModelDev(path_dir=build_dir, model=fhe_model).save()
+            with open(
+                os.path.join(build_dir, "clear_model.json"), "w", encoding="utf-8"
+            ) as file_handler:
+                fhe_model.dump(file_handler)
+            for write in writers:
+                write(build_dir)
+        return self.path(version)
+
+
+def resolve_deployment_directory(
+    version=MODEL_VERSION,
+    root=ARTIFACT_STORE_DIRECTORY,
+    legacy_dir=LEGACY_FHE_DIRECTORY,
+):
+    """
+    Return the directory of the deployment files to serve.
+
+    Args:
+        version (str): The pinned version, None for the latest one.
+        root (str): The root directory of the store.
+        legacy_dir (str): The deployment files used when the store is empty and no version is
+            pinned.
+
+    Returns:
+        tuple: The name of the version (str, None for the legacy files) and its directory.
+
+    Raises:
+        FileNotFoundError: If the pinned version is not in the store.
+    """
+    store = ArtifactStore(root)
+    if version is None:
+        version = store.latest()
+        if version is None:
+            return None, legacy_dir
+    if store.manifest(version) is None:
+        raise FileNotFoundError(f"Model version '{version}' is not in the store {root}")
+    return version, store.path(version)
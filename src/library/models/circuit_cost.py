@@ -0,0 +1,185 @@
+"""
+Module to report the static cost of the FHE circuit of a compiled model.
+
+The cost of a model in FHE is known as soon as it is compiled, without generating keys
+or running anything encrypted: the statistics of its circuit give its maximum integer
+bit-width, its number of programmable bootstrapping (PBS) and key switch operations,
+the size of its graph, the sizes of the input and output ciphertexts and of the
+evaluation keys, and the complexity of the circuit in the cost model of the Concrete
+optimizer. The complexity grows with both the number of PBS and their cryptographic
+parameters, so it is what the per-inference latency is predicted from.
+
+The prediction is calibrated on the machine: a reference circuit is compiled and run in
+real FHE once, and its duration per unit of complexity is saved in the
+LATENCY_CALIBRATION_PATH file, keyed by the host and the version of Concrete, and reused
+by the following reports. The predicted latency is an estimate of the execution of the
+circuit on the server, typically within a factor of two of the measured one (the
+encryption, the transfers and the warm-up of the first run are not included), enough
+to reject the models that are far too expensive before measuring the others.
+
+Functions:
+    - calibrate_latency: Measures the duration per unit of complexity of this machine.
+    - circuit_cost_report: Reports the static cost of the circuit of a compiled model.
+    - save_report: Saves a report as JSON.
+    - load_report: Loads a saved report.
+"""
+
+import json
+import os
+import platform
+import time
+from importlib.metadata import version
+
+import numpy as np
+from concrete import fhe
+
+LATENCY_CALIBRATION_PATH = os.environ.get(
+    "LATENCY_CALIBRATION_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "latency_calibration.json"),
+)
+CIRCUIT_COST_FILE = "circuit_cost.json"
+
+# Reference circuit of the calibration: one table lookup per element, small enough for
+# its keys to be generated in seconds
+CALIBRATION_BIT_WIDTH = 6
+CALIBRATION_SIZE = 64
+CALIBRATION_RUNS = 3
+
+
+def _machine():
+    """
+    Describe the machine and the runtime the calibration is valid for.
+    """
+    return {
+        "host": platform.node(),
+        "processor": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "concrete-python": version("concrete-python"),
+    }
+
+
+def calibrate_latency(calibration_path=LATENCY_CALIBRATION_PATH):
+    """
+    Return the duration of one unit of circuit complexity on this machine.
+
+    The calibration saved in `calibration_path` is reused if it was measured on this
+    machine with this version of Concrete. Otherwise, the reference circuit is compiled,
+    its keys are generated, its median duration over CALIBRATION_RUNS
+    runs is measured and the result is saved.
+
+    Args:
+        calibration_path (str): The JSON file holding the calibration.
+
+    Returns:
+        float: The duration of one unit of complexity, in seconds.
+    """
+    machine = _machine()
+    if os.path.exists(calibration_path):
+        with open(calibration_path, encoding="utf-8") as file_handler:
+            calibration = json.load(file_handler)
+        if calibration.get("machine") == machine:
+            return calibration["seconds_per_complexity"]
+
+    table_size = 2**CALIBRATION_BIT_WIDTH
+
+    @fhe.compiler({"x": "encrypted"})
+    def reference(x):
+        return fhe.univariate(lambda value: (value * 3) % table_size)(x)
+
+    rng = np.random.default_rng(0)
+    circuit = reference.compile(
+        [rng.integers(0, table_size, CALIBRATION_SIZE) for _ in range(20)]
+    )
+    circuit.keygen()
+    encrypted_input = circuit.encrypt(rng.integers(0, table_size, CALIBRATION_SIZE))
+    durations = []
+    for _ in range(CALIBRATION_RUNS):
+        start_time = time.time()
+        circuit.run(encrypted_input)
+        durations.append(time.time() - start_time)
+    seconds_per_complexity = float(np.median(durations)) / circuit.complexity
+
+    os.makedirs(os.path.dirname(os.path.abspath(calibration_path)), exist_ok=True)
+    # Write to a temporary file first so that a concurrent reader never sees a partially
+    # written calibration
+    tmp_path = f"{calibration_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file_handler:
+        json.dump(
+            {"machine": machine, "seconds_per_complexity": seconds_per_complexity},
+            file_handler,
+            indent=2,
+        )
+    os.replace(tmp_path, calibration_path)
+    return seconds_per_complexity
+
+
+def circuit_cost_report(fhe_model, seconds_per_complexity=None):
+    """
+    Report the static cost of the FHE circuit of a compiled Concrete ML model.
+
+    Args:
+        fhe_model (BaseEstimator): The compiled Concrete ML model.
+        seconds_per_complexity (float): The duration of one unit of complexity, measured
+            by `calibrate_latency` if None.
+
+    Returns:
+        dict: The cost of the circuit:
+            {
+                "Max Bit-Width": int, "PBS Count": int, "Key Switch Count": int,
+                "Circuit Nodes": int, "Circuit Complexity": float,
+                "Input Ciphertext Size (KB)": float, "Output Ciphertext Size (KB)": float,
+                "Evaluation Key Size (MB)": float, "Predicted Latency (ms)": float
+            }.
+    """
+    if seconds_per_complexity is None:
+        seconds_per_complexity = calibrate_latency()
+    circuit = fhe_model.fhe_circuit
+    statistics = circuit.statistics
+    evaluation_key_size = (
+        statistics["size_of_bootstrap_keys"] + statistics["size_of_keyswitch_keys"]
+    )
+    predicted_latency = statistics["complexity"] * seconds_per_complexity
+    return {
+        "Max Bit-Width": int(circuit.graph.maximum_integer_bit_width()),
+        "PBS Count": int(statistics["programmable_bootstrap_count"]),
+        "Key Switch Count": int(statistics["key_switch_count"]),
+        "Circuit Nodes": circuit.graph.graph.number_of_nodes(),
+        "Circuit Complexity": float(statistics["complexity"]),
+        "Input Ciphertext Size (KB)": statistics["size_of_inputs"] / 1024,
+        "Output Ciphertext Size (KB)": statistics["size_of_outputs"] / 1024,
+        "Evaluation Key Size (MB)": evaluation_key_size / 1024**2,
+        "Predicted Latency (ms)": predicted_latency * 1000,
+    }
+
+
+def save_report(report, fhe_directory):
+    """
+    Save the cost report of a model next to its deployment files.
+
+    Args:
+        report (dict): The report of `circuit_cost_report`.
+        fhe_directory (str): The directory of the deployment files.
+
+    Returns:
+        str: The path of the saved report.
+    """
+    path = os.path.join(fhe_directory, CIRCUIT_COST_FILE)
+    with open(path, "w", encoding="utf-8") as file_handler:
+        json.dump(report, file_handler, indent=2)
+    return path
+
+
+def load_report(fhe_directory):
+    """
+    Load the cost report saved next to deployment files.
+
+    Args:
+        fhe_directory (str): The directory of the deployment files.
+
+    Returns:
+        dict: The report of `circuit_cost_report`.
+    """
+    with open(
+        os.path.join(fhe_directory, CIRCUIT_COST_FILE), encoding="utf-8"
+    ) as file_handler:
+        return json.load(file_handler)
@@ -2,120 +2,451 @@
 Module for evaluating the performance of trained models
 using both Sklearn and FHE implementations.
 
-This module includes functionality to compare the accuracy and
-execution times of models trained with Scikit-learn and
-Fully Homomorphic Encryption (FHE). Results are saved as a CSV file.
+This module compares the models of `get_models()` on the numbers used to choose
+a model for FHE deployment: accuracy, fit and compile times, and per-sample
+inference latency, both simulated and in real FHE. Results are saved as a CSV
+file.
+
+The models are evaluated in parallel, one per worker process, as each one is
+independent and compiling and running FHE circuits is CPU-bound. The number of
+processes is set by the EVALUATION_WORKERS environment variable (defaults to
+the number of models, within the number of CPUs), and the number of validation
+samples run in real FHE per model by FHE_SAMPLES (defaults to 3; 0 skips the
+real FHE runs, by far the slowest step).
+
+Each model has an entry in the EVALUATION_CACHE_DIRECTORY directory, keyed by
+its parameters, the training data and the versions of the libraries, holding
+the fitted model (model.json), the compiled deployment files (fhe_files) and
+the metrics measured so far (metrics.json). Re-runs only do the work missing
+from the cache, so an interrupted evaluation resumes where it stopped.
 """
 
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
 import time
+from concurrent.futures import as_completed
+from importlib.metadata import version
+from typing import NamedTuple, Optional
+
+import numpy as np
 import pandas as pd
 from sklearn.metrics import accuracy_score
-import joblib
+from concrete.ml.common.serialization.loaders import load
+from concrete.ml.deployment import FHEModelClient, FHEModelDev, FHEModelServer
+from library.models.circuit_cost import (  # pylint: disable=import-error
+    calibrate_latency,
+    circuit_cost_report,
+)
+from library.models.model_comparaison import get_models  # pylint: disable=import-error
+from library.process_pool import spawn_executor  # pylint: disable=import-error
+from library.preprocessing.data_preprocessing import (  # pylint: disable=import-error
+    prepare_processed_data,
+)
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+EVALUATION_CACHE_DIRECTORY = os.environ.get(
+    "EVALUATION_CACHE_DIRECTORY", os.path.join("library", "data", "evaluation_cache")
+)
+EVALUATION_WORKERS = int(
+    os.environ.get(
+        "EVALUATION_WORKERS", str(min(len(get_models()), os.cpu_count() or 1))
+    )
+)
+FHE_SAMPLES = int(os.environ.get("FHE_SAMPLES", "3"))
+MAX_PREDICTED_LATENCY_MS = os.environ.get("MAX_PREDICTED_LATENCY_MS")
+
+# Columns of the results, in order
+RESULT_COLUMNS = [
+    "Model",
+    "Sklearn Accuracy",
+    "FHE Accuracy",
+    "Accuracy Ratio (FHE/Sklearn)",
+    "Sklearn Fit Time (s)",
+    "FHE Fit Time (s)",
+    "FHE Compile Time (s)",
+    "Sklearn Latency (ms)",
+    "Simulated Latency (ms)",
+    "FHE Latency (ms)",
+    "FHE Samples",
+    "Max Bit-Width",
+    "PBS Count",
+    "Key Switch Count",
+    "Circuit Nodes",
+    "Circuit Complexity",
+    "Input Ciphertext Size (KB)",
+    "Output Ciphertext Size (KB)",
+    "Evaluation Key Size (MB)",
+    "Predicted Latency (ms)",
+]
 
 
-def evaluate_models(models, datasets, training_times):
+class EvaluationSettings(NamedTuple):
     """
-    Evaluate trained models and compare performance.
+    Settings of the evaluation of the models, shared by all the models evaluated.
+
+    Attributes:
+        cache_dir (str): Root directory of the cache, holding one entry per model.
+        fhe_samples (int): Number of validation samples run in real FHE per model, 0 to skip.
+        seconds_per_complexity (float): The duration of one unit of circuit complexity (see
+            `calibrate_latency`), measured by each worker process if None.
+    """
+
+    cache_dir: str
+    fhe_samples: int
+    seconds_per_complexity: Optional[float] = None
 
-    This function computes accuracy and execution time metrics
-    for Scikit-learn and FHE models and calculates their ratios.
+
+def cache_key(model_name, fhe_model, datasets):
+    """
+    Compute the key of the cache entry of a model.
 
     Args:
-        models (dict):
-            Dictionary where keys are model names and values are tuples
-            containing Scikit-learn and FHE models:
-            {
-                "model_name": (sklearn_model, fhe_model)
-            }.
-        datasets (dict):
-            Dictionary containing training and validation datasets:
+        model_name (str): Name of the model in `get_models()`.
+        fhe_model (BaseEstimator): The unfitted Concrete ML model, whose parameters are part
+            of the key.
+        datasets (dict): The training and validation datasets, part of the key.
+
+    Returns:
+        str: The SHA-256 hex digest of the name and parameters of the model, of the data and
+        of the versions of the libraries.
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(model_name.encode("utf-8"))
+    sha256.update(repr(sorted(fhe_model.get_params().items())).encode("utf-8"))
+    for name in ("x_train", "y_train", "x_val", "y_val"):
+        sha256.update(np.ascontiguousarray(datasets[name]).tobytes())
+    for package in ("concrete-python", "concrete-ml", "scikit-learn"):
+        sha256.update(f"{package}={version(package)};".encode("utf-8"))
+    return sha256.hexdigest()
+
+
+def _save_metrics(path, metrics):
+    """
+    Write the metrics of a model to its cache entry, atomically.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file_handler:
+        json.dump(metrics, file_handler, indent=2)
+    os.replace(tmp_path, path)
+
+
+def measure_fhe_latency(fhe_directory, x_samples):
+    """
+    Measure the latency of the FHE model of deployment files on a few samples.
+
+    Keys are generated in a temporary directory, and each sample is encrypted, run by the
+    server and decrypted, as in production.
+
+    Args:
+        fhe_directory (str): Directory containing the FHE deployment files.
+        x_samples (np.ndarray): The samples to run, one per row.
+
+    Returns:
+        float: The mean duration of the FHE execution of a sample on the server, in
+        seconds.
+    """
+    server = FHEModelServer(fhe_directory)
+    server.load()
+    with tempfile.TemporaryDirectory() as key_dir:
+        client = FHEModelClient(fhe_directory, key_dir=key_dir)
+        client.generate_private_and_evaluation_keys()
+        evaluation_keys = client.get_serialized_evaluation_keys()
+
+        durations = []
+        for sample in x_samples:
+            encrypted_data = client.quantize_encrypt_serialize(sample[np.newaxis, :])
+            start_time = time.time()
+            encrypted_result = server.run(encrypted_data, evaluation_keys)
+            durations.append(time.time() - start_time)
+            client.deserialize_decrypt_dequantize(encrypted_result)
+    return float(np.mean(durations))
+
+
+def _evaluate_sklearn_model(sk_model, datasets):
+    """
+    Fit the Sklearn model and measure its accuracy and latency on the validation set.
+    """
+    start_time = time.time()
+    sk_model.fit(datasets["x_train"], datasets["y_train"].astype(int))
+    fit_time = time.time() - start_time
+    y_val = datasets["y_val"].astype(int)
+    start_time = time.time()
+    sk_y_pred = sk_model.predict(datasets["x_val"])
+    return {
+        "Sklearn Fit Time (s)": fit_time,
+        "Sklearn Latency (ms)": (time.time() - start_time) / len(y_val) * 1000,
+        "Sklearn Accuracy": accuracy_score(y_val, sk_y_pred),
+    }
+
+
+def _fit_fhe_model(fhe_model, datasets, model_path):
+    """
+    Fit the FHE model and save it to its cache entry, atomically, returning the fit time in
+    seconds.
+    """
+    start_time = time.time()
+    fhe_model.fit(datasets["x_train"], datasets["y_train"].astype(int))
+    fit_time = time.time() - start_time
+    with open(f"{model_path}.tmp", "w", encoding="utf-8") as file_handler:
+        fhe_model.dump(file_handler)
+    os.replace(f"{model_path}.tmp", model_path)
+    return fit_time
+
+
+def _compile_fhe_model(fhe_model, x_train, fhe_directory, seconds_per_complexity):
+    """
+    Compile the FHE model, save its deployment files to its cache entry unless they are
+    there, and return its compile time with the static cost of its circuit.
+    """
+    start_time = time.time()
+    fhe_model.compile(x_train)
+    compile_metrics = {"FHE Compile Time (s)": time.time() - start_time}
+    compile_metrics.update(circuit_cost_report(fhe_model, seconds_per_complexity))
+    if not os.path.exists(fhe_directory):
+        # FHEModelDev needs an empty directory
+        tmp_directory = tempfile.mkdtemp(dir=os.path.dirname(fhe_directory))
+        shutil.rmtree(tmp_directory)
+        FHEModelDev(path_dir=tmp_directory, model=fhe_model).save()
+        os.rename(tmp_directory, fhe_directory)
+    return compile_metrics
+
+
+def _evaluate_simulated_model(fhe_model, datasets):
+    """
+    Measure the accuracy and latency of the simulated FHE model on the validation set.
+    """
+    x_val, y_val = datasets["x_val"], datasets["y_val"].astype(int)
+    start_time = time.time()
+    fhe_y_pred = fhe_model.predict(x_val, fhe="simulate")
+    return {
+        "Simulated Latency (ms)": (time.time() - start_time) / len(x_val) * 1000,
+        "FHE Accuracy": accuracy_score(y_val, fhe_y_pred),
+    }
+
+
+def _needs_fhe_latency(metrics, fhe_samples):
+    """
+    Return whether the latency in real FHE is to be measured: on more samples than cached, and
+    for a model not predicted slower than MAX_PREDICTED_LATENCY_MS.
+    """
+    too_slow = MAX_PREDICTED_LATENCY_MS and metrics["Predicted Latency (ms)"] > float(
+        MAX_PREDICTED_LATENCY_MS
+    )
+    return fhe_samples > metrics.get("FHE Samples", 0) and not too_slow
+
+
+def evaluate_model(model_name, datasets, settings, params=None):
+    """
+    Evaluate one model of `get_models()`, reusing the work cached by previous runs.
+
+    The hyperparameters in `params` override those of `get_models()`, for both the Sklearn
+    and the FHE models (`n_bits` only applies to the FHE model).
+
+    The Sklearn and FHE models are fitted, the FHE model is compiled and saved as deployment
+    files, its accuracy and simulated latency are measured on the validation set, and its
+    latency in real FHE on the first `settings.fhe_samples` validation samples. Each step
+    stores its results in the cache entry of the model, and is skipped if they are already
+    there.
+
+    Args:
+        model_name (str): Name of the model in `get_models()`.
+        datasets (dict): Dictionary containing training and validation datasets:
             {
                 "x_train": np.ndarray, "x_val": np.ndarray,
                 "y_train": np.ndarray, "y_val": np.ndarray
             }.
-        training_times (dict):
-            Dictionary containing training times for Scikit-learn models:
-            {
-                "model_name": float
-            }.
+        settings (EvaluationSettings): The cache directory, the number of validation
+            samples run in real FHE and the latency calibration.
+        params (dict): Hyperparameters overriding those of `get_models()`.
 
     Returns:
-        list: A list of dictionaries, where each dictionary contains
-        evaluation metrics for a model:
-        [
-            {
-                "Model": str,
-                "Sklearn Accuracy": float,
-                "FHE Accuracy": float,
-                "Sklearn Time": float,
-                "FHE Time": float,
-                "Time Ratio (FHE/Sklearn)": float,
-                "Accuracy Ratio (FHE/Sklearn)": float
-            },
-            ...
-        ].
-    """
-    x_train, y_train = datasets["x_train"], datasets["y_train"].astype(int)
-    x_val, y_val = datasets["x_val"], datasets["y_val"].astype(int)
+        dict: The evaluation metrics of the model, keyed by the names of RESULT_COLUMNS.
+    """
+    sk_model, fhe_model = get_models()[model_name]
+    if params:
+        fhe_model.set_params(**params)
+        sk_model.set_params(
+            **{name: value for name, value in params.items() if name != "n_bits"}
+        )
+
+    entry_dir = os.path.join(
+        settings.cache_dir, cache_key(model_name, fhe_model, datasets)
+    )
+    os.makedirs(entry_dir, exist_ok=True)
+    metrics_path = os.path.join(entry_dir, "metrics.json")
+    model_path = os.path.join(entry_dir, "model.json")
+    fhe_directory = os.path.join(entry_dir, "fhe_files")
+
+    metrics = {"Model": model_name}
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as file_handler:
+            metrics.update(json.load(file_handler))
+
+    # Sklearn baseline
+    if "Sklearn Accuracy" not in metrics:
+        metrics.update(_evaluate_sklearn_model(sk_model, datasets))
+        _save_metrics(metrics_path, metrics)
+
+    # Fit the FHE model, or load it fitted
+    if os.path.exists(model_path):
+        with open(model_path, encoding="utf-8") as file_handler:
+            fhe_model = load(file_handler)
+    else:
+        metrics["FHE Fit Time (s)"] = _fit_fhe_model(fhe_model, datasets, model_path)
+        _save_metrics(metrics_path, metrics)
+
+    # Compile the FHE model, unless only the real FHE latency is missing and the
+    # deployment files are cached
+    compiled_metrics = ("FHE Accuracy", "Predicted Latency (ms)")
+    if not all(name in metrics for name in compiled_metrics) or not os.path.exists(
+        fhe_directory
+    ):
+        metrics.update(
+            _compile_fhe_model(
+                fhe_model,
+                datasets["x_train"],
+                fhe_directory,
+                settings.seconds_per_complexity,
+            )
+        )
+        _save_metrics(metrics_path, metrics)
 
-    results = []
-    for model_name, (sk_model, fhe_model) in models.items():
-        obj = {"Model": model_name}
-        # Predict with Sklearn model
-        sk_y_pred = sk_model.predict(x_val)
-        obj["Sklearn Accuracy"] = accuracy_score(y_val, sk_y_pred)
-
-        # Train FHE model
-        start_time = time.time()
-        fhe_model.fit(x_train, y_train)
-        obj["FHE Time"] = time.time() - start_time
-        # Predict with FHE model
-        fhe_y_pred = fhe_model.predict(x_val)
-        obj["FHE Accuracy"] = accuracy_score(y_val, fhe_y_pred)
-
-        # Calculate ratios
-        obj["Sklearn Time"] = training_times[model_name]
-        obj["Time Ratio (FHE/Sklearn)"] = obj["FHE Time"] / obj["Sklearn Time"]
-        obj["Accuracy Ratio (FHE/Sklearn)"] = (
-            obj["FHE Accuracy"] / obj["Sklearn Accuracy"]
+    # Accuracy and latency of the simulated FHE model on the validation set
+    if "FHE Accuracy" not in metrics:
+        metrics.update(_evaluate_simulated_model(fhe_model, datasets))
+        metrics["Accuracy Ratio (FHE/Sklearn)"] = (
+            metrics["FHE Accuracy"] / metrics["Sklearn Accuracy"]
         )
+        _save_metrics(metrics_path, metrics)
 
-        # Store results
-        results.append(obj)
+    # Latency in real FHE, measured again if more samples are asked for, unless the
+    # model is predicted to be too slow
+    if _needs_fhe_latency(metrics, settings.fhe_samples):
+        x_samples = datasets["x_val"][: settings.fhe_samples]
+        latency = measure_fhe_latency(fhe_directory, x_samples)
+        metrics["FHE Latency (ms)"] = latency * 1000
+        metrics["FHE Samples"] = len(x_samples)
+        _save_metrics(metrics_path, metrics)
 
+    return metrics
+
+
+def evaluate_candidates(candidates, datasets, settings, workers=1):
+    """
+    Evaluate models in parallel across processes, one per worker process.
+
+    Each model is evaluated by `evaluate_model` in a worker process, which builds it
+    from `get_models()`: the models themselves are not sent to the workers.
+
+    Args:
+        candidates (list):
+            `(model_name, params)` pairs, the name of a model of `get_models()` and
+            the hyperparameters overriding its own, or None.
+        datasets (Mapping):
+            Mapping containing training and validation datasets, e.g. the
+            `ProcessedData` of the processed data cache, sent to each worker:
+            {
+                "x_train": np.ndarray, "x_val": np.ndarray,
+                "y_train": np.ndarray, "y_val": np.ndarray
+            }.
+        settings (EvaluationSettings):
+            The cache directory, the number of validation samples run in real FHE
+            per model and the latency calibration.
+        workers (int):
+            Number of worker processes.
+
+    Returns:
+        list: A list of dictionaries, one per candidate in order, where each dictionary
+        contains the evaluation metrics of a model, keyed by the names of RESULT_COLUMNS.
+        A model whose evaluation failed only has its "Model" name and an "Error" message.
+    """
+    results = [None] * len(candidates)
+    # Spawned workers do not inherit the threads of the Concrete runtime
+    with spawn_executor(workers) as executor:
+        futures = {
+            executor.submit(
+                evaluate_model, model_name, datasets, settings, params
+            ): index
+            for index, (model_name, params) in enumerate(candidates)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            model_name, params = candidates[index]
+            label = f"{model_name} {params}" if params else model_name
+            try:
+                results[index] = future.result()
+                print(f"[{done}/{len(candidates)}] Evaluated {label}")
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                results[index] = {"Model": model_name, "Error": str(error)}
+                print(
+                    f"[{done}/{len(candidates)}] Evaluation of {label} failed: {error}"
+                )
     return results
 
 
+def evaluate_models(models, datasets, settings, workers=1):
+    """
+    Evaluate models and compare performance, in parallel across processes.
+
+    Args:
+        models (list):
+            Names of the models of `get_models()` to evaluate.
+        datasets (Mapping):
+            Mapping containing training and validation datasets, see
+            `evaluate_candidates`.
+        settings (EvaluationSettings):
+            The cache directory, the number of validation samples run in real FHE
+            per model and the latency calibration.
+        workers (int):
+            Number of worker processes.
+
+    Returns:
+        list: A list of dictionaries, one per model in the order of `models`, where each
+        dictionary contains the evaluation metrics of a model, keyed by the names of
+        RESULT_COLUMNS. A model whose evaluation failed only has its "Model" name and an
+        "Error" message.
+    """
+    candidates = [(model_name, None) for model_name in models]
+    return evaluate_candidates(candidates, datasets, settings, workers)
+
+
 def main():
     """
     Main function to load data, evaluate models, and save results.
 
-    This function loads processed data and pre-trained models,
-    evaluates their performance using `evaluate_models`, and saves
-    the results to a CSV file.
+    This function loads processed data, evaluates all the models of
+    `get_models()` using `evaluate_models`, and saves the results to a CSV
+    file.
 
     Steps:
-    1. Load the processed datasets and models from serialized files.
-    2. Evaluate the models on accuracy and execution time metrics.
+    1. Load the processed datasets from the processed data cache.
+    2. Evaluate the models on accuracy, time and latency metrics.
     3. Save the evaluation results in a CSV file for further analysis.
 
     Outputs:
         results.csv: A CSV file containing model evaluation metrics.
     """
-    # Load data and models
-    x_train, x_val, _, y_train, y_val, _ = joblib.load(
-        "library/data/processed_data.pkl"
+    # Memory-mapped processed data, sent to the workers as the path of its cache entry
+    datasets = prepare_processed_data()
+    # Calibrated once here and passed to the workers, rather than by each of them
+    settings = EvaluationSettings(
+        EVALUATION_CACHE_DIRECTORY, FHE_SAMPLES, calibrate_latency()
     )
 
-    datasets = {"x_train": x_train, "x_val": x_val, "y_train": y_train, "y_val": y_val}
-
-    trained_models, training_times = joblib.load("trained_and_times_models.pkl")
-
     # Evaluate models
-    results = evaluate_models(trained_models, datasets, training_times)
+    results = evaluate_models(
+        list(get_models()), datasets, settings, workers=EVALUATION_WORKERS
+    )
 
     # Save results to a CSV file
     df = pd.DataFrame(results)
+    extra_columns = [column for column in df if column not in RESULT_COLUMNS]
+    df = df.reindex(columns=RESULT_COLUMNS + extra_columns)
     df.to_csv("results.csv", index=False)
 
 
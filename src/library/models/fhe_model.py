@@ -4,21 +4,40 @@ Module to train and store FHE models for homomorphic encryption.
 This module trains models for Fully Homomorphic Encryption (FHE) and stores
 them after training. It supports the training of Sklearn models, compiles them
 for homomorphic encryption, and saves the FHE models for later use.
+
+The models are saved as versions of the artifact store (see
+`library.models.artifact_store`), keyed by the training data, the model class and
+hyperparameters and the Concrete ML version: a model whose version is already in the
+store is neither fitted nor compiled again. Along with the deployment files, the
+static cost of the compiled circuit (see `library.models.circuit_cost`) is saved to
+circuit_cost.json and returned, to check the model is affordable in FHE before
+deploying it.
 """
 
 import os
 import sys
 import time
-import joblib
-from concrete.ml.deployment import FHEModelDev
+from library.models.artifact_store import (  # pylint: disable=import-error
+    ArtifactStore,
+    artifact_version,
+    fingerprint_data,
+)
+from library.models.circuit_cost import (  # pylint: disable=import-error
+    circuit_cost_report,
+    load_report,
+    save_report,
+)
 from library.models.model_comparaison import get_models  # pylint: disable=import-error
+from library.preprocessing.data_preprocessing import (  # pylint: disable=import-error
+    prepare_processed_data,
+)
 
 
 # Adjust path to include the library directory
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
-def train_fhe_models(models, x_train, y_train):
+def train_fhe_models(models, x_train, y_train, store=None):
     """
     Train and store FHE models for homomorphic encryption.
 
@@ -38,20 +57,35 @@ def train_fhe_models(models, x_train, y_train):
         y_train (array-like):
             Target labels for the training data. Should be a 1D array with the
             same number of elements as the number of samples in `x_train`.
+        store (ArtifactStore):
+            The artifact store the models are saved in, the default store if None.
 
     Returns:
-        dict:
-            A dictionary with the training times for each FHE model:
-            {
-                "model_name": training_time
-            },
-            where `training_time` is the time taken to train and compile the FHE model.
+        tuple: A tuple containing:
+            - training_times (dict): A dictionary with the training times for each FHE
+              model, {"model_name": training_time}, where `training_time` is the time
+              taken to train and compile the FHE model, 0 if its version was already in
+              the store.
+            - cost_reports (dict): A dictionary with the static cost of the circuit of
+              each FHE model, {"model_name": report}, see `circuit_cost_report`.
     """
     y_train = y_train.astype(int)
+    store = store or ArtifactStore()
+    data_fingerprint = fingerprint_data(x_train, y_train)
     training_times = {}
+    cost_reports = {}
 
     for model_name, (_, fhe_model) in models.items():
-        if model_name == "RandomForest":
+        if model_name == "Random Forest":
+            version = artifact_version(data_fingerprint, fhe_model)
+            if store.manifest(version) is not None:
+                # Unchanged inputs: reuse the version built by a previous run
+                store.set_latest(version)
+                training_times[model_name] = 0.0
+                cost_reports[model_name] = load_report(store.path(version))
+                print(f"{model_name}: version {version} up to date")
+                break
+
             # Train FHE model
             start_time = time.time()
             fhe_model.fit(x_train, y_train)
@@ -59,34 +93,42 @@ def train_fhe_models(models, x_train, y_train):
             fhe_model.compile(x_train)
             training_time = time.time() - start_time
 
-            # Save the FHE model
-            fhe_directory = os.path.join(
-                os.path.abspath(os.getcwd()), "models", "fhe_files"
+            # Save the FHE model and the cost of its circuit as a new version
+            report = circuit_cost_report(fhe_model)
+            store.save_model(
+                version,
+                fhe_model,
+                data_fingerprint,
+                writers=[lambda path_dir, report=report: save_report(report, path_dir)],
             )
-            dev = FHEModelDev(path_dir=fhe_directory, model=fhe_model)
-            dev.save()
+            print(f"{model_name}: version {version} saved")
 
-            # Store the training time
+            # Store the training time and the cost of the circuit
             training_times[model_name] = training_time
+            cost_reports[model_name] = report
             break
 
-    return training_times
+    return training_times, cost_reports
 
 
 def main():
     """
-    Main function to train FHE models and print training times.
+    Main function to train FHE models and print training times and circuit costs.
 
     This function loads training data, trains the models for homomorphic encryption,
-    and prints the training times for each model.
+    and prints the training times and the cost of the circuit of each model.
 
     Outputs:
-        Prints the training times for the trained FHE models.
+        Prints the training times and the cost reports of the trained FHE models.
     """
     models = get_models()
-    x_train, _, _, y_train, _, _ = joblib.load("library/data/processed_data.pkl")
-    training_times = train_fhe_models(models, x_train, y_train)
+    processed_data = prepare_processed_data()
+    training_times, cost_reports = train_fhe_models(
+        models, processed_data["x_train"], processed_data["y_train"]
+    )
     print(training_times)
+    for model_name, report in cost_reports.items():
+        print(f"Circuit cost of {model_name}: {report}")
 
 
 if __name__ == "__main__":
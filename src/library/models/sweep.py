@@ -0,0 +1,277 @@
+"""
+Module to sweep the hyperparameters of the FHE models for the best latency/accuracy trade-offs.
+
+The FHE latency of a model depends heavily on its number of trees (n_estimators), their depth
+(max_depth) and the quantization bit-width (n_bits). This module evaluates the models of
+`get_models()` over a grid of these hyperparameters, or a random sample of the grid, and
+reports the Pareto frontier: the candidates that no other candidate beats on both latency and
+accuracy. The fastest candidate of the frontier meeting an accuracy floor is the model to
+deploy.
+
+Each candidate is evaluated by `evaluate_model` (see `library.models.evaluate`) in a pool of
+worker processes: it is fitted and compiled, its accuracy and simulated latency are measured on
+the validation set, and its latency in real FHE on --fhe-samples validation samples (by far the
+slowest step; the frontier uses the real FHE latency when measured, the simulated one
+otherwise). The fitted and compiled candidates are cached, so that re-runs and extended grids
+only evaluate the new candidates. A hyperparameter a model does not have is left out of its
+grid, e.g. the linear models are only swept over n_bits.
+
+Usage:
+    python library/models/sweep.py --models "Random Forest" --n-estimators 10,50,100
+    python library/models/sweep.py --search random --samples 20 --accuracy-floor 0.95
+
+Functions:
+    - parse_values: Parses a list of hyperparameter values.
+    - candidate_parameters: Lists the hyperparameters of the candidates of a model.
+    - pareto_frontier: Selects the Pareto-optimal candidates.
+    - run_sweep: Evaluates the candidates in parallel.
+    - parse_arguments: Parses the command line of the sweep.
+    - print_frontier: Prints the Pareto frontier and the recommended candidate.
+    - main: Runs the sweep from the command line.
+"""
+
+import argparse
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+# Swept hyperparameters and their default values
+DEFAULT_GRID = {
+    "n_estimators": "10,25,50,100",
+    "max_depth": "3,4,5,6",
+    "n_bits": "3,4,5,6",
+}
+
+
+def parse_values(text):
+    """
+    Parse a comma-separated list of hyperparameter values.
+
+    Args:
+        text (str): The values, e.g. "3,4,none".
+
+    Returns:
+        list: The values as integers, "none" standing for None.
+    """
+    return [
+        None if value.strip().lower() == "none" else int(value)
+        for value in text.split(",")
+        if value.strip()
+    ]
+
+
+def candidate_parameters(model_params, grid, search="grid", samples=None, rng=None):
+    """
+    List the hyperparameters of the candidates of a model.
+
+    Args:
+        model_params (dict): The hyperparameters of the model (`get_params()`): the
+            hyperparameters of the grid it does not have are left out.
+        grid (dict): The values of each swept hyperparameter.
+        search (str): "grid" for all the combinations, "random" for a random sample of them.
+        samples (int): Number of combinations of a random search.
+        rng (numpy.random.Generator): The random generator of a random search.
+
+    Returns:
+        list: One dict of hyperparameters per candidate.
+    """
+    names = [name for name in grid if name in model_params]
+    combinations = [
+        dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+    if search == "random" and samples is not None and samples < len(combinations):
+        indices = rng.choice(len(combinations), size=samples, replace=False)
+        combinations = [combinations[index] for index in sorted(indices)]
+    return combinations
+
+
+def pareto_frontier(results, latency_key, accuracy_key):
+    """
+    Select the candidates that no other candidate beats on both latency and accuracy.
+
+    Args:
+        results (list): The metrics of the candidates, as dictionaries.
+        latency_key (str): The key of the latency, to minimize.
+        accuracy_key (str): The key of the accuracy, to maximize.
+
+    Returns:
+        list: The Pareto-optimal candidates, from the fastest to the most accurate.
+    """
+    # Failed candidates have no metrics
+    measured = [
+        result
+        for result in results
+        if None not in (result.get(latency_key), result.get(accuracy_key))
+    ]
+    candidates = sorted(
+        measured, key=lambda result: (result[latency_key], -result[accuracy_key])
+    )
+    frontier = []
+    for result in candidates:
+        if not frontier or result[accuracy_key] > frontier[-1][accuracy_key]:
+            frontier.append(result)
+    return frontier
+
+
+def run_sweep(candidates, datasets, settings, workers):
+    """
+    Evaluate the candidates in parallel, one per worker process.
+
+    Args:
+        candidates (list): `(model_name, params)` pairs, the name of a model of
+            `get_models()` and the hyperparameters overriding its own.
+        datasets (Mapping): Training and validation datasets, see `evaluate_model`.
+        settings (EvaluationSettings): The cache directory, the number of validation samples
+            run in real FHE per candidate and the latency calibration, see `evaluate_model`.
+        workers (int): Number of worker processes.
+
+    Returns:
+        list: The metrics of each candidate, in order, with its hyperparameters. A
+        candidate whose evaluation failed has an "Error" message instead of metrics.
+    """
+    # pylint: disable-next=import-outside-toplevel,import-error
+    from library.models.evaluate import evaluate_candidates
+
+    results = evaluate_candidates(candidates, datasets, settings, workers)
+    return [{**metrics, **params} for metrics, (_, params) in zip(results, candidates)]
+
+
+def parse_arguments(model_names, cache_directory):
+    """
+    Parse the command line of the sweep.
+
+    Args:
+        model_names (list): The names of the models of `get_models()`, all swept by default.
+        cache_directory (str): The default root directory of the cache of the evaluated
+            models.
+
+    Returns:
+        argparse.Namespace: The arguments, with one list of values per hyperparameter of
+        DEFAULT_GRID.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--models",
+        default=",".join(model_names),
+        help="comma-separated names of the models of get_models() to sweep",
+    )
+    for name, values in DEFAULT_GRID.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=parse_values,
+            default=parse_values(values),
+            help=f"comma-separated values of {name} (default: {values})",
+        )
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=20,
+        help="candidates per model of a random search",
+    )
+    parser.add_argument(
+        "--fhe-samples",
+        type=int,
+        default=0,
+        help="validation samples run in real FHE per candidate (0: simulated latency)",
+    )
+    parser.add_argument(
+        "--accuracy-floor",
+        type=float,
+        default=0.0,
+        help="minimum FHE accuracy of the recommended candidate",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes",
+    )
+    parser.add_argument("--cache-directory", default=cache_directory)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="sweep_results.csv")
+    return parser.parse_args()
+
+
+def print_frontier(frontier, latency_key, accuracy_floor):
+    """
+    Print the Pareto frontier, and its fastest candidate meeting the accuracy floor.
+
+    Args:
+        frontier (list): The Pareto-optimal candidates, see `pareto_frontier`.
+        latency_key (str): The key of the latency of the frontier.
+        accuracy_floor (float): The minimum FHE accuracy of the recommended candidate.
+    """
+    print(f"\nPareto frontier ({latency_key} / FHE Accuracy):")
+    columns = [
+        "Model",
+        *DEFAULT_GRID,
+        latency_key,
+        "Predicted Latency (ms)",
+        "FHE Accuracy",
+        "FHE Compile Time (s)",
+    ]
+    print(pd.DataFrame(frontier).reindex(columns=columns).to_string(index=False))
+    eligible = [
+        result for result in frontier if result["FHE Accuracy"] >= accuracy_floor
+    ]
+    if eligible:
+        best = eligible[0]
+        params = {name: best[name] for name in DEFAULT_GRID if name in best}
+        print(
+            f"\nFastest candidate with an accuracy of at least {accuracy_floor}: "
+            f"{best['Model']} {params} ({best[latency_key]:.2f} ms, "
+            f"accuracy {best['FHE Accuracy']:.4f})"
+        )
+    else:
+        print(f"\nNo candidate reaches an accuracy of {accuracy_floor}")
+
+
+def main():
+    """
+    Run the sweep from the command line, and save all the results and the Pareto frontier.
+
+    Outputs:
+        sweep_results.csv (--output): The metrics of all the candidates, with a "Pareto"
+        column marking the frontier.
+    """
+    # pylint: disable=import-outside-toplevel,import-error
+    from library.models.circuit_cost import calibrate_latency
+    from library.models.evaluate import EVALUATION_CACHE_DIRECTORY, EvaluationSettings
+    from library.models.model_comparaison import get_models
+    from library.preprocessing.data_preprocessing import prepare_processed_data
+
+    # pylint: enable=import-outside-toplevel,import-error
+
+    models = get_models()
+    args = parse_arguments(list(models), EVALUATION_CACHE_DIRECTORY)
+
+    grid = {name: getattr(args, name) for name in DEFAULT_GRID}
+    rng = np.random.default_rng(args.seed)
+    candidates = [
+        (model_name, params)
+        for model_name in args.models.split(",")
+        for params in candidate_parameters(
+            models[model_name][1].get_params(), grid, args.search, args.samples, rng
+        )
+    ]
+    print(f"Sweeping {len(candidates)} candidates with {args.workers} workers")
+    # Calibrated once here and passed to the workers, rather than by each of them
+    settings = EvaluationSettings(
+        args.cache_directory, args.fhe_samples, calibrate_latency()
+    )
+    results = run_sweep(candidates, prepare_processed_data(), settings, args.workers)
+
+    latency_key = "FHE Latency (ms)" if args.fhe_samples else "Simulated Latency (ms)"
+    frontier = pareto_frontier(results, latency_key, "FHE Accuracy")
+    df = pd.DataFrame(results)
+    df["Pareto"] = [result in frontier for result in results]
+    df.to_csv(args.output, index=False)
+    print_frontier(frontier, latency_key, args.accuracy_floor)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,9 @@ import sys
 import joblib
 
 from library.models.model_comparaison import get_models  # pylint: disable=import-error
+from library.preprocessing.data_preprocessing import (  # pylint: disable=import-error
+    prepare_processed_data,
+)
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -58,7 +61,8 @@ def main():
     """
     Main function to train models.
 
-    This function loads the training data, trains the models using the
+    This function loads the training data (memory-mapped from the processed
+    data cache, see `prepare_processed_data`), trains the models using the
     `train_models` function, and stores the trained models and their
     training times in a file.
 
@@ -66,8 +70,10 @@ def main():
         None
     """
     models = get_models()
-    x_train, _, _, y_train, _, _ = joblib.load("library/data/processed_data.pkl")
-    trained_models, training_times = train_models(models, x_train, y_train)
+    processed_data = prepare_processed_data()
+    trained_models, training_times = train_models(
+        models, processed_data["x_train"], processed_data["y_train"]
+    )
     # load models and training times
     joblib.dump((trained_models, training_times), "trained_and_times_models.pkl")
 
@@ -0,0 +1,33 @@
+"""
+Process pools whose workers are spawned rather than forked.
+
+The processes of the project run an event loop, or the threads of the Concrete runtime, that
+must not be duplicated in the children of a fork: their worker pools start fresh interpreters,
+which load what they need in their initializer.
+
+Functions:
+    - spawn_executor: Creates a process pool with spawned workers.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def spawn_executor(workers, initializer=None, initargs=()):
+    """
+    Create a process pool whose workers are spawned.
+
+    Args:
+        workers (int): Number of worker processes.
+        initializer (Callable, optional): Function called in each worker when it starts.
+        initargs (tuple): Arguments of the initializer.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
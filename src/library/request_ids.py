@@ -0,0 +1,54 @@
+"""
+Request ids of the client and of the server, to follow a prediction across both in their logs.
+
+Each HTTP request handled gets a request id, taken from its X-Request-ID header if set or
+generated otherwise, and returned in the X-Request-ID header of its response. The client sends
+the id of the request it is processing to the server with the requests it makes for it, so that
+both log the stage durations of a prediction under the same id.
+
+Functions:
+    - request_id_middleware: Creates the HTTP middleware giving each request its id.
+"""
+
+import contextlib
+import uuid
+from contextvars import ContextVar
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Id of the request being processed
+request_id_var = ContextVar("request_id", default=None)
+
+
+def request_id_middleware(logger, in_flight=None):
+    """
+    Create the HTTP middleware giving each request a request id, and logging the stage
+    durations of the predictions with it, at debug level.
+
+    Args:
+        logger (logging.Logger): The logger of the stage durations.
+        in_flight (prometheus_client.Gauge, optional): Gauge of the requests in flight.
+
+    Returns:
+        Callable: The middleware, to register with `app.middleware("http")`.
+    """
+
+    async def middleware(request, call_next):
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        request_id_var.set(request_id)
+        if in_flight is None:
+            tracked = contextlib.nullcontext()
+        else:
+            tracked = in_flight.track_inprogress()
+        with tracked:
+            response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        if "Server-Timing" in response.headers:
+            logger.debug(
+                "Request %s %s: %s",
+                request_id,
+                request.url.path,
+                response.headers["Server-Timing"],
+            )
+        return response
+
+    return middleware
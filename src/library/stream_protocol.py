@@ -0,0 +1,76 @@
+"""
+Protocol of the prediction stream between the client and the server.
+
+A client opens a WebSocket on the /predict_stream endpoint of the server, naming its client id
+and the served model in the query string. The server looks up the evaluation keys of the client
+once, for the whole session, and answers with a text message describing the session: the name
+("model") and version ("model_version") of the model, and the number of predictions the client
+may have in flight at once ("max_in_flight").
+
+The client then sends one binary message per encrypted input, without waiting for the previous
+results: a request id chosen by the client, as an unsigned 64-bit big-endian integer, followed
+by the serialized ciphertext (see `pack_frame`). The server answers each input as soon as it is
+computed, in completion order, with a binary message made of the same request id followed by the
+serialized encrypted prediction, or with a text message {"id": <request id>, "error": <str>} if
+the FHE model failed on the input.
+
+Flow control: the server reads no further input while `max_in_flight` predictions of the session
+are in flight, so that a client sending faster than the model computes is held back by the
+WebSocket instead of queueing without bound on the server.
+
+The session ends when either side closes the WebSocket. The server closes it with code
+CLOSE_MODEL_RELOADED, once the predictions in flight are answered, when the model it is bound to
+is replaced by a new version: inputs received at that point are not answered, and the client
+sends them again on a new session. A session that cannot start is closed with 4000 plus the
+status code of the equivalent HTTP error, e.g. 4404 if the client has no evaluation keys.
+
+The module only depends on the standard library, so that both the client and the server can
+import it.
+
+Functions:
+    - pack_frame: Prefixes a payload with its request id.
+    - unpack_frame: Splits a binary message into its request id and payload.
+"""
+
+import struct
+
+# Request id prefixed to the binary messages
+FRAME_HEADER = struct.Struct(">Q")
+# Close code of a session whose model was replaced ("Service Restart")
+CLOSE_MODEL_RELOADED = 1012
+# Offset of the close codes of the sessions that cannot start, added to an HTTP status code
+CLOSE_CODE_OFFSET = 4000
+
+
+def pack_frame(request_id, payload):
+    """
+    Prefix a payload with its request id, as a binary message of the prediction stream.
+
+    Args:
+        request_id (int): The id of the request, from 0 to 2**64 - 1.
+        payload (bytes): The serialized ciphertext or encrypted prediction.
+
+    Returns:
+        bytes: The binary message.
+    """
+    return FRAME_HEADER.pack(request_id) + payload
+
+
+def unpack_frame(frame):
+    """
+    Split a binary message of the prediction stream into its request id and payload.
+
+    Args:
+        frame (bytes): The binary message.
+
+    Returns:
+        tuple: The request id (int) and the payload (bytes).
+
+    Raises:
+        ValueError: If the message has no payload.
+    """
+    header_size = FRAME_HEADER.size
+    if len(frame) <= header_size:
+        raise ValueError(f"Frame of {len(frame)} bytes without payload")
+    (request_id,) = FRAME_HEADER.unpack_from(frame)
+    return request_id, frame[header_size:]
@@ -0,0 +1,136 @@
+"""
+Admin endpoints of the FHE server.
+
+New model versions are deployed without restarting the server: a version is loaded under a name
+next to the version it replaces, which keeps serving until the new one is warm and is drained
+afterwards (see `src.server.model_registry`). The endpoints require the ADMIN_TOKEN token in the
+X-Admin-Token header, if it is set.
+
+Endpoints:
+    - /admin/models: Lists the served models (GET), loads a version under a name (PUT
+        /admin/models/{name}) or stops serving one (DELETE /admin/models/{name}).
+"""
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+
+from src.server.content_encoding import CompressedRoute
+from src.server.model_registry import ModelRegistry
+from src.server.routing import get_models
+from src.library.models.artifact_store import resolve_deployment_directory
+
+# Token expected in the X-Admin-Token header of the admin endpoints, which are open if unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def check_admin_token(request: Request):
+    """
+    Check the admin token of a request to an admin endpoint.
+
+    Args:
+        request (Request): The request, whose X-Admin-Token header must be ADMIN_TOKEN.
+
+    Raises:
+        HTTPException: 403 if ADMIN_TOKEN is set and the header does not match it.
+    """
+    token = request.headers.get("X-Admin-Token", "")
+    if ADMIN_TOKEN and not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(
+    route_class=CompressedRoute, dependencies=[Depends(check_admin_token)]
+)
+
+
+class LoadModelRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """
+    Schema for the admin model endpoint requests. Expects the version of the artifact store to
+    serve.
+
+    Attributes:
+        version (str): The version of the artifact store, the latest one if None.
+    """
+
+    version: Optional[str] = None
+
+
+@router.get("/admin/models")
+async def list_models(models: ModelRegistry = Depends(get_models)):
+    """
+    Admin endpoint: Lists the served models and the versions being loaded.
+
+    Args:
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: The name of the default model, and the state of the served models (see
+        `ModelRegistry.stats`).
+    """
+    return {"default_model": models.default_name, **models.stats()}
+
+
+@router.put("/admin/models/{name}", status_code=202)
+async def load_model(
+    name: str, body: LoadModelRequest, models: ModelRegistry = Depends(get_models)
+):
+    """
+    Admin endpoint: Loads a version of the artifact store in the background and serves it under
+    a name once it is warm, replacing the model served under this name, if any.
+
+    The replaced model keeps serving requests until the new one is warm, then drains: requests
+    are never dropped, and none waits for a cold model. /admin/models tells when the load is
+    complete.
+
+    Args:
+        name (str): The name to serve the model under.
+        body (LoadModelRequest): The version to load.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message, with the name and version of the model being loaded.
+
+    Raises:
+        HTTPException: 404 if the version is not in the artifact store, 409 if a model is
+            already being loaded under this name.
+    """
+    try:
+        version, _ = resolve_deployment_directory(body.version)
+        models.start_load(name, version)
+    except FileNotFoundError as error:
+        raise HTTPException(status_code=404, detail=str(error)) from error
+    except RuntimeError as error:
+        raise HTTPException(status_code=409, detail=str(error)) from error
+    return {"status": "Loading", "model": name, "version": version}
+
+
+@router.delete("/admin/models/{name}")
+async def unload_model(name: str, models: ModelRegistry = Depends(get_models)):
+    """
+    Admin endpoint: Stops serving a model, which drains in the background.
+
+    Args:
+        name (str): The name of the model.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message, with the name of the model.
+
+    Raises:
+        HTTPException: 404 if no model is served under this name, 409 for the default model.
+    """
+    if name == models.default_name:
+        raise HTTPException(
+            status_code=409, detail="The default model cannot be unloaded"
+        )
+    try:
+        models.unload(name)
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown model '{name}'"
+        ) from error
+    return {"status": "Unloading", "model": name}
@@ -0,0 +1,214 @@
+"""
+Dynamic batching of single FHE inference requests.
+
+Each `/predict` request carries one encrypted input, and running it alone ships the whole
+evaluation key set of the client to a worker process for a single inference. The batcher holds
+concurrent requests of the clients sharing a key set for a short while and submits them to the
+FHE worker pool as one batch (see `FHEWorkerPool.run_batch`), which sends the keys once per
+worker instead of once per input, then hands each request its own result.
+
+A batch is dispatched as soon as it reaches its target size, or when its oldest request has
+waited `max_wait` seconds. The target size adapts to the load of the pool: with idle workers it
+is the number of workers, so that a burst keeps all of them busy, and with a queue it grows by
+the queue depth, as the new requests would wait for a free worker anyway. It never exceeds
+`max_batch_size`.
+
+The batch sizes, fill rates and queueing latencies are recorded in the Prometheus histograms of
+`src.server.metrics`, and summarized by `DynamicBatcher.stats`.
+
+Classes:
+    - DynamicBatcher: Coalesces single inference requests into batches for the worker pool.
+"""
+
+import asyncio
+
+from src.server.metrics import BATCH_FILL_RATE, BATCH_QUEUEING_SECONDS, BATCH_SIZE
+
+
+class _PendingBatch:  # pylint: disable=too-few-public-methods
+    """
+    Requests waiting to be dispatched together, all using the same evaluation keys.
+
+    Attributes:
+        serialized_evaluation_keys (bytes): The evaluation keys shared by the requests.
+        items (list): One `(encrypted_data, future, enqueued_at)` tuple per request.
+        timer (asyncio.TimerHandle): Dispatches the batch when its maximum wait is over.
+    """
+
+    def __init__(self, serialized_evaluation_keys):
+        self.serialized_evaluation_keys = serialized_evaluation_keys
+        self.items = []
+        self.timer = None
+
+
+class _BatchingStats:
+    """
+    Metrics of the dispatched batches, recorded in the Prometheus histograms and summed since the
+    start of the server.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.fill_rate_sum = 0.0
+        self.queueing_seconds_sum = 0.0
+        self.queueing_seconds_max = 0.0
+
+    def record(self, fill_rate, queueing_seconds):
+        """
+        Record a dispatched batch.
+
+        Args:
+            fill_rate (float): The size of the batch over its target size.
+            queueing_seconds (list): The time in seconds each request of the batch waited.
+        """
+        BATCH_SIZE.observe(len(queueing_seconds))
+        BATCH_FILL_RATE.observe(fill_rate)
+        for seconds in queueing_seconds:
+            BATCH_QUEUEING_SECONDS.observe(seconds)
+        self.batches += 1
+        self.items += len(queueing_seconds)
+        self.fill_rate_sum += fill_rate
+        self.queueing_seconds_sum += sum(queueing_seconds)
+        self.queueing_seconds_max = max(self.queueing_seconds_max, *queueing_seconds)
+
+    def summary(self):
+        """
+        Return the batching metrics, see `DynamicBatcher.stats`.
+        """
+        batches = max(self.batches, 1)
+        items = max(self.items, 1)
+        return {
+            "batches": self.batches,
+            "requests": self.items,
+            "mean_batch_size": self.items / batches,
+            "mean_fill_rate": self.fill_rate_sum / batches,
+            "mean_queueing_ms": self.queueing_seconds_sum / items * 1000,
+            "max_queueing_ms": self.queueing_seconds_max * 1000,
+        }
+
+
+class DynamicBatcher:
+    """
+    Coalesces concurrent single inference requests into batches for the FHE worker pool.
+
+    Requests are grouped by the digest of their evaluation keys, as a batch runs with a
+    single key set. The batcher must be used from the event loop of the server.
+
+    Attributes:
+        max_batch_size (int): Maximum number of requests in a batch.
+        max_wait (float): Maximum time in seconds a request waits for its batch to fill up.
+    """
+
+    def __init__(self, fhe_pool, max_batch_size, max_wait):
+        """
+        Create the batcher.
+
+        Args:
+            fhe_pool (FHEWorkerPool): The pool running the batches.
+            max_batch_size (int): Maximum number of requests in a batch. 1 disables batching.
+            max_wait (float): Maximum time in seconds a request waits for its batch to fill up.
+        """
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._fhe_pool = fhe_pool
+        # digest of the evaluation keys -> batch being filled
+        self._pending = {}
+        # Dispatched batches, referenced until they complete
+        self._dispatches = set()
+        self._stats = _BatchingStats()
+
+    def target_batch_size(self):
+        """
+        Return the size at which a batch is dispatched, given the current load of the pool.
+
+        Returns:
+            int: The number of workers plus the queue depth of the pool, within
+            `max_batch_size`.
+        """
+        fhe_pool = self._fhe_pool
+        return min(self.max_batch_size, fhe_pool.workers + fhe_pool.queue_depth)
+
+    async def run(self, encrypted_data, serialized_evaluation_keys, digest):
+        """
+        Run the FHE model on one encrypted input, as part of a batch.
+
+        Args:
+            encrypted_data (bytes): The serialized encrypted input.
+            serialized_evaluation_keys (bytes): The serialized evaluation keys of the client.
+            digest (str): The digest of the evaluation keys, grouping the requests in batches.
+
+        Returns:
+            bytes: The serialized encrypted prediction.
+
+        Raises:
+            RuntimeError: If the FHE model failed on this input.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(digest)
+        if batch is None:
+            batch = _PendingBatch(serialized_evaluation_keys)
+            batch.timer = loop.call_later(self.max_wait, self._dispatch, digest)
+            self._pending[digest] = batch
+
+        future = loop.create_future()
+        batch.items.append((encrypted_data, future, loop.time()))
+        if len(batch.items) >= self.target_batch_size():
+            self._dispatch(digest)
+        return await future
+
+    def _dispatch(self, digest):
+        """
+        Submit the pending batch of a key set to the worker pool, recording its metrics.
+        """
+        batch = self._pending.pop(digest, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+
+        now = asyncio.get_running_loop().time()
+        queueing_seconds = [now - enqueued_at for _, _, enqueued_at in batch.items]
+        self._stats.record(
+            len(batch.items) / self.target_batch_size(), queueing_seconds
+        )
+
+        task = asyncio.create_task(self._run_batch(batch))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def _run_batch(self, batch):
+        """
+        Run a batch in the worker pool and hand each request its result.
+        """
+        futures = [future for _, future, _ in batch.items]
+        try:
+            results = await self._fhe_pool.run_batch(
+                [encrypted_data for encrypted_data, _, _ in batch.items],
+                batch.serialized_evaluation_keys,
+            )
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            results = [(None, str(error))] * len(futures)
+
+        for future, (encrypted_result, error) in zip(futures, results):
+            # The request may have been cancelled, e.g. by a client disconnection
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(encrypted_result)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def stats(self):
+        """
+        Return the batching metrics since the start of the server.
+
+        Returns:
+            dict: The number of batches and of requests dispatched, the mean batch size, the
+            mean fill rate (batch size over target size when dispatched), the mean and maximum
+            time in milliseconds requests waited for their batch, and the number of requests
+            waiting now.
+        """
+        return {
+            **self._stats.summary(),
+            "pending": sum(len(batch.items) for batch in self._pending.values()),
+        }
@@ -0,0 +1,89 @@
+"""
+Cache of the compiled FHE circuit of the server.
+
+The server.zip saved by `FHEModelDev` holds the MLIR code of the circuit, which
+`FHEModelServer.load` compiles again on every load: in every worker process and on every restart
+of the server. This module compiles it once and saves the compiled circuit in a cache directory,
+in an entry keyed by the hash of server.zip and the versions of Concrete, so that the workers
+load the compiled circuit directly. A retrained model or an upgrade of Concrete gets a new entry.
+
+Functions:
+    - circuit_cache_key: Computes the cache key of a server.zip file.
+    - prepare_compiled_circuit: Returns the cache entry of a model, compiling it on a miss.
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from importlib.metadata import version
+
+from concrete.ml.deployment import FHEModelServer
+
+
+def circuit_cache_key(server_zip_path):
+    """
+    Compute the cache key of the compiled circuit of a server.zip file.
+
+    The compiled circuit depends on the compiler, and concrete-ml refuses to load it with other
+    versions of Concrete or Python: they are part of the key.
+
+    Args:
+        server_zip_path (str): Path of the server.zip file saved by `FHEModelDev`.
+
+    Returns:
+        str: The SHA-256 hex digest of the content of the file and of the versions.
+    """
+    sha256 = hashlib.sha256()
+    with open(server_zip_path, "rb") as file_handler:
+        for block in iter(lambda: file_handler.read(1 << 20), b""):
+            sha256.update(block)
+    versions = (
+        f"concrete-python={version('concrete-python')};"
+        f"concrete-ml={version('concrete-ml')};"
+        f"python={sys.version_info.major}.{sys.version_info.minor}"
+    )
+    sha256.update(versions.encode("utf-8"))
+    return sha256.hexdigest()
+
+
+def prepare_compiled_circuit(path_dir, cache_dir):
+    """
+    Return the cache entry holding the compiled circuit of a model, compiling it on a miss.
+
+    Args:
+        path_dir (str): Directory containing the FHE deployment files (server.zip).
+        cache_dir (str): Root directory of the cache, holding one entry per key.
+
+    Returns:
+        str: Directory holding the compiled server.zip, to use as the `path_dir` of an
+        `FHEModelServer`.
+    """
+    server_zip_path = os.path.join(path_dir, "server.zip")
+    entry_dir = os.path.join(cache_dir, circuit_cache_key(server_zip_path))
+    if os.path.exists(entry_dir):
+        return entry_dir
+
+    server = FHEModelServer(path_dir=path_dir)
+    server.load()
+
+    # Fill the entry in a temporary directory renamed at the end, so that a concurrent
+    # server never loads a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+    compiled_zip_path = os.path.join(tmp_dir, "server.zip")
+    server.server.save(compiled_zip_path, via_mlir=False)
+    # Keep the versions file, checked by `FHEModelServer.load`
+    with zipfile.ZipFile(server_zip_path) as source, zipfile.ZipFile(
+        compiled_zip_path, "a"
+    ) as target:
+        target.writestr("versions.json", source.read("versions.json"))
+
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another server filled the entry in the meantime
+        shutil.rmtree(tmp_dir)
+    return entry_dir
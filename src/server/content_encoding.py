@@ -0,0 +1,205 @@
+"""
+Negotiated compression of the request and response bodies of the FHE server.
+
+Ciphertexts and evaluation keys travel between data centers, where bandwidth is scarcer than CPU
+time. A client may compress a request body with one of the codecs of the server (see
+`src.library.compression`), naming it in the Content-Encoding header: the server decompresses it,
+off the event loop, before the endpoint reads it, and answers 415 if it does not support the
+codec. Every response advertises the codecs the server accepts in its Accept-Encoding header, so
+that clients learn which one to use. In the other direction, response bodies of at least
+`min_size` bytes are compressed with the preferred codec of the Accept-Encoding header of the
+request, if any, and sent uncompressed when compression does not make them smaller.
+
+The compression ratio and CPU time of each body are recorded in the metrics of the server, and
+the durations of the decompress and compress stages are added to the Server-Timing header.
+
+Classes:
+    - ContentEncoding: The codecs of the server, decoding requests and encoding responses.
+    - CompressedRequest: A request whose body is decompressed.
+    - CompressedRoute: The route class applying the content encoding of the application.
+"""
+
+import asyncio
+import time
+
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
+
+from src.library.compression import IDENTITY, compress, decompress, negotiate
+from src.server.metrics import (
+    COMPRESSION_CPU_SECONDS,
+    COMPRESSION_RATIO,
+    STAGE_SECONDS,
+)
+
+
+class ContentEncoding:
+    """
+    The codecs of the server, decoding the request bodies and encoding the response bodies.
+
+    Attributes:
+        codecs (dict): The level of each codec by name (None for the default level), in order of
+            preference.
+        min_size (int): The minimum size of the response bodies to compress, in bytes.
+        max_size (int): The maximum size of a decompressed request body, in bytes.
+    """
+
+    def __init__(self, codecs, min_size, max_size):
+        self.codecs = codecs
+        self.min_size = min_size
+        self.max_size = max_size
+
+    @property
+    def accept_encoding(self):
+        """
+        The value of the Accept-Encoding header advertising the codecs of the server.
+        """
+        return ", ".join([*self.codecs, IDENTITY])
+
+    async def decode(self, body, codec, timings):
+        """
+        Decompress a request body, in a thread.
+
+        Args:
+            body (bytes): The compressed body.
+            codec (str): The codec of the Content-Encoding header of the request.
+            timings (dict): Dictionary in which the duration is stored, under "decompress".
+
+        Returns:
+            bytes: The decompressed body.
+
+        Raises:
+            HTTPException: 415 if the server does not support the codec, 400 if the body is not
+                valid for the codec or expands beyond `max_size`.
+        """
+        if codec not in self.codecs:
+            raise HTTPException(
+                status_code=415,
+                detail=f"Unsupported Content-Encoding '{codec}'",
+                headers={"Accept-Encoding": self.accept_encoding},
+            )
+        start = time.perf_counter()
+        try:
+            data, cpu_seconds = await asyncio.to_thread(
+                decompress, body, codec, self.max_size
+            )
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error)) from error
+        timings["decompress"] = time.perf_counter() - start
+        STAGE_SECONDS.labels("decompress").observe(timings["decompress"])
+        COMPRESSION_RATIO.labels(codec, "request").observe(
+            len(data) / max(len(body), 1)
+        )
+        COMPRESSION_CPU_SECONDS.labels(codec, "request").inc(cpu_seconds)
+        return data
+
+    async def encode(self, request, response, timings):
+        """
+        Compress a response body with the codec negotiated with the request, in a thread, and
+        add the durations of the stages of the content encoding to its Server-Timing header.
+
+        Args:
+            request (Request): The request, whose Accept-Encoding header lists the codecs of the
+                client.
+            response (Response): The response of the endpoint.
+            timings (dict): The durations of the content encoding stages of the request, in
+                seconds, to which the duration of the compression is added.
+
+        Returns:
+            Response: The response, with its Content-Encoding header set if its body was
+            compressed.
+        """
+        response.headers["Accept-Encoding"] = self.accept_encoding
+        body = getattr(response, "body", None)
+        codec = negotiate(request.headers.get("Accept-Encoding"), self.codecs)
+        if body is not None and "Content-Encoding" not in response.headers:
+            response.headers["Vary"] = "Accept-Encoding"
+            if codec is not None and len(body) >= self.min_size:
+                start = time.perf_counter()
+                compressed, cpu_seconds = await asyncio.to_thread(
+                    compress, body, codec, self.codecs[codec]
+                )
+                timings["compress"] = time.perf_counter() - start
+                STAGE_SECONDS.labels("compress").observe(timings["compress"])
+                COMPRESSION_RATIO.labels(codec, "response").observe(
+                    len(body) / len(compressed)
+                )
+                COMPRESSION_CPU_SECONDS.labels(codec, "response").inc(cpu_seconds)
+                if len(compressed) < len(body):
+                    response.body = compressed
+                    response.headers["Content-Length"] = str(len(compressed))
+                    response.headers["Content-Encoding"] = codec
+
+        if timings:
+            server_timing = ", ".join(
+                f"{stage};dur={seconds * 1000:.3f}"
+                for stage, seconds in timings.items()
+            )
+            if "Server-Timing" in response.headers:
+                server_timing = f"{response.headers['Server-Timing']}, {server_timing}"
+            response.headers["Server-Timing"] = server_timing
+        return response
+
+
+class CompressedRequest(Request):
+    """
+    A request whose body is decompressed according to its Content-Encoding header.
+
+    Attributes:
+        timings (dict): The duration of the decompression of the body, under "decompress".
+    """
+
+    def __init__(self, scope, receive, content_encoding):
+        super().__init__(scope, receive)
+        self.content_encoding = content_encoding
+        self.timings = {}
+
+    async def body(self):
+        """
+        Return the body of the request, decompressed.
+
+        Returns:
+            bytes: The body.
+
+        Raises:
+            HTTPException: If the body cannot be decompressed, see `ContentEncoding.decode`.
+        """
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            codec = self.headers.get("Content-Encoding", IDENTITY).strip().lower()
+            if codec != IDENTITY:
+                body = await self.content_encoding.decode(body, codec, self.timings)
+            self._body = body  # pylint: disable=attribute-defined-outside-init
+        return self._body
+
+
+class CompressedRoute(APIRoute):
+    """
+    Route class applying the content encoding of the application, `app.state.content_encoding`,
+    to the requests and responses of its endpoints. Routes of applications without one are left
+    unchanged.
+    """
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+
+        async def compressed_route_handler(request):
+            content_encoding = getattr(request.app.state, "content_encoding", None)
+            if content_encoding is None:
+                return await route_handler(request)
+            request = CompressedRequest(
+                request.scope, request.receive, content_encoding
+            )
+            try:
+                response = await route_handler(request)
+            except HTTPException as error:
+                # Error responses advertise the codecs too, e.g. the 404 telling a client to
+                # upload its keys
+                error.headers = {
+                    "Accept-Encoding": content_encoding.accept_encoding,
+                    **(error.headers or {}),
+                }
+                raise
+            return await content_encoding.encode(request, response, request.timings)
+
+        return compressed_route_handler
@@ -0,0 +1,289 @@
+"""
+Worker pool running FHE inferences outside of the server event loop.
+
+``FHEModelServer.run`` is CPU-bound and takes seconds per call. Calling it from an
+``async`` endpoint blocks uvicorn's event loop, so no other request (key uploads,
+``/docs``, other predictions) is served while it runs. This module dispatches the
+computation to a pool of worker processes, each holding its own loaded
+``FHEModelServer``, so that N cores serve N inferences at once.
+
+Classes:
+    - FHEWorkerPool: Process pool executing ``FHEModelServer.run`` calls asynchronously.
+
+Functions:
+    - make_warm_up_sample: Builds an encrypted input and evaluation keys to warm the pool up.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from concrete.ml.deployment import FHEModelClient, FHEModelServer
+
+from src.library.process_pool import spawn_executor
+
+# FHE model loaded once in each worker process by `_init_worker`
+_SERVER = None
+
+
+def _init_worker(path_dir):
+    """
+    Load the FHE model in a freshly started worker process.
+
+    Args:
+        path_dir (str): Directory containing the FHE deployment files (server.zip).
+    """
+    global _SERVER  # pylint: disable=global-statement
+    _SERVER = FHEModelServer(path_dir=path_dir)
+    _SERVER.load()
+
+
+def _run(encrypted_data, serialized_evaluation_keys):
+    """
+    Run the FHE model on one encrypted input, inside a worker process.
+
+    Args:
+        encrypted_data (bytes): The serialized encrypted input.
+        serialized_evaluation_keys (bytes): The serialized evaluation keys of the client.
+
+    Returns:
+        bytes: The serialized encrypted prediction.
+    """
+    return _SERVER.run(
+        encrypted_data, serialized_evaluation_keys=serialized_evaluation_keys
+    )
+
+
+def _warm_up(sample):
+    """
+    Make sure a worker process is started and has loaded the FHE model, optionally running
+    one inference.
+
+    Args:
+        sample (tuple, optional): An `(encrypted_data, serialized_evaluation_keys)` pair to run
+            the FHE model on.
+
+    Returns:
+        int: The process id of the worker.
+    """
+    if sample is not None:
+        _run(*sample)
+    else:
+        # Hold the worker briefly, so that the other warm-up tasks go to other workers
+        time.sleep(0.1)
+    return os.getpid()
+
+
+def make_warm_up_sample(path_dir):
+    """
+    Build an encrypted input and the matching evaluation keys, with throwaway keys.
+
+    Args:
+        path_dir (str): Directory containing the FHE deployment files (client.zip).
+
+    Returns:
+        tuple: An `(encrypted_data, serialized_evaluation_keys)` pair for `FHEWorkerPool.warm_up`.
+    """
+    with tempfile.TemporaryDirectory() as key_dir:
+        client = FHEModelClient(path_dir=path_dir, key_dir=key_dir)
+        serialized_evaluation_keys = client.get_serialized_evaluation_keys()
+        n_features = len(client.model.input_quantizers)
+        encrypted_data = client.quantize_encrypt_serialize(np.zeros((1, n_features)))
+    return encrypted_data, serialized_evaluation_keys
+
+
+def _run_batch(encrypted_inputs, serialized_evaluation_keys):
+    """
+    Run the FHE model on several encrypted inputs, inside a worker process.
+
+    A failing input does not abort the others: each input gets either a result or an
+    error message.
+
+    Args:
+        encrypted_inputs (list of bytes): The serialized encrypted inputs.
+        serialized_evaluation_keys (bytes): The serialized evaluation keys of the client.
+
+    Returns:
+        list of tuple: One `(encrypted_prediction, error)` pair per input, where exactly one
+        of the two elements is None.
+    """
+    results = []
+    for encrypted_data in encrypted_inputs:
+        try:
+            results.append((_run(encrypted_data, serialized_evaluation_keys), None))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            results.append((None, str(error)))
+    return results
+
+
+class FHEWorkerPool:
+    """
+    Pool of worker processes executing FHE inferences.
+
+    Every worker loads the FHE model once when it starts. Calls to `run` are awaited
+    from the event loop while the computation happens in a worker, and the pool keeps
+    track of how many calls are in flight and how many are waiting for a free worker.
+    If a worker dies (e.g. killed when running out of memory), the calls it was running
+    fail and the workers are restarted for the following calls.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        in_flight (int): Number of inferences submitted and not yet completed.
+    """
+
+    def __init__(self, path_dir, workers=None):
+        """
+        Start the worker pool.
+
+        Args:
+            path_dir (str): Directory containing the FHE deployment files.
+            workers (int, optional): Number of worker processes. Defaults to the number
+                of CPUs of the machine.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.in_flight = 0
+        self._path_dir = path_dir
+        self._executor = self._start_executor()
+
+    def _start_executor(self):
+        return spawn_executor(self.workers, _init_worker, (self._path_dir,))
+
+    def _restart_broken_executor(self, executor):
+        """
+        Replace an executor broken by the death of one of its workers, unless another
+        call already replaced it.
+        """
+        if self._executor is executor:
+            self._executor = self._start_executor()
+            executor.shutdown(wait=False)
+
+    @property
+    def queue_depth(self):
+        """
+        int: Number of inferences waiting for a free worker.
+        """
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, encrypted_data, serialized_evaluation_keys):
+        """
+        Run the FHE model on one encrypted input in a worker process.
+
+        Args:
+            encrypted_data (bytes): The serialized encrypted input.
+            serialized_evaluation_keys (bytes): The serialized evaluation keys.
+
+        Returns:
+            bytes: The serialized encrypted prediction.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(
+                executor, _run, encrypted_data, serialized_evaluation_keys
+            )
+        except BrokenProcessPool:
+            self._restart_broken_executor(executor)
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def run_batch(self, encrypted_inputs, serialized_evaluation_keys):
+        """
+        Run the FHE model on several encrypted inputs across the worker processes.
+
+        The inputs are split into one chunk per worker, so that the evaluation keys are
+        sent once per chunk instead of once per input.
+
+        Args:
+            encrypted_inputs (list of bytes): The serialized encrypted inputs.
+            serialized_evaluation_keys (bytes): The serialized evaluation keys.
+
+        Returns:
+            list of tuple: One `(encrypted_prediction, error)` pair per input, in the order
+            of the inputs, where exactly one of the two elements is None.
+        """
+        if not encrypted_inputs:
+            return []
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        chunk_size = -(-len(encrypted_inputs) // self.workers)
+        chunks = []
+        for start in range(0, len(encrypted_inputs), chunk_size):
+            end = start + chunk_size
+            chunks.append(encrypted_inputs[start:end])
+        self.in_flight += len(encrypted_inputs)
+        try:
+            chunk_results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        executor, _run_batch, chunk, serialized_evaluation_keys
+                    )
+                    for chunk in chunks
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            self.in_flight -= len(encrypted_inputs)
+
+        if any(isinstance(result, BrokenProcessPool) for result in chunk_results):
+            self._restart_broken_executor(executor)
+
+        results = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, Exception):
+                # The whole chunk failed (e.g. its worker died): report it on each input
+                chunk_result = [(None, str(chunk_result))] * len(chunk)
+            results.extend(chunk_result)
+        return results
+
+    async def warm_up(self, sample=None):
+        """
+        Start all the worker processes and wait until each one has loaded the FHE model.
+
+        Worker processes are otherwise started on demand, so that the first requests would
+        wait for them.
+
+        Args:
+            sample (tuple, optional): An `(encrypted_data, serialized_evaluation_keys)` pair
+                (see `make_warm_up_sample`) on which each worker runs one inference.
+
+        Returns:
+            int: The number of distinct worker processes that were warmed up.
+        """
+        loop = asyncio.get_running_loop()
+        # A worker that starts first may take several tasks while the others are still
+        # loading the model: submit tasks until every worker has run one
+        pids = set()
+        while len(pids) < self.workers:
+            pids.update(
+                await asyncio.gather(
+                    *(
+                        loop.run_in_executor(self._executor, _warm_up, sample)
+                        for _ in range(self.workers - len(pids))
+                    )
+                )
+            )
+        return len(pids)
+
+    def stats(self):
+        """
+        Return the current load of the pool.
+
+        Returns:
+            dict: The number of workers, of in-flight inferences and the queue depth.
+        """
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    def shutdown(self):
+        """
+        Wait for the in-flight inferences and stop the worker processes.
+        """
+        self._executor.shutdown(wait=True)
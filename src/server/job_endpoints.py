@@ -0,0 +1,186 @@
+"""
+Job endpoints of the FHE server.
+
+Inferences can be submitted as jobs (see `src.server.job_queue`): POST /jobs answers 202 with a
+job id at once, and the client fetches the result later, long-polling it with the `wait` query
+parameter (at most JOB_MAX_WAIT seconds, 30 by default), so that no request stays open for a
+whole inference. Jobs have a priority class, "realtime" (the default, e.g. card authorizations)
+or "batch" (e.g. back-scoring), and a full class rejects submissions with 429 and a Retry-After
+header.
+
+Endpoints:
+    - /jobs: Queues an encrypted input (raw bytes) as an FHE inference job.
+    - /jobs/{job_id}: Reports the state of a job.
+    - /jobs/{job_id}/result: Returns the encrypted prediction of a job.
+"""
+
+import os
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+from src.server.content_encoding import CompressedRoute
+from src.server.job_queue import JobQueue, QueueFullError
+from src.server.model_registry import ModelRegistry
+from src.server.routing import (
+    DEFAULT_CLIENT_ID,
+    OCTET_STREAM_BODY,
+    format_server_timing,
+    get_jobs,
+    get_models,
+    get_served_model,
+)
+
+# Longest wait of a long poll, in seconds
+JOB_MAX_WAIT = float(os.environ.get("JOB_MAX_WAIT", "30"))
+
+router = APIRouter(route_class=CompressedRoute)
+
+
+def get_job(jobs, job_id):
+    """
+    Return a job of the job queue.
+
+    Args:
+        jobs (JobQueue): The job queue.
+        job_id (str): The id of the job.
+
+    Returns:
+        Job: The job.
+
+    Raises:
+        HTTPException: 404 if no job has this id, or it expired.
+    """
+    try:
+        return jobs.get(job_id)
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown job '{job_id}'"
+        ) from error
+
+
+@router.post("/jobs", status_code=202, openapi_extra=OCTET_STREAM_BODY)
+async def submit_job(  # pylint: disable=too-many-arguments
+    request: Request,
+    response: Response,
+    client_id: str = DEFAULT_CLIENT_ID,
+    model: Optional[str] = None,
+    priority: Literal["realtime", "batch"] = "realtime",
+    *,
+    models: ModelRegistry = Depends(get_models),
+    jobs: JobQueue = Depends(get_jobs),
+):
+    """
+    Jobs endpoint: Queues an encrypted input as an FHE inference job, answering at once.
+
+    The request body is the serialized encrypted input, as application/octet-stream. The job
+    runs when its turn comes: queued realtime jobs start before batch jobs, and the clients with
+    queued jobs of a class take turns.
+
+    Args:
+        request (Request): The request whose body is the serialized encrypted input.
+        response (Response): The response, to which the Location header of the job is added.
+        client_id (str): The id under which the client uploaded its evaluation keys, passed as a
+            query parameter.
+        model (str): The name of the served model to run, passed as a query parameter.
+        priority (str): The priority class of the job, "realtime" or "batch", passed as a query
+            parameter.
+        models (ModelRegistry): The served models.
+        jobs (JobQueue): The job queue.
+
+    Returns:
+        dict: The state of the queued job, with its id under "job_id" (see `Job.describe`).
+
+    Raises:
+        HTTPException: 400 if the request body is empty, 404 if the client never uploaded
+            evaluation keys, 404 or 503 if the model is not served, 429 with a Retry-After
+            header if the queue of the priority class is full.
+    """
+    served_model = get_served_model(models, model)
+    if client_id not in served_model.key_registry:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No evaluation keys for client '{client_id}', upload them first",
+        )
+    encrypted_data = await request.body()
+    if not encrypted_data:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    try:
+        job = jobs.submit(client_id, model, priority, encrypted_data)
+    except QueueFullError as error:
+        raise HTTPException(
+            status_code=429,
+            detail=str(error),
+            headers={"Retry-After": str(error.retry_after)},
+        ) from error
+    response.headers["Location"] = f"/jobs/{job.job_id}"
+    return job.describe()
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = 0, jobs: JobQueue = Depends(get_jobs)):
+    """
+    Job endpoint: Reports the state of a job, long-polling until it finishes if asked to.
+
+    Args:
+        job_id (str): The id of the job.
+        wait (float): Time in seconds to wait for the job to finish before answering, at most
+            JOB_MAX_WAIT, passed as a query parameter.
+        jobs (JobQueue): The job queue.
+
+    Returns:
+        dict: The state of the job (see `Job.describe`).
+
+    Raises:
+        HTTPException: 404 if no job has this id.
+    """
+    job = get_job(jobs, job_id)
+    await jobs.wait(job, min(max(wait, 0), JOB_MAX_WAIT))
+    return job.describe()
+
+
+@router.get(
+    "/jobs/{job_id}/result",
+    response_class=Response,
+    responses={200: {"content": {"application/octet-stream": {}}}},
+)
+async def job_result(job_id: str, wait: float = 0, jobs: JobQueue = Depends(get_jobs)):
+    """
+    Job result endpoint: Returns the encrypted prediction of a job, long-polling until it
+    finishes if asked to.
+
+    Args:
+        job_id (str): The id of the job.
+        wait (float): Time in seconds to wait for the job to finish before answering, at most
+            JOB_MAX_WAIT, passed as a query parameter.
+        jobs (JobQueue): The job queue.
+
+    Returns:
+        Response: The serialized encrypted prediction, as application/octet-stream, with the
+        durations of the queue and run stages in its Server-Timing header and the name and
+        version of the model that ran in its X-Model and X-Model-Version headers, or with
+        status 202 the state of the job (see `Job.describe`) if it is not finished.
+
+    Raises:
+        HTTPException: 404 if no job has this id, 500 if the job failed.
+    """
+    job = get_job(jobs, job_id)
+    if not await jobs.wait(job, min(max(wait, 0), JOB_MAX_WAIT)):
+        return JSONResponse(status_code=202, content=job.describe())
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    timings = {
+        "queue": job.started_at - job.submitted_at,
+        "run": job.finished_at - job.started_at,
+    }
+    return Response(
+        content=job.encrypted_result,
+        media_type="application/octet-stream",
+        headers={
+            "Server-Timing": format_server_timing(timings),
+            "X-Execution-Mode": "execute",
+            "X-Model": job.details["model"],
+            "X-Model-Version": str(job.details["model_version"]),
+        },
+    )
@@ -0,0 +1,402 @@
+"""
+Asynchronous FHE inference jobs, with admission control and fair scheduling.
+
+An FHE inference lasts long enough under load that holding an HTTP request open for it runs into
+client timeouts, and without admission control an overload only piles up connections. Instead,
+a client submits an encrypted input as a job, gets a job id back at once, and fetches or
+long-polls the result later.
+
+Jobs wait in a bounded queue per priority class: a submission to a full class is rejected with
+a `QueueFullError` carrying an estimate of the time until the class drains enough to accept
+it, which the server turns into a 429 with a Retry-After header. A fixed number of runners take
+the queued jobs one at a time and run them:
+
+    - Priority classes are served strictly in order: a "realtime" job (e.g. a card
+      authorization) always starts before any queued "batch" job (e.g. back-scoring), and the
+      batch backlog never fills the queue of the realtime class.
+    - Within a class, the tenants (the client ids) with queued jobs take turns, one job each, so
+      that a tenant submitting thousands of jobs does not hold back the others.
+
+Finished jobs are kept with their result for `result_ttl` seconds, then forgotten, and at most
+`max_finished` of them are kept, the oldest ones being forgotten first.
+
+Classes:
+    - QueueFullError: Raised when submitting a job to a full priority class.
+    - Job: An FHE inference job and its state.
+    - JobScheduler: The queued jobs, in the order the runners take them.
+    - JobQueue: The bounded job queue and its runners.
+"""
+
+import asyncio
+import math
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from src.server.metrics import JOB_QUEUE_DEPTH, JOB_QUEUEING_SECONDS, JOBS_REJECTED
+
+# Priority classes, from the first served to the last
+PRIORITIES = ("realtime", "batch")
+# Weight of the last job in the moving average of the duration of the jobs
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class QueueFullError(Exception):
+    """
+    Raised when submitting a job to a priority class whose queue is full.
+
+    Attributes:
+        retry_after (int): Estimated time in seconds before the class accepts a job again.
+    """
+
+    def __init__(self, priority, retry_after):
+        super().__init__(f"The queue of {priority} jobs is full")
+        self.retry_after = retry_after
+
+
+class Job:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    An FHE inference job and its state.
+
+    Attributes:
+        job_id (str): The id of the job.
+        tenant (str): The client id of the job, whose evaluation keys it runs with.
+        model (str): The name of the served model to run, None for the default model.
+        priority (str): The priority class of the job.
+        encrypted_data (bytes): The serialized encrypted input, dropped once the job ran.
+        status (str): "queued", "running", "done" or "failed".
+        encrypted_result (bytes): The serialized encrypted prediction, once done.
+        error (str): Why the job failed, if it did.
+        details (dict): Fields describing the run, e.g. the model that ran, once finished.
+        submitted_at (float): `time.monotonic()` value at the submission.
+        started_at (float): `time.monotonic()` value when a runner took the job.
+        finished_at (float): `time.monotonic()` value when the job finished.
+        finished (asyncio.Event): Set once the job is done or failed.
+    """
+
+    def __init__(self, tenant, model, priority, encrypted_data):
+        self.job_id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.model = model
+        self.priority = priority
+        self.encrypted_data = encrypted_data
+        self.status = "queued"
+        self.encrypted_result = None
+        self.error = None
+        self.details = {}
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = asyncio.Event()
+
+    def describe(self):
+        """
+        Return the state of the job.
+
+        Returns:
+            dict: The id, status, priority class and client id of the job, the time in seconds
+            it waited in the queue ("queued_seconds") and ran ("run_seconds") so far, the
+            fields of `details`, and the error of a failed job.
+        """
+        now = time.monotonic()
+        description = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "priority": self.priority,
+            "client_id": self.tenant,
+            "queued_seconds": (self.started_at or now) - self.submitted_at,
+            "run_seconds": (
+                (self.finished_at or now) - self.started_at if self.started_at else 0.0
+            ),
+            **self.details,
+        }
+        if self.error is not None:
+            description["error"] = self.error
+        return description
+
+
+class JobScheduler:
+    """
+    The queued jobs, by priority class and tenant, in the order the runners take them.
+
+    Jobs of a higher priority class are always taken first. Within a class, the tenants with
+    queued jobs take turns, one job each, in the order they first had a job queued; the jobs of
+    a tenant are taken in submission order.
+    """
+
+    def __init__(self):
+        # priority class -> tenant -> queued jobs, tenants in their turn order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._depths = dict.fromkeys(PRIORITIES, 0)
+
+    def __len__(self):
+        return sum(self._depths.values())
+
+    def depth(self, priority):
+        """
+        Return the number of queued jobs of a priority class.
+
+        Args:
+            priority (str): The priority class.
+
+        Returns:
+            int: The number of jobs.
+        """
+        return self._depths[priority]
+
+    def push(self, job):
+        """
+        Queue a job, after the jobs of its tenant.
+
+        Args:
+            job (Job): The job.
+        """
+        self._queues[job.priority].setdefault(job.tenant, deque()).append(job)
+        self._depths[job.priority] += 1
+
+    def pop(self):
+        """
+        Take the next job: the next one of the tenant whose turn it is, in the highest priority
+        class with queued jobs.
+
+        Returns:
+            Job: The job, or None if no job is queued.
+        """
+        for priority, tenants in self._queues.items():
+            if not tenants:
+                continue
+            tenant, jobs = next(iter(tenants.items()))
+            job = jobs.popleft()
+            if jobs:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            self._depths[priority] -= 1
+            return job
+        return None
+
+
+class JobQueue:  # pylint: disable=too-many-instance-attributes
+    """
+    The bounded queue of FHE inference jobs, and the runners running them.
+
+    The queue must be used from the event loop of the server.
+
+    Attributes:
+        max_queued (int): Maximum number of queued jobs per priority class.
+        concurrency (int): Number of jobs running at once.
+        result_ttl (float): Time in seconds a finished job is kept with its result.
+        max_finished (int): Maximum number of finished jobs kept.
+        jobs (dict): The queued, running and finished jobs, by id.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, run_job, max_queued, concurrency, result_ttl, *, max_finished=10000
+    ):
+        """
+        Create the queue, without starting its runners.
+
+        Args:
+            run_job (Callable): Coroutine function running a job, returning the serialized
+                encrypted prediction and the fields describing the run (see `Job.details`),
+                and raising an exception if the job failed.
+            max_queued (int): Maximum number of queued jobs per priority class.
+            concurrency (int): Number of jobs running at once.
+            result_ttl (float): Time in seconds a finished job is kept with its result.
+            max_finished (int): Maximum number of finished jobs kept.
+        """
+        self.max_queued = max_queued
+        self.concurrency = max(1, concurrency)
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self.jobs = {}
+        # Finished jobs, in the order they finished, which is the order they expire in
+        self._finished = deque()
+        self._run_job = run_job
+        self._scheduler = JobScheduler()
+        # Released once per queued job, acquired by the runner taking it
+        self._queued = asyncio.Semaphore(0)
+        self._runners = []
+        self._running = 0
+        self._rejected = 0
+        # Moving average of the duration of the jobs, None before the first one
+        self._service_seconds = None
+
+    def start(self):
+        """
+        Start the runners.
+        """
+        self._runners = [
+            asyncio.create_task(self._runner()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        """
+        Stop the runners, abandoning the running jobs.
+        """
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+
+    def submit(self, tenant, model, priority, encrypted_data):
+        """
+        Queue a job.
+
+        Args:
+            tenant (str): The client id of the job.
+            model (str): The name of the served model to run, None for the default model.
+            priority (str): The priority class of the job, one of `PRIORITIES`.
+            encrypted_data (bytes): The serialized encrypted input.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            ValueError: If the priority class is unknown.
+            QueueFullError: If the queue of the priority class is full.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(
+                f"Unknown priority '{priority}', expected one of {list(PRIORITIES)}"
+            )
+        self.purge()
+        if self._scheduler.depth(priority) >= self.max_queued:
+            self._rejected += 1
+            JOBS_REJECTED.labels(priority).inc()
+            raise QueueFullError(priority, self.retry_after(priority))
+
+        job = Job(tenant, model, priority, encrypted_data)
+        self.jobs[job.job_id] = job
+        self._scheduler.push(job)
+        JOB_QUEUE_DEPTH.labels(priority).set(self._scheduler.depth(priority))
+        self._queued.release()
+        return job
+
+    def get(self, job_id):
+        """
+        Return a job.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            Job: The job.
+
+        Raises:
+            KeyError: If no job has this id, or it finished more than `result_ttl` seconds ago.
+        """
+        self.purge()
+        return self.jobs[job_id]
+
+    async def wait(self, job, timeout):
+        """
+        Wait for a job to finish, for at most a given time.
+
+        Args:
+            job (Job): The job.
+            timeout (float): Maximum time to wait, in seconds.
+
+        Returns:
+            bool: Whether the job is finished.
+        """
+        if job.finished.is_set() or timeout <= 0:
+            return job.finished.is_set()
+        try:
+            await asyncio.wait_for(job.finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job.finished.is_set()
+
+    def retry_after(self, priority):
+        """
+        Estimate the time until a job of a priority class could start, from the jobs queued
+        ahead of it and the mean duration of the jobs.
+
+        Args:
+            priority (str): The priority class.
+
+        Returns:
+            int: The estimate, in whole seconds, at least 1.
+        """
+        end = PRIORITIES.index(priority) + 1
+        ahead = sum(
+            self._scheduler.depth(ahead_class) for ahead_class in PRIORITIES[:end]
+        )
+        service_seconds = self._service_seconds or 1.0
+        return max(1, math.ceil(ahead * service_seconds / self.concurrency))
+
+    def purge(self):
+        """
+        Forget the jobs finished more than `result_ttl` seconds ago, and the oldest finished
+        jobs beyond `max_finished`.
+
+        Returns:
+            int: The number of jobs forgotten.
+        """
+        deadline = time.monotonic() - self.result_ttl
+        purged = 0
+        while self._finished:
+            expired = self._finished[0].finished_at < deadline
+            if not expired and len(self._finished) <= self.max_finished:
+                break
+            del self.jobs[self._finished.popleft().job_id]
+            purged += 1
+        return purged
+
+    async def _runner(self):
+        """
+        Run the queued jobs, one at a time, in the order of the scheduler.
+        """
+        while True:
+            await self._queued.acquire()
+            job = self._scheduler.pop()
+            JOB_QUEUE_DEPTH.labels(job.priority).set(
+                self._scheduler.depth(job.priority)
+            )
+            job.status = "running"
+            job.started_at = time.monotonic()
+            JOB_QUEUEING_SECONDS.labels(job.priority).observe(
+                job.started_at - job.submitted_at
+            )
+            self._running += 1
+            try:
+                job.encrypted_result, job.details = await self._run_job(job)
+                job.status = "done"
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                job.error = str(error) or type(error).__name__
+                job.status = "failed"
+            finally:
+                self._running -= 1
+                job.finished_at = time.monotonic()
+                job.encrypted_data = None
+                job.finished.set()
+                self._finished.append(job)
+                self.purge()
+
+            seconds = job.finished_at - job.started_at
+            if self._service_seconds is None:
+                self._service_seconds = seconds
+            else:
+                self._service_seconds += SERVICE_TIME_SMOOTHING * (
+                    seconds - self._service_seconds
+                )
+
+    def stats(self):
+        """
+        Return the state of the queue.
+
+        Returns:
+            dict: The number of queued jobs by priority class ("queued"), of running jobs, of
+            jobs kept ("jobs"), of rejected submissions since the start of the server, and the
+            mean duration of the jobs in seconds ("mean_run_seconds", None before the first
+            one).
+        """
+        return {
+            "queued": {
+                priority: self._scheduler.depth(priority) for priority in PRIORITIES
+            },
+            "running": self._running,
+            "jobs": len(self.jobs),
+            "rejected": self._rejected,
+            "mean_run_seconds": self._service_seconds,
+        }
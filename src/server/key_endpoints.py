@@ -0,0 +1,409 @@
+"""
+Evaluation key endpoints of the FHE server.
+
+Each client uploads its own evaluation keys under a client id and names it in its prediction
+requests (see `src.server.key_registry`). A client holding keys the server already stored binds
+them by their digest instead of uploading them again, and large key sets are uploaded in parts,
+so that an interrupted upload resumes where it stopped (see `src.server.key_uploads`). The key
+endpoints do not wait for the models to load: clients can send their keys as soon as the server
+is up.
+
+Endpoints:
+    - /evaluation_keys: Accepts serialized evaluation keys in hex-encoded format and stores them
+        for later use, under the id of the client.
+    - /evaluation_keys_binary: Same as /evaluation_keys, with the keys sent as raw bytes.
+    - /bind_evaluation_keys: Registers already stored evaluation keys for a client by their
+        SHA-256 digest, sparing it a new upload.
+    - /evaluation_keys/uploads: Starts (POST) a chunked, resumable upload of evaluation keys,
+        whose parts are sent to (PUT) /evaluation_keys/uploads/{upload_id}/parts/{index} before
+        it is committed (POST .../commit) with the checksum of the keys.
+"""
+
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+
+from src.server.content_encoding import CompressedRoute
+from src.server.key_uploads import IncompleteUploadError
+from src.server.model_registry import ModelRegistry
+from src.server.routing import (
+    DEFAULT_CLIENT_ID,
+    OCTET_STREAM_BODY,
+    get_model_keys,
+    get_models,
+    timed,
+)
+
+router = APIRouter(route_class=CompressedRoute)
+
+
+class EvaluationKeysRequest(BaseModel):
+    """
+    Schema for evaluation_keys endpoint requests. Expects a hex-encoded string of the serialized
+    evaluation keys.
+
+    Attributes:
+        keys (str): The serialized evaluation keys in hex-encoded format.
+        client_id (str): The id of the client owning the keys.
+        model (str): The name of the served model the keys are for, the default model if None.
+    """
+
+    keys: str
+    client_id: str = DEFAULT_CLIENT_ID
+    model: Optional[str] = None
+
+
+class BindEvaluationKeysRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """
+    Schema for bind_evaluation_keys endpoint requests. Expects the digest of evaluation keys the
+    server may already hold.
+
+    Attributes:
+        digest (str): The SHA-256 hex digest of the serialized evaluation keys.
+        client_id (str): The id of the client owning the keys.
+        model (str): The name of the served model the keys are for, the default model if None.
+    """
+
+    digest: str
+    client_id: str = DEFAULT_CLIENT_ID
+    model: Optional[str] = None
+
+
+class StartKeyUploadRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """
+    Schema for the requests starting a chunked upload of evaluation keys. Expects the size and
+    digest of the serialized evaluation keys.
+
+    Attributes:
+        size (int): The size of the serialized evaluation keys, in bytes.
+        digest (str): The SHA-256 hex digest of the serialized evaluation keys.
+        client_id (str): The id of the client owning the keys.
+        model (str): The name of the served model the keys are for, the default model if None.
+    """
+
+    size: int
+    digest: str
+    client_id: str = DEFAULT_CLIENT_ID
+    model: Optional[str] = None
+
+
+class CommitKeyUploadRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """
+    Schema for the requests committing a chunked upload of evaluation keys. Expects the checksum
+    of the serialized evaluation keys.
+
+    Attributes:
+        digest (str): The SHA-256 hex digest of the serialized evaluation keys.
+    """
+
+    digest: str
+
+
+@router.post("/evaluation_keys")
+async def receive_evaluation_keys(
+    request: EvaluationKeysRequest, models: ModelRegistry = Depends(get_models)
+):
+    """
+    Evaluation_keys endpoint: Receives the serialized evaluation keys.
+
+    This endpoint accepts evaluation keys in hex-encoded format and stores them in the key
+    registry of the served model under the id of the client, for future use during its
+    predictions. Uploading keys identical to already stored ones does not store them a second
+    time.
+
+    Args:
+        request (EvaluationKeysRequest): The serialized evaluation keys as a hex-encoded string.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message indicating that the keys were successfully received and stored,
+        with the SHA-256 digest of the keys.
+    """
+    key_registry = get_model_keys(models, request.model).registry
+    digest = await store_evaluation_keys(
+        key_registry, request.client_id, bytes.fromhex(request.keys)
+    )
+    return {"status": "Keys received", "digest": digest}
+
+
+@router.post("/evaluation_keys_binary", openapi_extra=OCTET_STREAM_BODY)
+async def receive_evaluation_keys_binary(
+    request: Request,
+    client_id: str = DEFAULT_CLIENT_ID,
+    model: Optional[str] = None,
+    models: ModelRegistry = Depends(get_models),
+):
+    """
+    Evaluation_keys_binary endpoint: Same as /evaluation_keys, with raw bytes instead of
+    hex-encoded JSON.
+
+    Args:
+        request (Request): The request whose body is the serialized evaluation keys.
+        client_id (str): The id of the client owning the keys, passed as a query parameter.
+        model (str): The name of the served model the keys are for, passed as a query
+            parameter.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message indicating that the keys were successfully received and stored,
+        with the SHA-256 digest of the keys.
+
+    Raises:
+        HTTPException: 400 if the request body is empty.
+    """
+    key_registry = get_model_keys(models, model).registry
+    keys = await request.body()
+    if not keys:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    digest = await store_evaluation_keys(key_registry, client_id, keys)
+    return {"status": "Keys received", "digest": digest}
+
+
+@router.post("/bind_evaluation_keys")
+async def bind_evaluation_keys(
+    request: BindEvaluationKeysRequest, models: ModelRegistry = Depends(get_models)
+):
+    """
+    Bind_evaluation_keys endpoint: Registers already stored evaluation keys for a client.
+
+    A client whose keys did not change since a previous upload (e.g. restarting with keys from
+    its key cache) sends their digest instead of the keys themselves. If the registry holds keys
+    with this digest, they become the keys of the client and no upload is needed.
+
+    Args:
+        request (BindEvaluationKeysRequest): The digest of the keys and the id of the client.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message indicating that the keys were bound, with their digest.
+
+    Raises:
+        HTTPException: 404 if the registry holds no keys with this digest, in which case the
+            client must upload them.
+    """
+    key_registry = get_model_keys(models, request.model).registry
+    bound = await asyncio.to_thread(
+        key_registry.bind, request.client_id, request.digest
+    )
+    if not bound:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No evaluation keys with digest '{request.digest}', upload them",
+        )
+    return {"status": "Keys bound", "digest": request.digest}
+
+
+@router.post("/evaluation_keys/uploads")
+async def start_key_upload(
+    request: StartKeyUploadRequest, models: ModelRegistry = Depends(get_models)
+):
+    """
+    Evaluation_keys/uploads endpoint: Starts a chunked upload of evaluation keys, or resumes the
+    interrupted upload of the same keys by the same client.
+
+    The client then sends the parts of the keys that the server does not hold yet to
+    /evaluation_keys/uploads/{upload_id}/parts/{index}, and commits the upload. Keys the
+    registry already holds are bound to the client right away, without an upload.
+
+    Args:
+        request (StartKeyUploadRequest): The size and digest of the keys, and the id of the
+            client.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: If the keys are already stored, "status" "Keys bound" and their digest.
+        Otherwise, "status" "uploading", the id of the upload ("upload_id"), the size and number
+        of its parts ("part_size", "parts") and the indices of the parts already received
+        ("received").
+
+    Raises:
+        HTTPException: 400 if the size is invalid.
+    """
+    key_registry, key_uploads = get_model_keys(models, request.model)
+    bound = await asyncio.to_thread(
+        key_registry.bind, request.client_id, request.digest
+    )
+    if bound:
+        return {"status": "Keys bound", "digest": request.digest}
+    try:
+        return await asyncio.to_thread(
+            key_uploads.start,
+            request.client_id,
+            request.size,
+            request.digest,
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+
+
+@router.get("/evaluation_keys/uploads/{upload_id}")
+async def key_upload_status(
+    upload_id: str,
+    model: Optional[str] = None,
+    models: ModelRegistry = Depends(get_models),
+):
+    """
+    Evaluation_keys/uploads/{upload_id} endpoint: Reports the parts of a chunked upload already
+    received, to resume it.
+
+    Args:
+        upload_id (str): The id of the upload.
+        model (str): The name of the served model the keys are for, passed as a query parameter.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: The state of the upload, see /evaluation_keys/uploads.
+
+    Raises:
+        HTTPException: 404 if no upload has this id.
+    """
+    key_uploads = get_model_keys(models, model).uploads
+    try:
+        return await asyncio.to_thread(key_uploads.status, upload_id)
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown upload '{upload_id}'"
+        ) from error
+
+
+@router.put(
+    "/evaluation_keys/uploads/{upload_id}/parts/{index}",
+    openapi_extra=OCTET_STREAM_BODY,
+)
+async def upload_key_part(
+    upload_id: str,
+    index: int,
+    request: Request,
+    model: Optional[str] = None,
+    models: ModelRegistry = Depends(get_models),
+):
+    """
+    Evaluation_keys/uploads/{upload_id}/parts/{index} endpoint: Receives a part of a chunked
+    upload as raw bytes, streamed to disk as it arrives.
+
+    Sending a part again replaces it, so a part whose upload was interrupted is simply sent
+    again. Parts are not compressed, as serialized evaluation keys do not compress.
+
+    Args:
+        upload_id (str): The id of the upload.
+        index (int): The index of the part, from 0.
+        request (Request): The request whose body is the part.
+        model (str): The name of the served model the keys are for, passed as a query parameter.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message, with the index and size of the part.
+
+    Raises:
+        HTTPException: 404 if no upload has this id, 400 if the index or the size of the part is
+            invalid, 415 if the part is compressed.
+    """
+    if request.headers.get("Content-Encoding", "identity") != "identity":
+        raise HTTPException(
+            status_code=415,
+            detail="Parts of key uploads are not compressed",
+            headers={"Accept-Encoding": "identity"},
+        )
+    key_uploads = get_model_keys(models, model).uploads
+    try:
+        with timed({}, "key_upload_part"):
+            size = await key_uploads.write_part(upload_id, index, request.stream())
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown upload '{upload_id}'"
+        ) from error
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    return {"status": "Part received", "index": index, "size": size}
+
+
+@router.post("/evaluation_keys/uploads/{upload_id}/commit")
+async def commit_key_upload(
+    upload_id: str,
+    request: CommitKeyUploadRequest,
+    model: Optional[str] = None,
+    models: ModelRegistry = Depends(get_models),
+):
+    """
+    Evaluation_keys/uploads/{upload_id}/commit endpoint: Completes a chunked upload, storing the
+    keys in the key registry under the id of the client if their checksum is the expected one.
+
+    The parts are assembled and hashed in a thread, off the event loop.
+
+    Args:
+        upload_id (str): The id of the upload.
+        request (CommitKeyUploadRequest): The SHA-256 digest of the keys.
+        model (str): The name of the served model the keys are for, passed as a query parameter.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message indicating that the keys were stored, with their digest.
+
+    Raises:
+        HTTPException: 404 if no upload has this id, 409 if parts are missing (the upload can be
+            resumed), 400 if the checksum does not match (the upload is deleted).
+    """
+    key_uploads = get_model_keys(models, model).uploads
+    try:
+        with timed({}, "key_upload"):
+            await asyncio.to_thread(key_uploads.commit, upload_id, request.digest)
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown upload '{upload_id}'"
+        ) from error
+    except IncompleteUploadError as error:
+        raise HTTPException(status_code=409, detail=str(error)) from error
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    return {"status": "Keys received", "digest": request.digest}
+
+
+@router.delete("/evaluation_keys/uploads/{upload_id}")
+async def abort_key_upload(
+    upload_id: str,
+    model: Optional[str] = None,
+    models: ModelRegistry = Depends(get_models),
+):
+    """
+    Evaluation_keys/uploads/{upload_id} endpoint: Aborts a chunked upload, deleting its parts.
+
+    Args:
+        upload_id (str): The id of the upload.
+        model (str): The name of the served model the keys are for, passed as a query parameter.
+        models (ModelRegistry): The served models.
+
+    Returns:
+        dict: A status message, with the id of the upload.
+
+    Raises:
+        HTTPException: 404 if no upload has this id.
+    """
+    key_uploads = get_model_keys(models, model).uploads
+    try:
+        await asyncio.to_thread(key_uploads.abort, upload_id)
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown upload '{upload_id}'"
+        ) from error
+    return {"status": "Upload aborted", "upload_id": upload_id}
+
+
+async def store_evaluation_keys(key_registry, client_id, keys):
+    """
+    Store the serialized evaluation keys of a client in the key registry of a served model.
+
+    The registry hashes the keys and writes them to disk, which runs in a thread, off the event
+    loop.
+
+    Args:
+        key_registry (KeyRegistry): The key registry of the model the keys are for.
+        client_id (str): The id of the client owning the keys.
+        keys (bytes): The serialized evaluation keys.
+
+    Returns:
+        str: The SHA-256 hex digest of the keys.
+    """
+    with timed({}, "key_upload"):
+        return await asyncio.to_thread(key_registry.put, client_id, keys)
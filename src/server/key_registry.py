@@ -0,0 +1,213 @@
+"""
+Registry of the evaluation keys of the clients of the FHE server.
+
+Each client uploads its own evaluation keys and names them by a client id in its prediction
+requests, so several clients with different keys can share one server. Key sets are stored by
+the SHA-256 hash of their content: identical uploads from several clients are kept once.
+
+At most `memory_budget` bytes of key sets are held in memory, the least recently used ones being
+evicted first. Every key set is also written to a spill directory when it is first uploaded, so
+an evicted key set is simply dropped from memory and reloaded lazily from disk the next time a
+prediction needs it.
+
+Classes:
+    - KeyRegistry: Memory-bounded, disk-backed store of evaluation keys by client id.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# A SHA-256 hex digest, as used in the names of the spill files
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class KeyRegistry:
+    """
+    Memory-bounded, disk-backed store of evaluation keys by client id.
+
+    The methods of the registry perform blocking file I/O on cache misses and uploads: they are
+    meant to be called from a thread (e.g. `asyncio.to_thread`), and are thread-safe.
+
+    Attributes:
+        spill_dir (str): Directory holding one `<sha256>.ekl` file per distinct key set.
+        memory_budget (int): Maximum number of bytes of key sets held in memory. The most
+            recently used key set is always kept, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, spill_dir, memory_budget):
+        """
+        Create the registry and its spill directory.
+
+        Args:
+            spill_dir (str): Directory where the key sets are written.
+            memory_budget (int): Maximum number of bytes of key sets held in memory.
+        """
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        os.makedirs(spill_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # client id -> digest of its key set
+        self._clients = {}
+        # digest -> key set, from least to most recently used
+        self._cache = OrderedDict()
+        self._memory_used = 0
+
+    def _path(self, digest):
+        return os.path.join(self.spill_dir, f"{digest}.ekl")
+
+    def put(self, client_id, keys):
+        """
+        Register the evaluation keys of a client.
+
+        The key set is written to the spill directory unless an identical one is already there.
+
+        Args:
+            client_id (str): Id of the client owning the keys.
+            keys (bytes): The serialized evaluation keys.
+
+        Returns:
+            str: The SHA-256 hex digest of the key set.
+        """
+        digest = hashlib.sha256(keys).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            # Write to a temporary file first so that a concurrent reader never sees a
+            # partially written key set
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file_handler:
+                file_handler.write(keys)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._clients[client_id] = digest
+            self._cache_keys(digest, keys)
+        return digest
+
+    def put_file(self, client_id, path, digest):
+        """
+        Register the evaluation keys of a client from a file, moving it to the spill directory.
+
+        The key set is not read: it is loaded into memory by the first prediction using it.
+
+        Args:
+            client_id (str): Id of the client owning the keys.
+            path (str): The file of serialized evaluation keys, on the file system of the spill
+                directory. It is moved, or deleted if an identical key set is already stored.
+            digest (str): The SHA-256 hex digest of the content of the file.
+
+        Returns:
+            str: The SHA-256 hex digest of the key set.
+        """
+        if os.path.exists(self._path(digest)):
+            os.remove(path)
+        else:
+            os.replace(path, self._path(digest))
+        with self._lock:
+            self._clients[client_id] = digest
+        return digest
+
+    def __contains__(self, client_id):
+        """
+        Return whether a client registered evaluation keys, without loading them.
+        """
+        with self._lock:
+            return client_id in self._clients
+
+    def bind(self, client_id, digest):
+        """
+        Register already stored evaluation keys for a client, by the digest of their content.
+
+        This lets a client that uploaded its keys before, possibly under another client id or
+        before a restart of the server, reuse them without uploading them again.
+
+        Args:
+            client_id (str): Id of the client owning the keys.
+            digest (str): The SHA-256 hex digest of the serialized evaluation keys.
+
+        Returns:
+            bool: Whether the registry holds keys with this digest. If not, the client must
+            upload its keys.
+        """
+        if not DIGEST_PATTERN.fullmatch(digest):
+            return False
+        with self._lock:
+            if digest not in self._cache and not os.path.exists(self._path(digest)):
+                return False
+            self._clients[client_id] = digest
+        return True
+
+    def get(self, client_id):
+        """
+        Return the evaluation keys of a client, loading them from disk if they were evicted.
+
+        Args:
+            client_id (str): Id of the client owning the keys.
+
+        Returns:
+            bytes: The serialized evaluation keys.
+
+        Raises:
+            KeyError: If the client never uploaded evaluation keys.
+        """
+        return self.get_with_digest(client_id)[1]
+
+    def get_with_digest(self, client_id):
+        """
+        Return the evaluation keys of a client with their digest, loading them from disk if
+        they were evicted.
+
+        Args:
+            client_id (str): Id of the client owning the keys.
+
+        Returns:
+            tuple: The SHA-256 hex digest (str) and the serialized evaluation keys (bytes).
+
+        Raises:
+            KeyError: If the client never uploaded evaluation keys.
+        """
+        with self._lock:
+            digest = self._clients[client_id]
+            keys = self._cache.get(digest)
+            if keys is not None:
+                self._cache.move_to_end(digest)
+                return digest, keys
+
+        with open(self._path(digest), "rb") as file_handler:
+            keys = file_handler.read()
+        with self._lock:
+            self._cache_keys(digest, keys)
+        return digest, keys
+
+    def _cache_keys(self, digest, keys):
+        """
+        Insert a key set in the in-memory LRU and evict the least recently used ones to stay
+        within the memory budget. Must be called with the lock held.
+        """
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return
+        self._cache[digest] = keys
+        self._memory_used += len(keys)
+        while self._memory_used > self.memory_budget and len(self._cache) > 1:
+            _, evicted_keys = self._cache.popitem(last=False)
+            self._memory_used -= len(evicted_keys)
+
+    def stats(self):
+        """
+        Return the current content of the registry.
+
+        Returns:
+            dict: The number of registered clients, of distinct key sets, of key sets held in
+            memory and the number of bytes they use.
+        """
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "key_sets": len(set(self._clients.values())),
+                "key_sets_in_memory": len(self._cache),
+                "memory_bytes": self._memory_used,
+            }
@@ -0,0 +1,344 @@
+"""
+Chunked, resumable uploads of evaluation keys.
+
+The evaluation keys of large models weigh hundreds of megabytes: sent in one request over a
+flaky link, a single dropped connection restarts the whole upload. Instead, a client starts an
+upload with the size and SHA-256 digest of its keys, sends them in parts of `part_size` bytes,
+in any order and possibly concurrently, then commits the upload. An interrupted upload is
+resumed by starting it again with the same size and digest: the server answers with the parts it
+already holds, so that only the missing ones are sent again, also after a restart of the client
+or of the server.
+
+Each part is streamed to its own file in the upload directory, as it arrives, through a
+bounded buffer: neither a part nor the whole key set is held in memory, and the writes run in
+threads, off the event loop. Part files are written under a temporary name and renamed once
+complete, so that a part is either fully received or absent. On commit, the parts are
+concatenated into the spill directory of the key registry while their digest is computed, in a
+thread and without blocking the other uploads, and the key set is registered if its digest is
+the one announced by the client.
+
+Uploads untouched for `max_age` seconds are deleted when the next one starts.
+
+Classes:
+    - IncompleteUploadError: Raised when committing an upload with missing parts.
+    - KeyUploads: The uploads in progress of the clients of a key registry.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+# The id of an upload, as generated by `KeyUploads.start`
+UPLOAD_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+UPLOAD_FILE = "upload.json"
+# Suffix of the directory of an upload being committed
+COMMITTING = ".committing"
+# Bytes of a part buffered before they are written to disk
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+class IncompleteUploadError(Exception):
+    """
+    Raised when committing an upload some parts of which were not received. The upload can be
+    resumed.
+    """
+
+
+class KeyUploads:
+    """
+    The uploads in progress of the evaluation keys of the clients of a key registry.
+
+    The state of each upload is kept in its directory, so uploads survive restarts of the
+    server. The methods perform blocking file I/O: apart from `write_part`, which streams a part
+    from the event loop and writes it in threads, they are meant to be called from a thread
+    (e.g. `asyncio.to_thread`), and are thread-safe.
+
+    Attributes:
+        upload_dir (str): Directory holding one sub-directory per upload, on the file system of
+            the spill directory of the key registry.
+        key_registry (KeyRegistry): The registry the committed key sets are added to.
+        part_size (int): Size of the parts, in bytes; the last part of an upload may be smaller.
+        max_size (int): Maximum size of a key set, in bytes.
+        max_age (float): Time in seconds after which an untouched upload is deleted.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, upload_dir, key_registry, *, part_size, max_size, max_age
+    ):
+        """
+        Create the uploads and their directory.
+
+        Args:
+            upload_dir (str): Directory of the uploads.
+            key_registry (KeyRegistry): The registry the committed key sets are added to.
+            part_size (int): Size of the parts, in bytes.
+            max_size (int): Maximum size of a key set, in bytes.
+            max_age (float): Time in seconds after which an untouched upload is deleted.
+        """
+        self.upload_dir = upload_dir
+        self.key_registry = key_registry
+        self.part_size = part_size
+        self.max_size = max_size
+        self.max_age = max_age
+        os.makedirs(upload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, upload_id, name=""):
+        """
+        Return the path of a file of an upload, or of its directory.
+
+        Raises:
+            KeyError: If the upload id is invalid or no upload has this id.
+        """
+        if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+            raise KeyError(upload_id)
+        upload_path = os.path.join(self.upload_dir, upload_id)
+        if not os.path.isdir(upload_path):
+            raise KeyError(upload_id)
+        return os.path.join(upload_path, name)
+
+    def _read(self, upload_id):
+        """
+        Return the description of an upload.
+
+        Raises:
+            KeyError: If no upload has this id.
+        """
+        with open(self._path(upload_id, UPLOAD_FILE), encoding="utf-8") as file_handler:
+            return json.load(file_handler)
+
+    def _state(self, upload):
+        """
+        Return the state of an upload: its description and the parts received.
+        """
+        upload_path = os.path.join(self.upload_dir, upload["upload_id"])
+        received = sorted(
+            int(name[: -len(".part")])
+            for name in os.listdir(upload_path)
+            if name.endswith(".part")
+        )
+        return {**upload, "status": "uploading", "received": received}
+
+    def start(self, client_id, size, digest):
+        """
+        Start an upload, or resume the one of the same key set by the same client.
+
+        Args:
+            client_id (str): Id of the client owning the keys.
+            size (int): Size of the serialized evaluation keys, in bytes.
+            digest (str): The SHA-256 hex digest of the serialized evaluation keys.
+
+        Returns:
+            dict: The upload id ("upload_id"), the size of the parts ("part_size") and their
+            number ("parts"), and the indices of the parts already received ("received").
+
+        Raises:
+            ValueError: If the size is not positive or exceeds `max_size`.
+        """
+        if not 0 < size <= self.max_size:
+            raise ValueError(
+                f"Invalid key set size {size}, the maximum is {self.max_size} bytes"
+            )
+        with self._lock:
+            self.purge()
+            for upload_id in os.listdir(self.upload_dir):
+                try:
+                    upload = self._read(upload_id)
+                except (KeyError, OSError, ValueError):
+                    continue
+                if (upload["client_id"], upload["size"], upload["digest"]) == (
+                    client_id,
+                    size,
+                    digest,
+                ):
+                    os.utime(self._path(upload_id, UPLOAD_FILE))
+                    return self._state(upload)
+
+            upload = {
+                "upload_id": uuid.uuid4().hex,
+                "client_id": client_id,
+                "size": size,
+                "digest": digest,
+                "part_size": self.part_size,
+                "parts": -(-size // self.part_size),
+            }
+            upload_path = os.path.join(self.upload_dir, upload["upload_id"])
+            os.makedirs(upload_path)
+            with open(
+                os.path.join(upload_path, UPLOAD_FILE), "w", encoding="utf-8"
+            ) as file_handler:
+                json.dump(upload, file_handler)
+            return self._state(upload)
+
+    def status(self, upload_id):
+        """
+        Return the state of an upload, to resume it.
+
+        Args:
+            upload_id (str): The id of the upload.
+
+        Returns:
+            dict: The state of the upload, see `start`.
+
+        Raises:
+            KeyError: If no upload has this id.
+        """
+        return self._state(self._read(upload_id))
+
+    async def write_part(self, upload_id, index, chunks):
+        """
+        Stream a part of an upload to disk, replacing the part if it was already received.
+
+        Args:
+            upload_id (str): The id of the upload.
+            index (int): The index of the part, from 0.
+            chunks (AsyncIterable): The content of the part, in chunks of bytes, e.g. the
+                stream of the request body.
+
+        Returns:
+            int: The size of the part, in bytes.
+
+        Raises:
+            KeyError: If no upload has this id.
+            ValueError: If the index is out of range or the size of the part is not the
+                expected one.
+        """
+        upload = await asyncio.to_thread(self._read, upload_id)
+        if not 0 <= index < upload["parts"]:
+            raise ValueError(
+                f"Part {index} out of range, the upload has {upload['parts']}"
+            )
+        expected_size = min(
+            upload["part_size"], upload["size"] - index * upload["part_size"]
+        )
+
+        path = self._path(upload_id, f"{index}.part")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        file_handler = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            size, buffer = 0, bytearray()
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > expected_size:
+                    raise ValueError(
+                        f"Part {index} exceeds its size of {expected_size} bytes"
+                    )
+                buffer += chunk
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await asyncio.to_thread(file_handler.write, bytes(buffer))
+                    buffer.clear()
+            await asyncio.to_thread(file_handler.write, bytes(buffer))
+            if size != expected_size:
+                raise ValueError(
+                    f"Part {index} has {size} bytes instead of {expected_size}"
+                )
+        except BaseException:
+            await asyncio.to_thread(file_handler.close)
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+        await asyncio.to_thread(file_handler.close)
+        await asyncio.to_thread(os.replace, tmp_path, path)
+        return size
+
+    def commit(self, upload_id, digest):
+        """
+        Complete an upload: concatenate its parts into a key set, check its digest and register
+        it for the client, then delete the upload.
+
+        Args:
+            upload_id (str): The id of the upload.
+            digest (str): The SHA-256 hex digest of the serialized evaluation keys, which must
+                be the one announced when the upload started.
+
+        Returns:
+            dict: The id of the client ("client_id") and the digest of its keys ("digest").
+
+        Raises:
+            KeyError: If no upload has this id.
+            IncompleteUploadError: If parts are missing, in which case the upload can be
+                resumed.
+            ValueError: If the digest of the key set is not the expected one, in which case the
+                upload is deleted.
+        """
+        with self._lock:
+            upload = self._read(upload_id)
+            missing = sorted(
+                set(range(upload["parts"])) - set(self._state(upload)["received"])
+            )
+            if missing:
+                raise IncompleteUploadError(f"Missing parts {missing}")
+            # Claim the upload: it is no longer found by the other calls, so that the parts
+            # are assembled outside of the lock
+            claimed_path = os.path.join(self.upload_dir, f"{upload_id}{COMMITTING}")
+            os.rename(self._path(upload_id), claimed_path)
+            # Not purged while being committed
+            os.utime(os.path.join(claimed_path, UPLOAD_FILE))
+
+        sha256 = hashlib.sha256()
+        tmp_path = os.path.join(
+            self.key_registry.spill_dir, f"{upload_id}.{upload['digest']}.tmp"
+        )
+        try:
+            with open(tmp_path, "wb") as key_file:
+                for index in range(upload["parts"]):
+                    part_path = os.path.join(claimed_path, f"{index}.part")
+                    with open(part_path, "rb") as part_file:
+                        while chunk := part_file.read(WRITE_BUFFER_SIZE):
+                            sha256.update(chunk)
+                            key_file.write(chunk)
+        except BaseException:
+            # Give the upload back, to be committed again or resumed
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.rename(claimed_path, os.path.join(self.upload_dir, upload_id))
+            raise
+        shutil.rmtree(claimed_path)
+        if sha256.hexdigest() != digest or digest != upload["digest"]:
+            os.remove(tmp_path)
+            raise ValueError(
+                f"Checksum mismatch: the parts have digest {sha256.hexdigest()}"
+            )
+        # The key registry has a lock of its own
+        self.key_registry.put_file(upload["client_id"], tmp_path, digest)
+        return {"client_id": upload["client_id"], "digest": digest}
+
+    def abort(self, upload_id):
+        """
+        Delete an upload and its parts.
+
+        Args:
+            upload_id (str): The id of the upload.
+
+        Raises:
+            KeyError: If no upload has this id.
+        """
+        with self._lock:
+            shutil.rmtree(self._path(upload_id))
+
+    def purge(self):
+        """
+        Delete the uploads untouched for `max_age` seconds.
+
+        Returns:
+            int: The number of uploads deleted.
+        """
+        purged = 0
+        for upload_id in os.listdir(self.upload_dir):
+            upload_path = os.path.join(self.upload_dir, upload_id)
+            try:
+                last_write = max(
+                    os.path.getmtime(os.path.join(upload_path, name))
+                    for name in os.listdir(upload_path)
+                )
+            except (OSError, ValueError):
+                last_write = 0.0
+            if time.time() - last_write > self.max_age:
+                shutil.rmtree(upload_path, ignore_errors=True)
+                purged += 1
+        return purged
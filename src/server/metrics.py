@@ -0,0 +1,135 @@
+"""
+Prometheus metrics of the FHE server, exposed by its /metrics endpoint.
+
+Stage durations are recorded in a histogram labelled by stage (decode, keys, run, key_upload,
+key_upload_part, decompress, compress), fed by the `timed` blocks of the endpoints. The
+compression of the request and response bodies is measured by its ratio and CPU time, by codec
+(see `src.server.content_encoding`). The load of the worker pool and the content of the key
+registries are read when the metrics are scraped, summed over the served models, through
+`register_state_gauges`. The prediction sessions open on the streaming endpoint are counted by a
+gauge (see `src.server.prediction_session`). The job queue records its depth, the time jobs
+wait in it and the rejected submissions, by priority class (see `src.server.job_queue`).
+
+Functions:
+    - register_state_gauges: Binds the state gauges to the objects of the running server.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stages last from microseconds (key lookups) to minutes (FHE runs under load)
+STAGE_BUCKETS = (
+    0.001,
+    0.005,
+    0.025,
+    0.1,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+)
+
+STAGE_SECONDS = Histogram(
+    "fhe_server_stage_seconds",
+    "Duration of the stages of the requests of the FHE server.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "fhe_server_batch_size",
+    "Number of single predictions per dynamic batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+BATCH_FILL_RATE = Histogram(
+    "fhe_server_batch_fill_rate",
+    "Size of the dynamic batches over their target size when dispatched.",
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 1),
+)
+BATCH_QUEUEING_SECONDS = Histogram(
+    "fhe_server_batch_queueing_seconds",
+    "Time single predictions waited for their dynamic batch to be dispatched.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+COMPRESSION_RATIO = Histogram(
+    "fhe_server_compression_ratio",
+    "Uncompressed over compressed size of the bodies decompressed (request) and compressed "
+    "(response) by the server.",
+    ["codec", "direction"],
+    buckets=(1, 1.1, 1.25, 1.5, 2, 2.5, 3, 4, 8),
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    "fhe_server_compression_cpu_seconds",
+    "CPU time spent decompressing request bodies and compressing response bodies.",
+    ["codec", "direction"],
+)
+
+JOB_QUEUEING_SECONDS = Histogram(
+    "fhe_server_job_queueing_seconds",
+    "Time jobs waited in the job queue before running, by priority class.",
+    ["priority"],
+    buckets=STAGE_BUCKETS,
+)
+JOBS_REJECTED = Counter(
+    "fhe_server_jobs_rejected",
+    "Job submissions rejected because the queue of their priority class was full.",
+    ["priority"],
+)
+
+IN_FLIGHT = Gauge(
+    "fhe_server_inferences_in_flight",
+    "FHE inferences submitted to the worker pool and not yet completed.",
+)
+QUEUE_DEPTH = Gauge(
+    "fhe_server_queue_depth", "FHE inferences waiting for a free worker."
+)
+BATCH_PENDING = Gauge(
+    "fhe_server_batch_pending",
+    "Single predictions waiting for their dynamic batch to be dispatched.",
+)
+STREAM_SESSIONS = Gauge(
+    "fhe_server_stream_sessions", "Prediction sessions open on the streaming endpoint."
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "fhe_server_job_queue_depth",
+    "Jobs waiting in the job queue, by priority class.",
+    ["priority"],
+)
+KEY_SETS_IN_MEMORY = Gauge(
+    "fhe_server_key_sets_in_memory", "Evaluation key sets held in memory."
+)
+KEY_BYTES_IN_MEMORY = Gauge(
+    "fhe_server_key_bytes_in_memory", "Bytes of evaluation keys held in memory."
+)
+KEY_CLIENTS = Gauge(
+    "fhe_server_key_clients", "Clients with registered evaluation keys."
+)
+
+
+def register_state_gauges(model_registry):
+    """
+    Read the state gauges from the objects of the running server when they are scraped, summed
+    over the served models.
+
+    Args:
+        model_registry (ModelRegistry): The served models, with their worker pool, batcher and
+            key registry.
+    """
+
+    def total(value):
+        return lambda: sum(value(model) for model in model_registry.models.values())
+
+    IN_FLIGHT.set_function(total(lambda model: model.fhe_pool.in_flight))
+    QUEUE_DEPTH.set_function(total(lambda model: model.fhe_pool.queue_depth))
+    BATCH_PENDING.set_function(total(lambda model: model.batcher.stats()["pending"]))
+    KEY_SETS_IN_MEMORY.set_function(
+        total(lambda model: model.key_registry.stats()["key_sets_in_memory"])
+    )
+    KEY_BYTES_IN_MEMORY.set_function(
+        total(lambda model: model.key_registry.stats()["memory_bytes"])
+    )
+    KEY_CLIENTS.set_function(total(lambda model: model.key_registry.stats()["clients"]))
@@ -0,0 +1,370 @@
+"""
+Models served by the FHE server, by name, with their hot reload.
+
+The server hosts several model versions at once, each under a name that the prediction requests
+route to, e.g. "default" and "canary", or one name per model of `get_models()`. Each served
+model has its own FHE worker pool, dynamic batcher, evaluation key registry and uploads, and
+plaintext model, as the keys and circuits of two models are not interchangeable.
+
+Loading a model (compiling its circuit into the circuit cache, starting and warming up its
+workers) takes a while: a new version is loaded next to the one it replaces, which keeps serving
+requests in the meantime. Once the new version is warm, it replaces the previous one in a single
+step of the event loop, so that each request is served by either version. The previous version
+then drains: its worker pool is only stopped when the requests it was serving have completed.
+
+The evaluation keys of a model do not need the model itself: while the first version of a model
+is loading, its key registry and uploads are already available, so that the clients can upload
+their keys as soon as the server is up. A new version storing its keys in the directory of a
+served one, e.g. the same version reloaded, shares its keys, so that the clients stay bound to
+theirs across the swap.
+
+Classes:
+    - ModelKeys: The evaluation keys of the clients of a model, and their uploads.
+    - ServedModel: A model version served under a name, with its worker pool.
+    - ModelRegistry: The served models by name, loading and swapping them.
+
+Functions:
+    - parse_served_models: Parses the names and versions of the models to serve.
+"""
+
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import NamedTuple
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def parse_served_models(text, default_version=None):
+    """
+    Parse the names and versions of the models to serve.
+
+    Args:
+        text (str): Comma-separated `name=version` pairs, e.g. "default=0923f262c078a9b9,
+            canary=5b1e0c9a7d3f4e21", an empty version standing for the latest one. An empty
+            text serves `default_version` as "default".
+        default_version (str): The version served when `text` is empty, None for the latest
+            one.
+
+    Returns:
+        dict: The version of each model by name, None for the latest one, in the order of
+        `text`: the first model is the default one.
+
+    Raises:
+        ValueError: If a pair has no name.
+    """
+    if not text.strip():
+        return {"default": default_version}
+    served_models = {}
+    for pair in text.split(","):
+        name, _, version = pair.strip().partition("=")
+        if not name:
+            raise ValueError(f"Invalid served model: '{pair}'")
+        served_models[name] = version or None
+    return served_models
+
+
+class ModelKeys(NamedTuple):
+    """
+    The evaluation keys of the clients of a model, and their uploads.
+
+    Attributes:
+        registry (KeyRegistry): The evaluation keys of the clients.
+        uploads (KeyUploads): The chunked uploads of evaluation keys to the registry.
+    """
+
+    registry: object
+    uploads: object
+
+
+class ServedModel:
+    """
+    A model version served under a name, with the objects serving its requests.
+
+    Attributes:
+        name (str): The name the requests route to.
+        version (str): The version of the artifact store, None for the legacy deployment files.
+        fhe_pool (FHEWorkerPool): The pool running the FHE inferences.
+        batcher (DynamicBatcher): The dynamic batcher of the single predictions.
+        keys (ModelKeys): The evaluation keys of the clients for this model, and their uploads.
+        plaintext_model (PlaintextModel): The model in the clear and simulate modes.
+        requests (int): Number of requests being served.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, name, version, *, fhe_pool, batcher, keys, plaintext_model
+    ):
+        self.name = name
+        self.version = version
+        self.fhe_pool = fhe_pool
+        self.batcher = batcher
+        self.keys = keys
+        self.plaintext_model = plaintext_model
+        self.requests = 0
+
+    @property
+    def key_registry(self):
+        """
+        KeyRegistry: The evaluation keys of the clients for this model.
+        """
+        return self.keys.registry
+
+    @property
+    def key_uploads(self):
+        """
+        KeyUploads: The chunked uploads of evaluation keys to the key registry.
+        """
+        return self.keys.uploads
+
+    @contextmanager
+    def acquire(self):
+        """
+        Count a request as served by this model until the block completes, so that the model
+        is not stopped under it.
+
+        Yields:
+            ServedModel: The model.
+        """
+        self.requests += 1
+        try:
+            yield self
+        finally:
+            self.requests -= 1
+
+    async def drain(self, poll_interval=0.1):
+        """
+        Wait until the requests being served have completed, then stop the worker pool.
+
+        Args:
+            poll_interval (float): Time in seconds between two checks of the requests.
+        """
+        while self.requests:
+            await asyncio.sleep(poll_interval)
+        await asyncio.to_thread(self.fhe_pool.shutdown)
+
+    def stats(self):
+        """
+        Return the state of the model.
+
+        Returns:
+            dict: The version, the load of the worker pool, the requests being served, and
+            under "modes", "keys" and "batching", the execution modes the model can run, the
+            content of its key registry and the metrics of its dynamic batching.
+        """
+        return {
+            "version": self.version,
+            **self.fhe_pool.stats(),
+            "requests": self.requests,
+            "modes": self.plaintext_model.available_modes(),
+            "keys": self.key_registry.stats(),
+            "batching": self.batcher.stats(),
+        }
+
+
+class ModelRegistry:
+    """
+    The served models by name, loading new versions in the background and swapping them in.
+
+    The registry must be used from the event loop of the server.
+
+    Attributes:
+        default_name (str): The name of the model of the requests that do not name one.
+        models (dict): The served models, by name.
+        loading (dict): The versions being loaded, by name.
+        loading_keys (dict): The keys (ModelKeys) of the versions being loaded, by name, once
+            their loader provided them (see `provide_keys`).
+        failures (dict): The error of the last failed load, by name.
+    """
+
+    def __init__(self, load_model, default_name):
+        """
+        Create an empty registry.
+
+        Args:
+            load_model (Callable): Coroutine function loading and warming up a model, called
+                with its name and version and returning a `ServedModel`.
+            default_name (str): The name of the model of the requests that do not name one.
+        """
+        self.default_name = default_name
+        self.models = {}
+        self.loading = {}
+        self.loading_keys = {}
+        self.failures = {}
+        self._load_model = load_model
+        # Background loads and drains, referenced until they complete
+        self._tasks = {"load": set(), "drain": set()}
+
+    def get(self, name=None):
+        """
+        Return a served model.
+
+        Args:
+            name (str): The name of the model, None for the default model.
+
+        Returns:
+            ServedModel: The model.
+
+        Raises:
+            KeyError: If no model is served under this name.
+        """
+        return self.models[name or self.default_name]
+
+    def get_keys(self, name=None):
+        """
+        Return the evaluation keys of a model: those of the served model, or those of the
+        version being loaded if no version is served yet.
+
+        Args:
+            name (str): The name of the model, None for the default model.
+
+        Returns:
+            ModelKeys: The keys of the model.
+
+        Raises:
+            KeyError: If no model is served under this name, and none being loaded provided its
+                keys yet.
+        """
+        name = name or self.default_name
+        served_model = self.models.get(name)
+        if served_model is not None:
+            return served_model.keys
+        return self.loading_keys[name]
+
+    def find_keys(self, spill_dir):
+        """
+        Return the evaluation keys of a served or loading model stored in a directory, for a
+        new version storing its keys there to share them.
+
+        Args:
+            spill_dir (str): The directory of the key sets.
+
+        Returns:
+            ModelKeys: The keys, or None if no model stores its keys in this directory.
+        """
+        served_keys = [served_model.keys for served_model in self.models.values()]
+        for keys in served_keys + list(self.loading_keys.values()):
+            if keys.registry.spill_dir == spill_dir:
+                return keys
+        return None
+
+    def provide_keys(self, name, keys):
+        """
+        Make the evaluation keys of a version being loaded available before it is warm, see
+        `get_keys`. Called by the loader of the model.
+
+        Args:
+            name (str): The name the model is loaded under.
+            keys (ModelKeys): The keys of the version being loaded.
+        """
+        if name in self.loading:
+            self.loading_keys[name] = keys
+
+    async def load(self, name, version):
+        """
+        Load a model version and serve it under a name, replacing the model served under this
+        name once the new one is warm, then draining the replaced one. A failed load leaves
+        the served model in place.
+
+        Args:
+            name (str): The name to serve the model under.
+            version (str): The version of the artifact store, None for the latest one.
+
+        Returns:
+            ServedModel: The new model.
+
+        Raises:
+            RuntimeError: If a model is already being loaded under this name.
+        """
+        if name in self.loading:
+            raise RuntimeError(f"Model '{name}' is already being loaded")
+        self.loading[name] = version
+        try:
+            served_model = await self._load_model(name, version)
+        except Exception as error:
+            self.failures[name] = str(error)
+            raise
+        finally:
+            del self.loading[name]
+            self.loading_keys.pop(name, None)
+        self.failures.pop(name, None)
+
+        previous_model = self.models.get(name)
+        self.models[name] = served_model
+        logger.info("Serving version %s as model '%s'", served_model.version, name)
+        if previous_model is not None:
+            await previous_model.drain()
+            logger.info(
+                "Drained version %s of model '%s'", previous_model.version, name
+            )
+        return served_model
+
+    def start_load(self, name, version):
+        """
+        Load a model version in the background, see `load`.
+
+        Args:
+            name (str): The name to serve the model under.
+            version (str): The version of the artifact store, None for the latest one.
+
+        Raises:
+            RuntimeError: If a model is already being loaded under this name.
+        """
+        if name in self.loading:
+            raise RuntimeError(f"Model '{name}' is already being loaded")
+        # Reserved now, so that a second call fails before the task starts
+        self.loading[name] = version
+        self._start_task("load", self._background_load(name, version))
+
+    async def _background_load(self, name, version):
+        """
+        Run a load started by `start_load`, logging its failure.
+        """
+        del self.loading[name]
+        try:
+            await self.load(name, version)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Loading version %s as model '%s' failed", version, name)
+
+    def unload(self, name):
+        """
+        Stop serving a model, draining it in the background.
+
+        Args:
+            name (str): The name of the model.
+
+        Raises:
+            KeyError: If no model is served under this name.
+        """
+        self._start_task("drain", self.models.pop(name).drain())
+
+    def _start_task(self, kind, coroutine):
+        """
+        Run a background load or drain, referenced until it completes.
+        """
+        task = asyncio.create_task(coroutine)
+        self._tasks[kind].add(task)
+        task.add_done_callback(self._tasks[kind].discard)
+
+    async def shutdown(self):
+        """
+        Stop the background loads, and drain all the models.
+        """
+        for task in list(self._tasks["load"]):
+            task.cancel()
+        for name in list(self.models):
+            self.unload(name)
+        await asyncio.gather(*self._tasks["drain"])
+
+    def stats(self):
+        """
+        Return the state of the served models.
+
+        Returns:
+            dict: The state of each model by name (see `ServedModel.stats`), and the versions
+            being loaded and the last load errors by name.
+        """
+        return {
+            "models": {name: model.stats() for name, model in self.models.items()},
+            "loading": dict(self.loading),
+            "failures": dict(self.failures),
+        }
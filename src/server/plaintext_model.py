@@ -0,0 +1,148 @@
+"""
+Plaintext execution modes of the FHE model, for capacity planning and shadow traffic.
+
+Besides real FHE execution (the "execute" mode, run by the worker pool on encrypted inputs), the
+server runs the model on plaintext inputs in two cheaper modes:
+    - clear: the quantized model evaluated in plaintext by concrete-ml (`fhe="disable"`), from
+      the model saved in clear_model.json next to the deployment files by models/fhe_model.py.
+    - simulate: the circuit of server.zip loaded with its `is_simulated` flag set, which Concrete
+      evaluates on plaintext integers, simulating the noise of FHE. The inputs are quantized and
+      the outputs dequantized with the pre and post-processing saved in client.zip, as the client
+      does around encryption.
+
+Both return the same class probabilities as the execute mode, at a fraction of its cost.
+
+Classes:
+    - PlaintextModel: Runs the model in the clear and simulate modes.
+"""
+
+import os
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+from concrete import fhe
+from concrete.ml.common.serialization.loaders import load
+from concrete.ml.deployment import FHEModelClient
+
+EXECUTION_MODES = ("clear", "simulate", "execute")
+# File of the concrete-ml model, dumped by models/fhe_model.py, evaluated by the clear mode
+CLEAR_MODEL_FILE = "clear_model.json"
+
+
+def load_simulation_server(server_zip_path):
+    """
+    Load the circuit of a server.zip file as a simulation server.
+
+    Args:
+        server_zip_path (str): Path of the server.zip file saved by `FHEModelDev`.
+
+    Returns:
+        fhe.Server: The server, evaluating the circuit on plaintext integers.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        simulated_zip_path = os.path.join(tmp_dir, "server.zip")
+        with zipfile.ZipFile(server_zip_path) as source, zipfile.ZipFile(
+            simulated_zip_path, "w"
+        ) as target:
+            for name in source.namelist():
+                content = "1" if name == "is_simulated" else source.read(name)
+                target.writestr(name, content)
+        return fhe.Server.load(simulated_zip_path)
+
+
+class PlaintextModel:
+    """
+    Runs the FHE model on plaintext inputs in the clear and simulate modes.
+
+    The models are loaded on their first use, as most servers only run the execute mode. The
+    simulation server is used by one thread at a time.
+    """
+
+    def __init__(self, path_dir):
+        """
+        Create the model.
+
+        Args:
+            path_dir (str): Directory containing the FHE deployment files.
+        """
+        self.path_dir = path_dir
+        self._lock = threading.Lock()
+        self._clear_model = None
+        self._processing = None
+        self._simulation_server = None
+        self._simulation_client = None
+
+    def available_modes(self):
+        """
+        Return the modes this model can run, given the files of the deployment directory.
+
+        Returns:
+            list: The available modes among EXECUTION_MODES.
+        """
+        if os.path.exists(os.path.join(self.path_dir, CLEAR_MODEL_FILE)):
+            return list(EXECUTION_MODES)
+        return [mode for mode in EXECUTION_MODES if mode != "clear"]
+
+    def predict_proba(self, inputs, mode):
+        """
+        Run the model on plaintext inputs.
+
+        Args:
+            inputs (numpy.ndarray): The scaled inputs, one row per sample.
+            mode (str): "clear" or "simulate".
+
+        Returns:
+            numpy.ndarray: The probability of each class, one row per sample.
+
+        Raises:
+            FileNotFoundError: In the clear mode, if the deployment directory holds no
+                clear_model.json.
+            ValueError: If the mode is not a plaintext mode.
+        """
+        if mode == "clear":
+            return self._get_clear_model().predict_proba(inputs, fhe="disable")
+        if mode == "simulate":
+            return self._simulate(inputs)
+        raise ValueError(f"Mode '{mode}' does not run on plaintext inputs")
+
+    def _get_clear_model(self):
+        """
+        Return the concrete-ml model of clear_model.json, loading it on the first call.
+        """
+        with self._lock:
+            if self._clear_model is None:
+                with open(
+                    os.path.join(self.path_dir, CLEAR_MODEL_FILE), encoding="utf-8"
+                ) as file_handler:
+                    self._clear_model = load(file_handler)
+            return self._clear_model
+
+    def _simulate(self, inputs):
+        """
+        Run the simulated circuit on each quantized input and post-process the results.
+        """
+        with self._lock:
+            if self._simulation_server is None:
+                self._processing = FHEModelClient(self.path_dir).model
+                self._simulation_server = load_simulation_server(
+                    os.path.join(self.path_dir, "server.zip")
+                )
+                self._simulation_client = fhe.Client(
+                    self._simulation_server.client_specs, is_simulated=True
+                )
+
+            # The circuit takes one sample per call, as with encrypted inputs
+            quantized_inputs = self._processing.quantize_input(inputs)
+            quantized_outputs = np.concatenate(
+                [
+                    self._simulation_client.simulate_decrypt(
+                        self._simulation_server.run(quantized_input[np.newaxis, :])
+                    )
+                    for quantized_input in quantized_inputs
+                ]
+            )
+        return self._processing.post_processing(
+            self._processing.dequantize_output(quantized_outputs)
+        )
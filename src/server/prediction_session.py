@@ -0,0 +1,158 @@
+"""
+Prediction sessions of the FHE server, streaming encrypted predictions over a WebSocket.
+
+A client feeding a steady stream of ciphertexts pays, with one HTTP request per prediction, a key
+lookup per request and waits for each response before its connection carries the next input. A
+session binds the evaluation keys of the client once, when it starts, and lets the client
+pipeline its inputs on one WebSocket: each input runs through the dynamic batcher of the model as
+soon as it is received, and its result is sent back as soon as it is computed, tagged with the
+request id of the input (see `src.library.stream_protocol` for the messages).
+
+The session holds at most `max_in_flight` predictions at once: when they are all in flight, it
+stops reading the WebSocket until one completes, so that the flow control of the connection
+holds back the client instead of the server queueing its inputs without bound.
+
+A session serves the model version it started with. When that version is replaced, the session
+answers the predictions in flight, then closes the WebSocket so that the client starts a new
+session on the new version.
+
+Classes:
+    - PredictionSession: A prediction session bound to the evaluation keys of a client.
+"""
+
+import asyncio
+import json
+import time
+
+from starlette.websockets import WebSocketDisconnect
+
+from src.library.stream_protocol import CLOSE_MODEL_RELOADED, pack_frame, unpack_frame
+from src.server.metrics import STAGE_SECONDS, STREAM_SESSIONS
+
+
+class PredictionSession:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    A prediction session on a WebSocket, bound to the evaluation keys of a client for a served
+    model.
+
+    Attributes:
+        websocket (WebSocket): The accepted WebSocket of the session.
+        served_model (ServedModel): The model running the predictions.
+        digest (str): The digest of the evaluation keys of the client.
+        evaluation_keys (bytes): The serialized evaluation keys of the client, held for the
+            whole session.
+        max_in_flight (int): Maximum number of predictions of the session in flight at once.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        websocket,
+        served_model,
+        digest,
+        evaluation_keys,
+        *,
+        max_in_flight,
+        is_served
+    ):
+        """
+        Create a session on an accepted WebSocket.
+
+        Args:
+            websocket (WebSocket): The accepted WebSocket.
+            served_model (ServedModel): The model running the predictions.
+            digest (str): The digest of the evaluation keys of the client.
+            evaluation_keys (bytes): The serialized evaluation keys of the client.
+            max_in_flight (int): Maximum number of predictions in flight at once.
+            is_served (Callable): Function returning whether `served_model` is still the model
+                served under its name.
+        """
+        self.websocket = websocket
+        self.served_model = served_model
+        self.digest = digest
+        self.evaluation_keys = evaluation_keys
+        self.max_in_flight = max_in_flight
+        self._is_served = is_served
+        self._window = asyncio.Semaphore(max_in_flight)
+        # Results are sent one message at a time
+        self._send_lock = asyncio.Lock()
+        # Predictions in flight, referenced until they complete
+        self._tasks = set()
+
+    async def run(self):
+        """
+        Describe the session to the client, then serve its predictions until it closes the
+        WebSocket or the model is replaced.
+        """
+        await self.websocket.send_json(
+            {
+                "model": self.served_model.name,
+                "model_version": self.served_model.version,
+                "max_in_flight": self.max_in_flight,
+            }
+        )
+        STREAM_SESSIONS.inc()
+        try:
+            await self._receive()
+        finally:
+            STREAM_SESSIONS.dec()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _receive(self):
+        """
+        Read the inputs of the client and start their predictions, within the window of the
+        session.
+        """
+        while True:
+            await self._window.acquire()
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is None:
+                await self.websocket.close(code=1003, reason="Inputs must be binary")
+                return
+            try:
+                request_id, encrypted_data = unpack_frame(message["bytes"])
+            except ValueError as error:
+                await self.websocket.close(code=1007, reason=str(error))
+                return
+            if not self._is_served():
+                await asyncio.gather(*self._tasks)
+                await self.websocket.close(
+                    code=CLOSE_MODEL_RELOADED, reason="Model reloaded"
+                )
+                return
+            task = asyncio.create_task(self._predict(request_id, encrypted_data))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _predict(self, request_id, encrypted_data):
+        """
+        Run the model on one input, batched with concurrent inputs using the same evaluation
+        keys, and send its result or error to the client.
+        """
+        try:
+            with self.served_model.acquire():
+                start = time.perf_counter()
+                encrypted_result = await self.served_model.batcher.run(
+                    encrypted_data, self.evaluation_keys, self.digest
+                )
+                STAGE_SECONDS.labels("run").observe(time.perf_counter() - start)
+            message = {
+                "type": "websocket.send",
+                "bytes": pack_frame(request_id, encrypted_result),
+            }
+        except RuntimeError as error:
+            message = {
+                "type": "websocket.send",
+                "text": json.dumps({"id": request_id, "error": str(error)}),
+            }
+        try:
+            async with self._send_lock:
+                await self.websocket.send(message)
+        except (WebSocketDisconnect, RuntimeError):
+            # The client is gone: the receiving loop ends the session
+            pass
+        finally:
+            self._window.release()
@@ -0,0 +1,231 @@
+"""
+Helpers shared by the endpoints of the FHE server.
+
+The endpoints are split across `src.server.server` and the routers of `src.server.key_endpoints`,
+`src.server.job_endpoints` and `src.server.admin_endpoints`. The routers reach the served models
+and the job queue kept in the state of the application through the `get_models` and `get_jobs`
+dependencies.
+
+Functions:
+    - get_models: Dependency returning the registry of the served models.
+    - get_jobs: Dependency returning the job queue.
+    - timed: Measures the duration of a stage of a request.
+    - format_server_timing: Formats stage durations as a Server-Timing header.
+    - get_served_model: Returns a served model by name.
+    - get_model_keys: Returns the evaluation keys of a served model.
+    - unavailable_model: Returns the error answering a request for a model that is not served.
+    - model_fields: Returns the fields naming the model that ran in a prediction response.
+    - get_evaluation_keys: Returns the evaluation keys of a client.
+    - run_fhe_model: Runs a served FHE model on one encrypted input.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+from fastapi.requests import HTTPConnection
+
+from src.server.metrics import STAGE_SECONDS
+
+# Client id used by requests that do not name one
+DEFAULT_CLIENT_ID = "default"
+
+# OpenAPI description of the raw bytes bodies of the binary endpoints
+OCTET_STREAM_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"}
+            }
+        },
+    }
+}
+
+
+def get_models(connection: HTTPConnection):
+    """
+    Return the registry of the served models of the application.
+
+    Args:
+        connection (HTTPConnection): The request or WebSocket being served.
+
+    Returns:
+        ModelRegistry: The served models.
+    """
+    return connection.app.state.models
+
+
+def get_jobs(connection: HTTPConnection):
+    """
+    Return the job queue of the application.
+
+    Args:
+        connection (HTTPConnection): The request being served.
+
+    Returns:
+        JobQueue: The queue of the FHE inference jobs.
+    """
+    return connection.app.state.jobs
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Measure the duration of a block of code, and record it in the stage histogram.
+
+    Args:
+        timings (dict): Dictionary in which the duration is stored, in seconds.
+        stage (str): Key under which the duration is stored, and label of the histogram.
+    """
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+    STAGE_SECONDS.labels(stage).observe(timings[stage])
+
+
+def format_server_timing(timings):
+    """
+    Format stage durations as the value of a Server-Timing header.
+
+    Args:
+        timings (dict): Dictionary of stage durations, in seconds.
+
+    Returns:
+        str: The header value, e.g. "keys;dur=0.050, run;dur=3502.120" (durations in
+        milliseconds).
+    """
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items()
+    )
+
+
+def get_served_model(models, name):
+    """
+    Return a served model by name.
+
+    Args:
+        models (ModelRegistry): The served models.
+        name (str): The name of the model, None for the default model.
+
+    Returns:
+        ServedModel: The model.
+
+    Raises:
+        HTTPException: 503 if the model is still loading, 404 if no model has this name.
+    """
+    try:
+        return models.get(name)
+    except KeyError as error:
+        raise unavailable_model(models, name) from error
+
+
+def get_model_keys(models, name):
+    """
+    Return the evaluation keys of a served model, also while its first version is loading:
+    storing keys does not need the model.
+
+    Args:
+        models (ModelRegistry): The served models.
+        name (str): The name of the model, None for the default model.
+
+    Returns:
+        ModelKeys: The key registry and key uploads of the model.
+
+    Raises:
+        HTTPException: 503 if the model is loading and its keys are not available yet, 404 if
+            no model has this name.
+    """
+    try:
+        return models.get_keys(name)
+    except KeyError as error:
+        raise unavailable_model(models, name) from error
+
+
+def unavailable_model(models, name):
+    """
+    Return the error answering a request for a model that is not served.
+
+    Args:
+        models (ModelRegistry): The served models.
+        name (str): The name of the model, None for the default model.
+
+    Returns:
+        HTTPException: 503 if the model is loading, 404 if no model has this name.
+    """
+    name = name or models.default_name
+    if name in models.loading:
+        return HTTPException(status_code=503, detail=f"Model '{name}' is loading")
+    return HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+
+
+def model_fields(served_model):
+    """
+    Return the fields naming the model that ran in a prediction response.
+
+    Args:
+        served_model (ServedModel): The model that ran.
+
+    Returns:
+        dict: The name ("model") and version ("model_version") of the model.
+    """
+    return {"model": served_model.name, "model_version": served_model.version}
+
+
+async def get_evaluation_keys(served_model, client_id):
+    """
+    Return the evaluation keys of a client from the registry of a served model, with their
+    digest.
+
+    Keys evicted from memory are reloaded from disk in a thread, off the event loop.
+
+    Args:
+        served_model (ServedModel): The model the keys are for.
+        client_id (str): The id under which the client uploaded its evaluation keys.
+
+    Returns:
+        tuple: The SHA-256 hex digest (str) and the serialized evaluation keys (bytes).
+
+    Raises:
+        HTTPException: 404 if the client never uploaded evaluation keys.
+    """
+    try:
+        return await asyncio.to_thread(
+            served_model.key_registry.get_with_digest, client_id
+        )
+    except KeyError as error:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No evaluation keys for client '{client_id}', upload them first",
+        ) from error
+
+
+async def run_fhe_model(served_model, client_id, encrypted_data, timings):
+    """
+    Run a served FHE model on one encrypted input, batched with concurrent inputs using the
+    same evaluation keys.
+
+    Args:
+        served_model (ServedModel): The model to run.
+        client_id (str): The id under which the client uploaded its evaluation keys.
+        encrypted_data (bytes): The serialized encrypted input.
+        timings (dict): Dictionary in which the durations of the keys and run stages are
+            stored, in seconds.
+
+    Returns:
+        bytes: The serialized encrypted prediction.
+
+    Raises:
+        HTTPException: 404 if the client never uploaded evaluation keys, 500 if the FHE model
+            failed on the input.
+    """
+    with timed(timings, "keys"):
+        digest, evaluation_keys = await get_evaluation_keys(served_model, client_id)
+    try:
+        with timed(timings, "run"):
+            return await served_model.batcher.run(
+                encrypted_data, evaluation_keys, digest
+            )
+    except RuntimeError as error:
+        raise HTTPException(status_code=500, detail=str(error)) from error
@@ -1,36 +1,277 @@
 """
 Server module for serving FHE model predictions using FastAPI.
 
-This module exposes two FastAPI endpoints:
+This module exposes the following FastAPI endpoints:
     - /predict: Accepts encrypted input data, runs the FHE model, and returns encrypted predictions.
-    - /evaluation_keys: Accepts serialized evaluation keys in hex-encoded format and stores them
-                                             for later use.
+    - /predict_binary: Same as /predict, with the encrypted input and prediction sent as raw
+                                             bytes (application/octet-stream) instead of hex.
+    - /predict_stream: WebSocket on which a client streams encrypted inputs and receives the
+                                             encrypted predictions as they complete.
+    - /predict_batch: Accepts a list of encrypted inputs, runs them across the FHE worker pool,
+                                             and returns one encrypted prediction or error per
+                                             input.
+    - /predict_plaintext: Accepts plaintext inputs and runs the model in the clear or simulate
+                                             execution mode, without encryption.
+    - /status: Reports the load of the FHE worker pools and the content of the evaluation key
+                                             registries of the served models.
+    - /ready: Answers 200 once all the served models are warmed up, 503 before.
+    - /metrics: Exposes the Prometheus metrics of the server (see `src.server.metrics`).
+The evaluation key, job and admin endpoints are in `src.server.key_endpoints`,
+`src.server.job_endpoints` and `src.server.admin_endpoints`.
 
-The module uses Concrete ML for serving predictions with homomorphic encryption (FHE).
+The module uses Concrete ML for serving predictions with homomorphic encryption (FHE), in pools
+of worker processes (see `src.server.fhe_pool`). The served models and their configuration
+through environment variables are documented in the README.
 
 Modules:
     - FastAPI: Web framework to create the API.
     - pydantic: Used to define request body models.
-    - concrete.ml.deployment.FHEModelServer: For loading and running the FHE model.
+    - src.server.batching: For coalescing single predictions into batches.
+    - src.server.circuit_cache: For caching the compiled FHE circuit.
+    - src.server.content_encoding: For compressing the request and response bodies.
+    - src.server.fhe_pool: For running the FHE model in worker processes.
+    - src.server.job_queue: For the queue of FHE inference jobs.
+    - src.server.key_registry: For storing the evaluation keys of the clients.
+    - src.server.model_registry: For serving several model versions and hot reloading them.
+    - src.server.plaintext_model: For running the model in the clear and simulate modes.
+    - src.server.prediction_session: For the prediction sessions of the streaming endpoint.
+    - src.server.routing: For the helpers shared by the endpoints.
+    - src.library.request_ids: For the request ids of the log lines.
+    - src.library.models.artifact_store: For the versions of the FHE model files.
     - uvicorn: ASGI server for running the FastAPI application.
 """
 
+import asyncio
+import logging
 import os
-from fastapi import FastAPI
+import time
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+import numpy as np
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
-from concrete.ml.deployment import FHEModelServer
 import uvicorn
+from src.server.batching import DynamicBatcher
+from src.server.circuit_cache import prepare_compiled_circuit
+from src.server.content_encoding import CompressedRoute, ContentEncoding
+from src.server.fhe_pool import FHEWorkerPool, make_warm_up_sample
+from src.server.job_queue import JobQueue
+from src.server.key_registry import KeyRegistry
+from src.server.key_uploads import KeyUploads
+from src.server.metrics import register_state_gauges
+from src.server.model_registry import (
+    ModelKeys,
+    ModelRegistry,
+    ServedModel,
+    parse_served_models,
+)
+from src.server.plaintext_model import PlaintextModel
+from src.server.prediction_session import PredictionSession
+from src.server.routing import (
+    DEFAULT_CLIENT_ID,
+    OCTET_STREAM_BODY,
+    format_server_timing,
+    get_evaluation_keys,
+    get_served_model,
+    model_fields,
+    run_fhe_model,
+    timed,
+)
+from src.server import admin_endpoints, job_endpoints, key_endpoints
+from src.library.compression import available_codecs, parse_codecs
+from src.library.request_ids import request_id_middleware
+from src.library.stream_protocol import CLOSE_CODE_OFFSET
+from src.library.models.artifact_store import (
+    MODEL_VERSION,
+    resolve_deployment_directory,
+)
 
 
 app = FastAPI()
+# Decompress the request bodies and compress the response bodies of the endpoints
+app.router.route_class = CompressedRoute
+logger = logging.getLogger("uvicorn.error")
 
-# Load the FHE model
-fhe_directory = os.path.join(os.path.abspath(os.getcwd()), "models", "fhe_files")
-server = FHEModelServer(path_dir=fhe_directory)
-server.load()
+# Served models, as comma-separated name=version pairs of the artifact store, the first one
+# being the default model. Defaults to the version pinned by MODEL_VERSION, or the latest one,
+# served as "default". The FHE model files of each version are compiled once into the circuit
+# cache and loaded by each worker of its pool.
+SERVED_MODELS = parse_served_models(os.environ.get("SERVED_MODELS", ""), MODEL_VERSION)
+CIRCUIT_CACHE_DIRECTORY = os.environ.get(
+    "CIRCUIT_CACHE_DIRECTORY",
+    os.path.join(os.path.abspath(os.getcwd()), "models", "circuit_cache"),
+)
+# Worker processes per served model
+FHE_WORKERS = int(os.environ.get("FHE_WORKERS", os.cpu_count() or 1))
+# Run one inference in each worker before reporting the server ready
+WARMUP_INFERENCE = os.environ.get("WARMUP_INFERENCE", "0") == "1"
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+# Dynamic batching of single predictions
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+# Job queue: jobs queued per priority class, jobs running at once, time in seconds finished
+# jobs are kept and finished jobs kept at most
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "1000"))
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", str(FHE_WORKERS)))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "600"))
+JOB_MAX_RESULTS = int(os.environ.get("JOB_MAX_RESULTS", "10000"))
+# Predictions in flight at once in a session of the streaming endpoint
+STREAM_MAX_IN_FLIGHT = int(os.environ.get("STREAM_MAX_IN_FLIGHT", "64"))
 
-# EVALUATION_KEYS = None # ici j'ai changer cétait en minuscule avant
-app.state.evaluation_keys = None
+# Evaluation keys of the clients, in one sub-directory per model version, or in the
+# evaluation_keys directory of each version if unset
+KEYS_DIRECTORY = os.environ.get("KEYS_DIRECTORY")
+# Memory budget of the keys of each served model
+KEYS_MEMORY_BUDGET = int(os.environ.get("KEYS_MEMORY_BUDGET", str(1 << 30)))
+# Chunked uploads of evaluation keys: size of the parts, maximum size of a key set and time
+# after which an untouched upload is deleted
+KEY_UPLOAD_PART_SIZE = int(os.environ.get("KEY_UPLOAD_PART_SIZE", str(8 << 20)))
+KEY_UPLOAD_MAX_SIZE = int(os.environ.get("KEY_UPLOAD_MAX_SIZE", str(4 << 30)))
+KEY_UPLOAD_MAX_AGE = float(os.environ.get("KEY_UPLOAD_MAX_AGE", "86400"))
+# Compression codecs accepted and used by the server, e.g. "zstd:3,lz4,gzip:1", all the
+# available ones at their default level if unset
+COMPRESSION_CODECS = parse_codecs(
+    os.environ.get("COMPRESSION_CODECS", ",".join(available_codecs()))
+)
+# Smallest response body worth compressing, in bytes
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "256"))
+# Largest request body once decompressed, in bytes
+MAX_DECOMPRESSED_SIZE = int(os.environ.get("MAX_DECOMPRESSED_SIZE", str(1 << 30)))
+
+app.state.models = None
+app.state.jobs = None
+app.state.content_encoding = ContentEncoding(
+    COMPRESSION_CODECS, COMPRESSION_MIN_SIZE, MAX_DECOMPRESSED_SIZE
+)
+app.state.ready = False
+app.state.warm_up_task = None
+
+
+async def load_served_model(name, version):
+    """
+    Load a model version of the artifact store: open its key registry, available to the key
+    endpoints right away, then compile its circuit into the circuit cache, start its FHE worker
+    pool and warm the workers up, optionally running one inference in each.
+
+    Args:
+        name (str): The name to serve the model under.
+        version (str): The version of the artifact store, None for the latest one.
+
+    Returns:
+        ServedModel: The warm model, with its worker pool, batcher, key registry and plaintext
+        model.
+    """
+    version, fhe_directory = resolve_deployment_directory(version)
+    # The clients can upload their keys while the model compiles and warms up
+    if KEYS_DIRECTORY is None:
+        keys_directory = os.path.join(fhe_directory, "evaluation_keys")
+    else:
+        keys_directory = os.path.join(KEYS_DIRECTORY, version or "fhe_files")
+    # A version reloaded keeps the keys bound to the clients
+    keys = app.state.models.find_keys(keys_directory)
+    if keys is None:
+        key_registry = KeyRegistry(keys_directory, KEYS_MEMORY_BUDGET)
+        keys = ModelKeys(
+            key_registry,
+            KeyUploads(
+                os.path.join(keys_directory, "uploads"),
+                key_registry,
+                part_size=KEY_UPLOAD_PART_SIZE,
+                max_size=KEY_UPLOAD_MAX_SIZE,
+                max_age=KEY_UPLOAD_MAX_AGE,
+            ),
+        )
+    app.state.models.provide_keys(name, keys)
+
+    compiled_directory = await asyncio.to_thread(
+        prepare_compiled_circuit, fhe_directory, CIRCUIT_CACHE_DIRECTORY
+    )
+    fhe_pool = FHEWorkerPool(compiled_directory, workers=FHE_WORKERS)
+    try:
+        sample = None
+        if WARMUP_INFERENCE:
+            sample = await asyncio.to_thread(make_warm_up_sample, fhe_directory)
+        workers = await fhe_pool.warm_up(sample)
+    except BaseException:
+        await asyncio.to_thread(fhe_pool.shutdown)
+        raise
+    logger.info(
+        "Model '%s' (version %s) loaded with %d warm FHE workers",
+        name,
+        version,
+        workers,
+    )
+    return ServedModel(
+        name,
+        version,
+        fhe_pool=fhe_pool,
+        batcher=DynamicBatcher(fhe_pool, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS / 1000),
+        keys=keys,
+        plaintext_model=PlaintextModel(fhe_directory),
+    )
+
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    Event triggered on application startup to create the registry of the served models and the
+    job queue, and to load the models in the background.
+
+    The worker pools are created here rather than at import time so that the spawned worker
+    processes, which re-import their entry module, do not start pools of their own.
+    """
+    start = time.perf_counter()
+    app.state.models = ModelRegistry(load_served_model, next(iter(SERVED_MODELS)))
+    register_state_gauges(app.state.models)
+    app.state.jobs = JobQueue(
+        run_job,
+        JOB_QUEUE_SIZE,
+        JOB_CONCURRENCY,
+        JOB_RESULT_TTL,
+        max_finished=JOB_MAX_RESULTS,
+    )
+    app.state.jobs.start()
+    app.state.warm_up_task = asyncio.create_task(warm_up(start))
+
+
+async def warm_up(start):
+    """
+    Load the served models one after the other, then mark the server ready and log the startup
+    time.
+
+    Args:
+        start (float): `time.perf_counter()` value at the beginning of the startup.
+    """
+    try:
+        for name, version in SERVED_MODELS.items():
+            await app.state.models.load(name, version)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception("Loading the served models failed, the server is not ready")
+        return
+    app.state.ready = True
+    logger.info(
+        "Server ready in %.2f s with %d models",
+        time.perf_counter() - start,
+        len(SERVED_MODELS),
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Event triggered on application shutdown to stop the warm-up and the job queue, and drain the
+    served models.
+    """
+    app.state.warm_up_task.cancel()
+    await app.state.jobs.stop()
+    await app.state.models.shutdown()
+
+
+# Give each request a request id, and log the stage durations of the predictions with it
+app.middleware("http")(request_id_middleware(logger))
+app.include_router(key_endpoints.router)
+app.include_router(job_endpoints.router)
+app.include_router(admin_endpoints.router)
 
 
 class PredictRequest(BaseModel):  # pylint: disable=too-few-public-methods
@@ -40,65 +281,367 @@ class PredictRequest(BaseModel):  # pylint: disable=too-few-public-methods
 
     Attributes:
         data (str): The encrypted input data in hex-encoded format.
+        client_id (str): The id under which the client uploaded its evaluation keys.
+        model (str): The name of the served model to run, the default model if None.
     """
 
     data: str
+    client_id: str = DEFAULT_CLIENT_ID
+    model: Optional[str] = None
+
+
+class PredictBatchRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """
+    Schema for predict_batch endpoint requests. Expects a list of hex-encoded strings, each one
+    representing an encrypted input.
+
+    Attributes:
+        data (List[str]): The encrypted inputs in hex-encoded format.
+        client_id (str): The id under which the client uploaded its evaluation keys.
+        model (str): The name of the served model to run, the default model if None.
+    """
+
+    data: List[str]
+    client_id: str = DEFAULT_CLIENT_ID
+    model: Optional[str] = None
 
 
-class EvaluationKeysRequest(BaseModel):
+class PlaintextPredictRequest(BaseModel):  # pylint: disable=too-few-public-methods
     """
-    Schema for evaluation_keys endpoint requests. Expects a hex-encoded string of the serialized
-    evaluation keys.
+    Schema for predict_plaintext endpoint requests. Expects scaled plaintext inputs and the
+    execution mode to run them in.
 
     Attributes:
-        keys (str): The serialized evaluation keys in hex-encoded format.
+        data (List[List[float]]): The scaled inputs, one row per sample.
+        mode (str): "clear" or "simulate".
+        model (str): The name of the served model to run, the default model if None.
     """
 
-    keys: str
+    data: List[List[float]]
+    mode: Literal["clear", "simulate"]
+    model: Optional[str] = None
 
 
 @app.post("/predict")
-async def predict(request: PredictRequest):
+async def predict(request: PredictRequest, response: Response):
     """
     Predict endpoint: Receives encrypted input data, runs the FHE model, and returns encrypted
     predictions.
 
-    This endpoint accepts encrypted data, decrypts it, runs the prediction using the FHE model,
-    and returns the encrypted prediction in hex format.
+    This endpoint accepts encrypted data, runs the prediction using the FHE model in a worker
+    process, batched with concurrent requests, and returns the encrypted prediction in hex
+    format. The event loop stays free to serve other requests while the inference runs.
 
     Args:
         request (PredictRequest): The encrypted input data as a hex-encoded string.
+        response (Response): The response, to which the Server-Timing header is added.
 
     Returns:
-        dict: A dictionary containing the encrypted prediction in hex format.
+        dict: A dictionary containing the encrypted prediction in hex format, the execution
+        mode, always "execute", and the name and version of the model that ran.
     """
-    encrypted_data = bytes.fromhex(request.data)
-    encrypted_result = server.run(
-        encrypted_data, serialized_evaluation_keys=app.state.evaluation_keys
+    served_model = get_served_model(app.state.models, request.model)
+    with served_model.acquire():
+        timings = {}
+        with timed(timings, "decode"):
+            encrypted_data = bytes.fromhex(request.data)
+        encrypted_result = await run_fhe_model(
+            served_model, request.client_id, encrypted_data, timings
+        )
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    return {
+        "prediction": encrypted_result.hex(),
+        "mode": "execute",
+        **model_fields(served_model),
+    }
+
+
+@app.post(
+    "/predict_binary",
+    openapi_extra=OCTET_STREAM_BODY,
+    response_class=Response,
+    responses={200: {"content": {"application/octet-stream": {}}}},
+)
+async def predict_binary(
+    request: Request, client_id: str = DEFAULT_CLIENT_ID, model: Optional[str] = None
+):
+    """
+    Predict_binary endpoint: Same as /predict, with raw bytes instead of hex-encoded JSON.
+
+    The request body is the serialized encrypted input and the response body is the serialized
+    encrypted prediction, both as application/octet-stream. This halves the payload size compared
+    to hex and avoids the string validation and hex conversions on both sides.
+
+    Args:
+        request (Request): The request whose body is the serialized encrypted input.
+        client_id (str): The id under which the client uploaded its evaluation keys, passed as a
+            query parameter.
+        model (str): The name of the served model to run, passed as a query parameter.
+
+    Returns:
+        Response: The serialized encrypted prediction, with the execution mode, always
+        "execute", in its X-Execution-Mode header, and the name and version of the model that
+        ran in its X-Model and X-Model-Version headers.
+
+    Raises:
+        HTTPException: 400 if the request body is empty.
+    """
+    served_model = get_served_model(app.state.models, model)
+    with served_model.acquire():
+        encrypted_data = await request.body()
+        if not encrypted_data:
+            raise HTTPException(status_code=400, detail="Empty request body")
+        timings = {}
+        encrypted_result = await run_fhe_model(
+            served_model, client_id, encrypted_data, timings
+        )
+    return Response(
+        content=encrypted_result,
+        media_type="application/octet-stream",
+        headers={
+            "Server-Timing": format_server_timing(timings),
+            "X-Execution-Mode": "execute",
+            "X-Model": served_model.name,
+            "X-Model-Version": str(served_model.version),
+        },
     )
-    return {"prediction": encrypted_result.hex()}
 
 
-@app.post("/evaluation_keys")
-async def receive_evaluation_keys(request: EvaluationKeysRequest):
+@app.websocket("/predict_stream")
+async def predict_stream(
+    websocket: WebSocket,
+    client_id: str = DEFAULT_CLIENT_ID,
+    model: Optional[str] = None,
+):
     """
-    Evaluation_keys endpoint: Receives the serialized evaluation keys.
+    Predict_stream endpoint: Streams encrypted predictions over a WebSocket, in a session bound
+    to the evaluation keys of the client.
 
-    This endpoint accepts evaluation keys in hex-encoded format, stores them in the server state,
-    and writes them to a file for future use during predictions.
+    The keys are looked up once, when the session starts. The client then sends its encrypted
+    inputs as binary messages tagged with request ids, without waiting for the previous
+    results, and receives each encrypted prediction as soon as it is computed, tagged with the
+    id of its input (see `src.library.stream_protocol`). At most STREAM_MAX_IN_FLIGHT
+    predictions of the session are in flight at once.
 
     Args:
-        request (EvaluationKeysRequest): The serialized evaluation keys as a hex-encoded string.
+        websocket (WebSocket): The WebSocket of the session.
+        client_id (str): The id under which the client uploaded its evaluation keys, passed as a
+            query parameter.
+        model (str): The name of the served model to run, passed as a query parameter.
+    """
+    await websocket.accept()
+    try:
+        served_model = get_served_model(app.state.models, model)
+        digest, evaluation_keys = await get_evaluation_keys(served_model, client_id)
+    except HTTPException as error:
+        await websocket.close(
+            code=CLOSE_CODE_OFFSET + error.status_code, reason=error.detail[:120]
+        )
+        return
+
+    def is_served():
+        return app.state.models.models.get(served_model.name) is served_model
+
+    session = PredictionSession(
+        websocket,
+        served_model,
+        digest,
+        evaluation_keys,
+        max_in_flight=STREAM_MAX_IN_FLIGHT,
+        is_served=is_served,
+    )
+    await session.run()
+
+
+async def run_job(job):
+    """
+    Run an FHE inference job on the served model it names, batched with concurrent inputs using
+    the same evaluation keys.
+
+    Args:
+        job (Job): The job.
+
+    Returns:
+        tuple: The serialized encrypted prediction (bytes), and the name and version of the
+        model that ran (dict).
+
+    Raises:
+        RuntimeError: If the model is not served, the client has no evaluation keys, or the FHE
+            model failed on the input.
+    """
+    try:
+        served_model = get_served_model(app.state.models, job.model)
+        with served_model.acquire():
+            encrypted_result = await run_fhe_model(
+                served_model, job.tenant, job.encrypted_data, {}
+            )
+    except HTTPException as error:
+        raise RuntimeError(error.detail) from error
+    return encrypted_result, model_fields(served_model)
+
+
+@app.post("/predict_batch")
+async def predict_batch(request: PredictBatchRequest, response: Response):
+    """
+    Predict_batch endpoint: Receives a list of encrypted inputs, runs the FHE model on all of
+    them, and returns the encrypted predictions.
+
+    The inputs are spread across the FHE worker pool. An invalid or failing input does not fail
+    the whole batch: its entry in the response carries an error message instead of a prediction.
+
+    Args:
+        request (PredictBatchRequest): The encrypted inputs as hex-encoded strings.
+        response (Response): The response, to which the Server-Timing header is added.
+
+    Returns:
+        dict: A dictionary with one entry per input, in the same order, either
+            {"prediction": <hex str>} or {"error": <str>}, the execution mode, always
+            "execute", and the name and version of the model that ran.
+
+    Raises:
+        HTTPException: 413 if the batch holds more than MAX_BATCH_SIZE inputs.
+    """
+    if len(request.data) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(request.data)} inputs exceeds {MAX_BATCH_SIZE}",
+        )
+
+    served_model = get_served_model(app.state.models, request.model)
+    with served_model.acquire():
+        timings = {}
+        with timed(timings, "keys"):
+            _, evaluation_keys = await get_evaluation_keys(
+                served_model, request.client_id
+            )
+        predictions = [None] * len(request.data)
+        indices, encrypted_inputs = [], []
+        with timed(timings, "decode"):
+            for index, data in enumerate(request.data):
+                try:
+                    encrypted_inputs.append(bytes.fromhex(data))
+                    indices.append(index)
+                except ValueError as error:
+                    predictions[index] = {"error": f"Invalid hex data: {error}"}
+
+        with timed(timings, "run"):
+            results = await served_model.fhe_pool.run_batch(
+                encrypted_inputs, evaluation_keys
+            )
+    for index, (encrypted_result, error) in zip(indices, results):
+        if error is None:
+            predictions[index] = {"prediction": encrypted_result.hex()}
+        else:
+            predictions[index] = {"error": error}
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    return {
+        "predictions": predictions,
+        "mode": "execute",
+        **model_fields(served_model),
+    }
+
+
+@app.post("/predict_plaintext")
+async def predict_plaintext(request: PlaintextPredictRequest, response: Response):
+    """
+    Predict_plaintext endpoint: Receives plaintext inputs and runs the model on them in the
+    clear or simulate execution mode.
+
+    The inputs are not encrypted and no evaluation keys are needed: this endpoint costs a
+    fraction of an FHE inference, for load tests and shadow traffic at production rates. The
+    model runs in a thread, off the event loop.
+
+    Args:
+        request (PlaintextPredictRequest): The scaled inputs and the execution mode.
+        response (Response): The response, to which the Server-Timing header is added.
 
     Returns:
-        dict: A status message indicating that the keys were successfully received and stored.
-    """
-    app.state.evaluation_keys = bytes.fromhex(request.keys)
-    with open(
-        os.path.join(fhe_directory, "serialized_evaluation_keys.ekl"), "wb"
-    ) as file_handler:
-        file_handler.write(app.state.evaluation_keys)
-    return {"status": "Keys received"}
+        dict: The probability of each class for each input, in the same order, the execution
+        mode that ran, and the name and version of the model that ran.
+
+    Raises:
+        HTTPException: 503 if the deployment files lack the model of the clear mode.
+    """
+    served_model = get_served_model(app.state.models, request.model)
+    timings = {}
+    try:
+        with served_model.acquire(), timed(timings, request.mode):
+            probabilities = await asyncio.to_thread(
+                served_model.plaintext_model.predict_proba,
+                np.array(request.data, dtype=np.float64),
+                request.mode,
+            )
+    except FileNotFoundError as error:
+        raise HTTPException(
+            status_code=503,
+            detail=f"The {request.mode} mode is unavailable: {error}",
+        ) from error
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    return {
+        "predictions": probabilities.tolist(),
+        "mode": request.mode,
+        **model_fields(served_model),
+    }
+
+
+@app.get("/status")
+async def status():
+    """
+    Status endpoint: Reports the load of the FHE worker pools and the content of the evaluation
+    key registries of the served models.
+
+    Returns:
+        dict: Whether the served models are all loaded, the name of the default model, under
+        "models", the state of each served model by name (see `ServedModel.stats`), under
+        "loading" and "failures", the versions being loaded and the last load errors by name,
+        and at the top level, the state of the default model: the number of workers, the number
+        of in-flight inferences and the queue depth (inferences waiting for a free worker),
+        under "keys", the number of clients, of distinct key sets, of key sets held in memory
+        and the memory they use, under "batching", the metrics of the dynamic batching of
+        single predictions, under "modes", the execution modes the server can run, and under
+        "model_version", the version of the model served (None for models/fhe_files), and under
+        "jobs", the state of the job queue (see `JobQueue.stats`).
+    """
+    models = app.state.models
+    stats = models.stats()
+    default_stats = stats["models"].get(models.default_name, {})
+    return {
+        **default_stats,
+        "model_version": default_stats.get("version"),
+        "ready": app.state.ready,
+        "default_model": models.default_name,
+        **stats,
+        "jobs": app.state.jobs.stats(),
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Ready endpoint: Tells load balancers whether to route requests to this server.
+
+    Returns:
+        dict: {"ready": True} once the FHE workers of all the served models are warmed up.
+
+    Raises:
+        HTTPException: 503 while the workers are warming up.
+    """
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="FHE workers are warming up")
+    return {"ready": True}
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Metrics endpoint: Exposes the Prometheus metrics of the server.
+
+    Returns:
+        Response: The metrics in the Prometheus text format: the stage duration histograms, the
+        dynamic batching histograms, the load of the worker pool and the content of the key
+        registry.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 if __name__ == "__main__":
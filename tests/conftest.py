@@ -0,0 +1,18 @@
+"""This module contains the fixtures shared by the tests."""
+
+import numpy as np
+import pytest
+from concrete.ml.sklearn.rf import RandomForestClassifier
+
+
+@pytest.fixture(name="compiled_model", scope="session")
+def fixture_compiled_model():
+    """
+    Trains and compiles a small model, returned with its training inputs.
+    """
+    rng = np.random.default_rng(0)
+    inputs = rng.normal(size=(200, 7))
+    model = RandomForestClassifier(n_estimators=3, max_depth=3)
+    model.fit(inputs, (inputs[:, 0] > 0).astype(int))
+    model.compile(inputs)
+    return model, inputs
@@ -0,0 +1,105 @@
+"""This module contains tests for the versioned store of the FHE deployment files."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from concrete.ml.sklearn.rf import RandomForestClassifier
+
+from src.library.models.artifact_store import (
+    ArtifactStore,
+    artifact_version,
+    fingerprint_data,
+    resolve_deployment_directory,
+)
+
+
+@pytest.fixture(name="training_data", scope="module")
+def fixture_training_data():
+    """
+    Generates a small training set.
+    """
+    rng = np.random.default_rng(0)
+    inputs = rng.normal(size=(200, 7))
+    return inputs, (inputs[:, 0] > 0).astype(int)
+
+
+def test_version_depends_on_the_build_inputs(training_data) -> None:
+    """
+    Checks that the version changes with the data and the hyperparameters only.
+    """
+    inputs, target = training_data
+    fingerprint = fingerprint_data(inputs, target)
+    version = artifact_version(fingerprint, RandomForestClassifier(n_estimators=3))
+
+    assert version == artifact_version(
+        fingerprint_data(inputs.copy(), target), RandomForestClassifier(n_estimators=3)
+    )
+    assert version != artifact_version(
+        fingerprint, RandomForestClassifier(n_estimators=4)
+    )
+    assert version != artifact_version(
+        fingerprint_data(inputs[1:], target[1:]), RandomForestClassifier(n_estimators=3)
+    )
+
+
+def test_saved_versions_are_kept_and_resolved(training_data, tmp_path) -> None:
+    """
+    Checks that each saved version keeps its own files, that the last one is served by
+    default and that a version can be pinned.
+    """
+    inputs, target = training_data
+    store = ArtifactStore(str(tmp_path))
+    fingerprint = fingerprint_data(inputs, target)
+    versions = []
+    for n_estimators in (2, 3):
+        model = RandomForestClassifier(n_estimators=n_estimators, max_depth=3)
+        version = artifact_version(fingerprint, model)
+        model.fit(inputs, target)
+        model.compile(inputs)
+        path_dir = store.save_model(
+            version,
+            model,
+            fingerprint,
+            writers=[lambda path_dir: Path(path_dir, "extra.txt").touch()],
+        )
+        versions.append(version)
+
+        assert sorted(os.listdir(path_dir)) == [
+            "clear_model.json",
+            "client.zip",
+            "extra.txt",
+            "manifest.json",
+            "server.zip",
+        ]
+        assert store.manifest(version)["params"]["n_estimators"] == n_estimators
+
+    assert [manifest["version"] for manifest in store.versions()] == versions
+    assert resolve_deployment_directory(None, str(tmp_path)) == (
+        versions[1],
+        store.path(versions[1]),
+    )
+    assert resolve_deployment_directory(versions[0], str(tmp_path)) == (
+        versions[0],
+        store.path(versions[0]),
+    )
+    with pytest.raises(FileNotFoundError):
+        resolve_deployment_directory("0" * 16, str(tmp_path))
+
+
+def test_failed_build_leaves_no_version(tmp_path) -> None:
+    """
+    Checks that a build interrupted by an error is not in the store, and that an empty
+    store serves the legacy deployment files.
+    """
+    store = ArtifactStore(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with store.build("version", {}):
+            raise RuntimeError("Compilation failed")
+
+    assert not os.listdir(tmp_path)
+    assert resolve_deployment_directory(None, str(tmp_path), "legacy") == (
+        None,
+        "legacy",
+    )
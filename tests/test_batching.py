@@ -0,0 +1,117 @@
+"""This module contains tests for the dynamic batching of single predictions of the server."""
+
+import asyncio
+
+from src.server.batching import DynamicBatcher
+
+
+class FakePool:  # pylint: disable=too-few-public-methods
+    """
+    Stands for the FHE worker pool: records the batches it runs and answers with the input
+    prefixed by the keys, or an error for the input b"bad".
+    """
+
+    def __init__(self, workers, queue_depth=0):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.batches = []
+
+    async def run_batch(self, encrypted_inputs, serialized_evaluation_keys):
+        """
+        Runs a batch, returning one `(result, error)` pair per input.
+        """
+        self.batches.append(list(encrypted_inputs))
+        await asyncio.sleep(0)
+        return [
+            (
+                (None, "failed")
+                if data == b"bad"
+                else (serialized_evaluation_keys + data, None)
+            )
+            for data in encrypted_inputs
+        ]
+
+
+def test_concurrent_requests_are_batched() -> None:
+    """
+    Checks that concurrent requests with the same keys run in one batch and that each one gets
+    its own result.
+    """
+    pool = FakePool(workers=4)
+
+    async def scenario():
+        batcher = DynamicBatcher(pool, max_batch_size=32, max_wait=10)
+        return (
+            await asyncio.gather(
+                *(batcher.run(bytes([i]), b"k", "digest") for i in range(4))
+            ),
+            batcher.stats(),
+        )
+
+    results, stats = asyncio.run(scenario())
+
+    assert results == [b"k" + bytes([i]) for i in range(4)]
+    assert pool.batches == [[bytes([i]) for i in range(4)]]
+    assert stats["batches"] == 1
+    assert stats["mean_fill_rate"] == 1.0
+
+
+def test_batches_are_split_by_keys_and_flushed_after_max_wait() -> None:
+    """
+    Checks that requests with different keys run in different batches, dispatched after the
+    maximum wait when they do not fill up.
+    """
+    pool = FakePool(workers=4)
+
+    async def scenario():
+        batcher = DynamicBatcher(pool, max_batch_size=32, max_wait=0.01)
+        return (
+            await asyncio.gather(
+                batcher.run(b"1", b"a", "digest_a"), batcher.run(b"2", b"b", "digest_b")
+            ),
+            batcher.stats(),
+        )
+
+    results, stats = asyncio.run(scenario())
+
+    assert results == [b"a1", b"b2"]
+    assert pool.batches == [[b"1"], [b"2"]]
+    assert stats["mean_fill_rate"] == 0.25
+    assert stats["max_queueing_ms"] >= 10
+
+
+def test_batch_size_adapts_to_queue_depth() -> None:
+    """
+    Checks that the target batch size grows with the queue depth of the pool, within the
+    maximum batch size.
+    """
+    pool = FakePool(workers=2)
+    batcher = DynamicBatcher(pool, max_batch_size=8, max_wait=0.01)
+    assert batcher.target_batch_size() == 2
+
+    pool.queue_depth = 3
+    assert batcher.target_batch_size() == 5
+
+    pool.queue_depth = 100
+    assert batcher.target_batch_size() == 8
+
+
+def test_failing_input_only_fails_its_request() -> None:
+    """
+    Checks that an input failing in the FHE model raises for its request only.
+    """
+    pool = FakePool(workers=2)
+
+    async def scenario():
+        batcher = DynamicBatcher(pool, max_batch_size=32, max_wait=10)
+        return await asyncio.gather(
+            batcher.run(b"bad", b"k", "digest"),
+            batcher.run(b"1", b"k", "digest"),
+            return_exceptions=True,
+        )
+
+    error, result = asyncio.run(scenario())
+
+    assert isinstance(error, RuntimeError)
+    assert str(error) == "failed"
+    assert result == b"k1"
@@ -0,0 +1,47 @@
+"""This module contains tests for the static cost report of the FHE circuits."""
+
+import json
+
+import pytest
+
+from src.library.models.circuit_cost import (
+    _machine,
+    calibrate_latency,
+    circuit_cost_report,
+)
+
+
+def test_report_of_a_compiled_model(compiled_model) -> None:
+    """
+    Checks that the report gives the statistics of the circuit, and a predicted latency
+    proportional to its complexity.
+
+    Args:
+        compiled_model: Fixture of a small compiled model.
+    """
+    model, _ = compiled_model
+
+    report = circuit_cost_report(model, seconds_per_complexity=1e-9)
+
+    assert (
+        report["Max Bit-Width"] == model.fhe_circuit.graph.maximum_integer_bit_width()
+    )
+    assert report["PBS Count"] == model.fhe_circuit.programmable_bootstrap_count > 0
+    assert report["Evaluation Key Size (MB)"] > 0
+    assert report["Predicted Latency (ms)"] == pytest.approx(
+        report["Circuit Complexity"] * 1e-6
+    )
+    json.dumps(report)
+
+
+def test_calibration_is_reused_on_the_same_machine(tmp_path) -> None:
+    """
+    Checks that a calibration measured on this machine is read back without running
+    the reference circuit.
+    """
+    calibration_path = tmp_path / "latency_calibration.json"
+    calibration_path.write_text(
+        json.dumps({"machine": _machine(), "seconds_per_complexity": 1.5e-10})
+    )
+
+    assert calibrate_latency(str(calibration_path)) == 1.5e-10
@@ -0,0 +1,83 @@
+"""This module contains tests for the negotiated compression of the request and response bodies."""
+
+import os
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from src.library.compression import (
+    available_codecs,
+    compress,
+    decompress,
+    negotiate,
+    parse_codecs,
+)
+from src.server.content_encoding import CompressedRoute, ContentEncoding
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_codecs_round_trip(codec) -> None:
+    """
+    Checks that each codec decompresses what it compresses, within the maximum size only.
+    """
+    data = os.urandom(512) * 64
+    compressed, cpu_seconds = compress(data, codec)
+
+    assert len(compressed) < len(data)
+    assert cpu_seconds >= 0
+    assert decompress(compressed, codec)[0] == data
+    with pytest.raises(ValueError):
+        decompress(compressed, codec, max_size=len(data) - 1)
+    with pytest.raises(ValueError):
+        decompress(b"not compressed", codec)
+
+
+def test_negotiation() -> None:
+    """
+    Checks the parsing of the configured codecs and the choice of a codec from an
+    Accept-Encoding header.
+    """
+    assert parse_codecs("gzip:9") == {"gzip": 9}
+    assert not parse_codecs("")
+    with pytest.raises(ValueError):
+        parse_codecs("brotli")
+
+    assert negotiate("gzip, zstd", ["zstd", "gzip"]) == "zstd"
+    assert negotiate("zstd;q=0.5, gzip", ["zstd", "gzip"]) == "gzip"
+    assert negotiate("*, zstd;q=0", ["zstd", "gzip"]) == "gzip"
+    assert negotiate("identity", ["gzip"]) is None
+    assert negotiate(None, ["gzip"]) is None
+
+
+def test_compressed_route() -> None:
+    """
+    Checks that request bodies are decompressed before the endpoint reads them, and that
+    response bodies are compressed with the codec accepted by the client.
+    """
+    app = FastAPI()
+    app.router.route_class = CompressedRoute
+    app.state.content_encoding = ContentEncoding({"gzip": None}, 256, 1 << 20)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return Response(content=await request.body())
+
+    client = TestClient(app)
+    data = b"ciphertext" * 100
+    compressed, _ = compress(data, "gzip")
+
+    response = client.post(
+        "/echo", content=compressed, headers={"Content-Encoding": "gzip"}
+    )
+    assert response.content == data
+    assert response.headers["Accept-Encoding"] == "gzip, identity"
+    assert "decompress" in response.headers["Server-Timing"]
+
+    response = client.post("/echo", content=data, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.content == data
+
+    response = client.post("/echo", content=data, headers={"Content-Encoding": "br"})
+    assert response.status_code == 415
+    assert response.headers["Accept-Encoding"] == "gzip, identity"
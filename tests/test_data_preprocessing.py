@@ -0,0 +1,90 @@
+"""This module contains tests for the chunked loading and class balancing of the dataset."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.library.preprocessing.data_preprocessing import (
+    ARRAY_NAMES,
+    COLUMN_DTYPES,
+    load_balanced_data,
+    prepare_processed_data,
+    split_data,
+)
+
+
+@pytest.fixture(name="dataset_path")
+def fixture_dataset_path(tmp_path):
+    """
+    Writes a dataset of 1000 transactions, 100 of them fraudulent, in the format of
+    card_transdata.csv (flags written as floats).
+    """
+    rng = np.random.default_rng(0)
+    dataframe = pd.DataFrame(
+        {
+            name: (
+                rng.random(1000) * 10
+                if dtype == np.float32
+                else rng.integers(0, 2, 1000)
+            )
+            for name, dtype in COLUMN_DTYPES.items()
+        },
+        dtype=np.float64,
+    )
+    dataframe["fraud"] = (np.arange(1000) % 10 == 0).astype(np.float64)
+    path = tmp_path / "card_transdata.csv"
+    dataframe.to_csv(path, index=False)
+    return path
+
+
+def test_balanced_sample_with_compact_dtypes(dataset_path) -> None:
+    """
+    Checks that the sample read in chunks has as many rows of each class as the smallest
+    class, with the compact dtypes, and does not depend on the chunk size.
+    """
+    sample = load_balanced_data(dataset_path, chunksize=64)
+
+    assert sample["fraud"].value_counts().to_dict() == {0: 100, 1: 100}
+    assert sample.dtypes.to_dict() == COLUMN_DTYPES
+    pd.testing.assert_frame_equal(
+        sample, load_balanced_data(dataset_path, chunksize=1000)
+    )
+
+
+def test_max_per_class_bounds_the_sample(dataset_path) -> None:
+    """
+    Checks that the sample holds at most max_per_class rows of each class.
+    """
+    sample = load_balanced_data(dataset_path, max_per_class=30, chunksize=64)
+
+    assert sample["fraud"].value_counts().to_dict() == {0: 30, 1: 30}
+    assert not sample.duplicated().any()
+
+
+def test_split_data_balances_a_loaded_dataset(dataset_path) -> None:
+    """
+    Checks that split_data balances a dataset that was not loaded balanced.
+    """
+    features, target = split_data(pd.read_csv(dataset_path, dtype=COLUMN_DTYPES))
+
+    assert list(features.columns) == list(COLUMN_DTYPES)[:-1]
+    assert target.value_counts().to_dict() == {0: 100, 1: 100}
+
+
+def test_processed_data_is_cached_by_content(dataset_path, tmp_path) -> None:
+    """
+    Checks that the processed arrays are saved once per content of the CSV file and
+    memory-mapped when loaded.
+    """
+    cache_dir = tmp_path / "processed"
+    processed_data = prepare_processed_data(dataset_path, cache_dir)
+
+    assert list(processed_data) == list(ARRAY_NAMES)
+    assert isinstance(processed_data["x_train"], np.memmap)
+    assert len(processed_data["y_train"]) + len(processed_data["y_val"]) == 160
+    directory = processed_data.directory
+    assert prepare_processed_data(dataset_path, cache_dir).directory == directory
+
+    dataset_path.write_text(dataset_path.read_text() + "1,1,1,1,1,1,1,1\n")
+    assert prepare_processed_data(dataset_path, cache_dir).directory != directory
+    assert len(list(cache_dir.iterdir())) == 2
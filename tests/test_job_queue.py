@@ -0,0 +1,97 @@
+"""This module contains tests for the queue of FHE inference jobs."""
+
+import asyncio
+
+import pytest
+
+from src.server.job_queue import Job, JobQueue, JobScheduler, QueueFullError
+
+
+def test_scheduler_serves_priorities_then_tenants_in_turn() -> None:
+    """
+    Checks that realtime jobs are taken before batch jobs, and that the tenants of a priority
+    class take turns.
+    """
+    scheduler = JobScheduler()
+    for tenant, priority in [
+        ("alice", "batch"),
+        ("alice", "batch"),
+        ("alice", "batch"),
+        ("bob", "batch"),
+        ("carol", "realtime"),
+        ("bob", "realtime"),
+        ("carol", "realtime"),
+    ]:
+        scheduler.push(Job(tenant, None, priority, b"input"))
+
+    order = [(job.priority, job.tenant) for job in iter(scheduler.pop, None)]
+    assert order == [
+        ("realtime", "carol"),
+        ("realtime", "bob"),
+        ("realtime", "carol"),
+        ("batch", "alice"),
+        ("batch", "bob"),
+        ("batch", "alice"),
+        ("batch", "alice"),
+    ]
+    assert not scheduler
+
+
+def test_full_queue_rejects_with_retry_after() -> None:
+    """
+    Checks that a priority class rejects jobs beyond its size with a retry delay, that the other
+    class still accepts them, and that the results and errors of the jobs can be waited for.
+    """
+
+    async def run_job(job):
+        await asyncio.sleep(0.05)
+        if job.encrypted_data == b"bad":
+            raise RuntimeError("FHE model failed")
+        return job.encrypted_data[::-1], {"model": "default"}
+
+    async def scenario():
+        queue = JobQueue(run_job, max_queued=2, concurrency=1, result_ttl=60)
+        jobs = [queue.submit("alice", None, "batch", b"abc") for _ in range(2)]
+        with pytest.raises(QueueFullError) as error:
+            queue.submit("bob", None, "batch", b"abc")
+        assert error.value.retry_after == 2
+        failed = queue.submit("bob", None, "realtime", b"bad")
+
+        queue.start()
+        assert not await queue.wait(jobs[1], 0.01)
+        assert await queue.wait(jobs[1], 5)
+        await queue.stop()
+
+        assert failed.started_at < jobs[0].started_at
+        assert queue.get(failed.job_id).describe()["error"] == "FHE model failed"
+        assert jobs[1].encrypted_result == b"cba"
+        assert jobs[1].describe()["model"] == "default"
+        assert queue.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_polls_and_purge_of_finished_jobs() -> None:
+    """
+    Checks that polling without waiting reports whether a job is finished, and that at most
+    `max_finished` finished jobs are kept, the oldest ones being forgotten first.
+    """
+
+    async def run_job(job):
+        await asyncio.sleep(0.01)
+        return job.encrypted_data, {}
+
+    async def scenario():
+        queue = JobQueue(run_job, 10, 1, 60, max_finished=2)
+        jobs = [queue.submit("alice", None, "realtime", bytes([i])) for i in range(3)]
+        assert not await queue.wait(jobs[0], 0)
+
+        queue.start()
+        assert await queue.wait(jobs[2], 5)
+        await queue.stop()
+        assert await queue.wait(jobs[2], 0)
+        with pytest.raises(KeyError):
+            queue.get(jobs[0].job_id)
+        assert [queue.get(job.job_id) for job in jobs[1:]] == jobs[1:]
+
+    asyncio.run(scenario())
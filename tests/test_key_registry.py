@@ -0,0 +1,94 @@
+"""This module contains tests for the evaluation key registry of the server."""
+
+import os
+
+import pytest
+
+from src.server.key_registry import KeyRegistry
+
+
+@pytest.fixture(name="registry")
+def _registry_fixture(tmp_path) -> KeyRegistry:
+    """
+    Creates a registry holding at most 10 bytes of keys in memory.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    Returns:
+        registry (KeyRegistry): The empty registry.
+    """
+    return KeyRegistry(str(tmp_path / "keys"), memory_budget=10)
+
+
+def test_clients_keep_their_own_keys(registry: KeyRegistry) -> None:
+    """
+    Checks that a client uploading keys does not overwrite the keys of another client.
+
+    Args:
+        registry: The key registry.
+    """
+    registry.put("alice", b"alice")
+    registry.put("bob", b"bob")
+
+    assert registry.get("alice") == b"alice"
+    assert registry.get("bob") == b"bob"
+    with pytest.raises(KeyError):
+        registry.get("carol")
+
+
+def test_identical_keys_are_stored_once(registry: KeyRegistry) -> None:
+    """
+    Checks that identical key uploads share one file and one in-memory copy.
+
+    Args:
+        registry: The key registry.
+    """
+    digest_alice = registry.put("alice", b"same")
+    digest_bob = registry.put("bob", b"same")
+
+    assert digest_alice == digest_bob
+    assert os.listdir(registry.spill_dir) == [f"{digest_alice}.ekl"]
+    stats = registry.stats()
+    assert stats["clients"] == 2
+    assert stats["key_sets"] == 1
+    assert stats["memory_bytes"] == 4
+
+
+def test_evicted_keys_are_reloaded_from_disk(registry: KeyRegistry) -> None:
+    """
+    Checks that the least recently used keys are evicted beyond the memory budget, and that
+    evicted keys are reloaded lazily.
+
+    Args:
+        registry: The key registry.
+    """
+    registry.put("alice", b"aaaaaa")
+    registry.put("bob", b"bbbbbb")
+
+    # Only the most recent key set fits in the 10 bytes budget
+    assert registry.stats()["key_sets_in_memory"] == 1
+    assert registry.stats()["memory_bytes"] == 6
+
+    assert registry.get("alice") == b"aaaaaa"
+    assert registry.get("bob") == b"bbbbbb"
+    assert registry.stats()["memory_bytes"] == 6
+
+
+def test_bind_reuses_stored_keys(registry: KeyRegistry) -> None:
+    """
+    Checks that a client can bind keys already stored by their digest, including after a
+    restart of the registry, and that unknown digests are refused.
+
+    Args:
+        registry: The key registry.
+    """
+    digest = registry.put("alice", b"keys")
+
+    restarted_registry = KeyRegistry(registry.spill_dir, memory_budget=10)
+    assert restarted_registry.bind("bob", digest)
+    assert restarted_registry.get("bob") == b"keys"
+
+    assert not restarted_registry.bind("carol", "0" * 64)
+    assert not restarted_registry.bind("carol", "../keys")
+    with pytest.raises(KeyError):
+        restarted_registry.get("carol")
@@ -0,0 +1,136 @@
+"""This module contains tests for the chunked uploads of evaluation keys."""
+
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+from src.server.key_registry import KeyRegistry
+from src.server.key_uploads import IncompleteUploadError, KeyUploads
+
+KEYS = bytes(range(256)) * 4
+DIGEST = hashlib.sha256(KEYS).hexdigest()
+
+
+@pytest.fixture(name="uploads")
+def _uploads_fixture(tmp_path) -> KeyUploads:
+    """
+    Creates the uploads of a registry, in parts of 300 bytes.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    Returns:
+        uploads (KeyUploads): The uploads, without any in progress.
+    """
+    registry = KeyRegistry(str(tmp_path / "keys"), memory_budget=1 << 20)
+    return KeyUploads(
+        str(tmp_path / "keys" / "uploads"),
+        registry,
+        part_size=300,
+        max_size=1 << 20,
+        max_age=3600,
+    )
+
+
+async def chunks_of(data, chunk_size=64):
+    """
+    Yields the chunks of a part, as the stream of a request body would.
+    """
+    for start in range(0, len(data), chunk_size):
+        end = start + chunk_size
+        yield data[start:end]
+
+
+def send_part(uploads, upload_id, index):
+    """
+    Sends a part of KEYS to an upload.
+    """
+    start, end = index * 300, (index + 1) * 300
+    part = KEYS[start:end]
+    return asyncio.run(uploads.write_part(upload_id, index, chunks_of(part)))
+
+
+def test_interrupted_upload_is_resumed(uploads: KeyUploads) -> None:
+    """
+    Checks that starting an upload again returns the parts already received, and that the
+    committed keys are registered for the client.
+
+    Args:
+        uploads: The key uploads.
+    """
+    upload = uploads.start("alice", len(KEYS), DIGEST)
+    assert (upload["parts"], upload["received"]) == (4, [])
+    send_part(uploads, upload["upload_id"], 2)
+    send_part(uploads, upload["upload_id"], 0)
+
+    resumed = uploads.start("alice", len(KEYS), DIGEST)
+    assert resumed["upload_id"] == upload["upload_id"]
+    assert resumed["received"] == [0, 2]
+    with pytest.raises(IncompleteUploadError):
+        uploads.commit(upload["upload_id"], DIGEST)
+
+    for index in (1, 3):
+        send_part(uploads, upload["upload_id"], index)
+    assert uploads.commit(upload["upload_id"], DIGEST)["digest"] == DIGEST
+    assert uploads.key_registry.get("alice") == KEYS
+    with pytest.raises(KeyError):
+        uploads.status(upload["upload_id"])
+
+
+def test_invalid_parts_and_checksum_are_rejected(uploads: KeyUploads) -> None:
+    """
+    Checks that a part of the wrong size is not kept, and that a key set whose checksum does
+    not match is not registered.
+
+    Args:
+        uploads: The key uploads.
+    """
+    upload = uploads.start("bob", len(KEYS), "0" * 64)
+    with pytest.raises(ValueError):
+        asyncio.run(uploads.write_part(upload["upload_id"], 0, chunks_of(KEYS[:100])))
+    with pytest.raises(ValueError):
+        send_part(uploads, upload["upload_id"], 4)
+    assert uploads.status(upload["upload_id"])["received"] == []
+
+    for index in range(4):
+        send_part(uploads, upload["upload_id"], index)
+    with pytest.raises(ValueError):
+        uploads.commit(upload["upload_id"], "0" * 64)
+    with pytest.raises(KeyError):
+        uploads.key_registry.get("bob")
+
+
+def test_commit_does_not_block_the_other_uploads(
+    uploads: KeyUploads, monkeypatch
+) -> None:
+    """
+    Checks that the other uploads start while a commit is registering its keys, and that the
+    upload being committed can no longer be found.
+
+    Args:
+        uploads: The key uploads.
+        monkeypatch: Pytest fixture to hold the registration of the committed keys.
+    """
+    registering, registered = threading.Event(), threading.Event()
+    put_file = uploads.key_registry.put_file
+
+    def held_put_file(*args):
+        registering.set()
+        registered.wait(5)
+        return put_file(*args)
+
+    monkeypatch.setattr(uploads.key_registry, "put_file", held_put_file)
+    upload = uploads.start("alice", len(KEYS), DIGEST)
+    for index in range(4):
+        send_part(uploads, upload["upload_id"], index)
+    commit = threading.Thread(target=uploads.commit, args=(upload["upload_id"], DIGEST))
+    commit.start()
+    assert registering.wait(5)
+
+    assert uploads.start("bob", len(KEYS), DIGEST)["upload_id"] != upload["upload_id"]
+    with pytest.raises(KeyError):
+        uploads.commit(upload["upload_id"], DIGEST)
+    registered.set()
+    commit.join()
+    assert uploads.key_registry.get("alice") == KEYS
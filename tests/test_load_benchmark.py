@@ -0,0 +1,50 @@
+"""This module contains tests for the report of the load benchmark."""
+
+import pytest
+
+from src.benchmark.load_benchmark import parse_mix, parse_server_timing, summarize
+
+
+def test_parse_mix() -> None:
+    """
+    Checks that a request mix is normalized and that unknown endpoints are refused.
+    """
+    assert parse_mix("predict=3,predict_batch=1") == {
+        "predict": 0.75,
+        "predict_batch": 0.25,
+    }
+    assert parse_mix("predict") == {"predict": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("evaluation_keys=1")
+
+
+def test_summarize() -> None:
+    """
+    Checks the throughput, errors, latency percentiles, bytes and stages of a summary.
+    """
+    records = [
+        {
+            "endpoint": "predict",
+            "rows": 1,
+            "ok": True,
+            "status": 200,
+            "latency": latency / 1000,
+            "bytes_sent": 10,
+            "bytes_received": 20,
+            "stages": parse_server_timing(f"encrypt;dur=1.5, server.run;dur={latency}"),
+        }
+        for latency in range(1, 101)
+    ]
+    records.append({"endpoint": "predict", "rows": 1, "ok": False, "status": 500})
+
+    summary = summarize(records, duration=10)
+
+    assert summary["requests"] == 101
+    assert summary["errors"] == {"500": 1}
+    assert summary["throughput_rps"] == 10
+    assert summary["latency_ms"]["p50"] == pytest.approx(50.5)
+    assert summary["latency_ms"]["p99"] == pytest.approx(99.01)
+    assert summary["latency_ms"]["max"] == pytest.approx(100)
+    assert summary["bytes_sent"] == 1000
+    assert summary["stages_ms"]["encrypt"]["mean"] == 1.5
+    assert summary["stages_ms"]["server.run"]["max"] == 100
@@ -0,0 +1,167 @@
+"""This module contains tests for the registry of the models served by the FHE server."""
+
+import asyncio
+
+import pytest
+
+from src.server.key_registry import KeyRegistry
+from src.server.model_registry import (
+    ModelKeys,
+    ModelRegistry,
+    ServedModel,
+    parse_served_models,
+)
+
+
+class FakePool:  # pylint: disable=too-few-public-methods
+    """
+    Stands for the FHE worker pool of a served model.
+    """
+
+    def __init__(self):
+        self.stopped = False
+
+    def shutdown(self):
+        """
+        Records that the pool was stopped.
+        """
+        self.stopped = True
+
+
+async def load_fake_model(name, version):
+    """
+    Loads a served model without workers, failing for the "broken" version.
+    """
+    await asyncio.sleep(0)
+    if version == "broken":
+        raise RuntimeError("Compilation failed")
+    return ServedModel(
+        name,
+        version,
+        fhe_pool=FakePool(),
+        batcher=None,
+        keys=None,
+        plaintext_model=None,
+    )
+
+
+def test_parse_served_models() -> None:
+    """
+    Checks the parsing of the SERVED_MODELS environment variable.
+    """
+    assert parse_served_models("", "v1") == {"default": "v1"}
+    assert parse_served_models("default=v1, canary=") == {
+        "default": "v1",
+        "canary": None,
+    }
+    with pytest.raises(ValueError):
+        parse_served_models("=v1")
+
+
+def test_reload_drains_the_previous_model() -> None:
+    """
+    Checks that a new version replaces the served one, which is only stopped once its
+    request has completed, and that a failed load keeps the served version.
+    """
+
+    async def scenario():
+        models = ModelRegistry(load_fake_model, "default")
+        old_model = await models.load("default", "v1")
+        with old_model.acquire():
+            reload = asyncio.create_task(models.load("default", "v2"))
+            await asyncio.sleep(0.05)
+            assert models.get().version == "v2"
+            assert not old_model.fhe_pool.stopped
+        await reload
+        assert old_model.fhe_pool.stopped
+
+        with pytest.raises(RuntimeError):
+            await models.load("default", "broken")
+        assert models.get().version == "v2"
+        assert "default" in models.failures
+
+        models.start_load("canary", "v3")
+        with pytest.raises(RuntimeError):
+            models.start_load("canary", "v3")
+        await asyncio.sleep(0.05)
+        assert models.get("canary").version == "v3"
+        await models.shutdown()
+        assert not models.models
+
+    asyncio.run(scenario())
+
+
+def test_keys_are_available_while_loading() -> None:
+    """
+    Checks that the keys of a model are available while its first version is loading, and are
+    those of the served model once it is warm.
+    """
+    warm = asyncio.Event()
+    loading_keys = ModelKeys("loading registry", "loading uploads")
+    served_keys = ModelKeys("registry", "uploads")
+
+    async def scenario():
+        async def load_slow_model(name, version):
+            models.provide_keys(name, loading_keys)
+            await warm.wait()
+            return ServedModel(
+                name,
+                version,
+                fhe_pool=FakePool(),
+                batcher=None,
+                keys=served_keys,
+                plaintext_model=None,
+            )
+
+        models = ModelRegistry(load_slow_model, "default")
+        with pytest.raises(KeyError):
+            models.get_keys()
+        load = asyncio.create_task(models.load("default", "v1"))
+        await asyncio.sleep(0)
+        assert models.get_keys() is loading_keys
+        with pytest.raises(KeyError):
+            models.get()
+
+        warm.set()
+        await load
+        assert models.get_keys() is served_keys
+        assert not models.loading_keys
+
+    asyncio.run(scenario())
+
+
+def test_reload_keeps_the_keys_bound_to_the_clients(tmp_path) -> None:
+    """
+    Checks that a client bound to its keys stays bound to them when its model is reloaded from
+    the same keys directory, and that a version with other keys does not share them.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+
+    async def load_model_with_keys(name, version):
+        keys_directory = str(tmp_path / version)
+        keys = models.find_keys(keys_directory)
+        if keys is None:
+            keys = ModelKeys(KeyRegistry(keys_directory, 1 << 20), None)
+        models.provide_keys(name, keys)
+        return ServedModel(
+            name,
+            version,
+            fhe_pool=FakePool(),
+            batcher=None,
+            keys=keys,
+            plaintext_model=None,
+        )
+
+    async def scenario():
+        await models.load("default", "v1")
+        models.get().key_registry.put("alice", b"keys")
+        await models.load("default", "v1")
+        assert models.get().key_registry.get("alice") == b"keys"
+        await models.load("default", "v2")
+        assert "alice" not in models.get().key_registry
+        await models.shutdown()
+
+    models = ModelRegistry(load_model_with_keys, "default")
+    asyncio.run(scenario())
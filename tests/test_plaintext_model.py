@@ -0,0 +1,54 @@
+"""This module contains tests for the clear and simulate execution modes of the server."""
+
+import os
+
+import numpy as np
+import pytest
+from concrete.ml.deployment import FHEModelDev
+
+from src.server.plaintext_model import CLEAR_MODEL_FILE, PlaintextModel
+
+
+@pytest.fixture(name="deployment", scope="module")
+def fixture_deployment(tmp_path_factory, compiled_model):
+    """
+    Saves the deployment files and the clear model of a small compiled model.
+    """
+    model, inputs = compiled_model
+
+    path_dir = str(tmp_path_factory.mktemp("fhe_files"))
+    FHEModelDev(path_dir=path_dir, model=model).save()
+    with open(os.path.join(path_dir, CLEAR_MODEL_FILE), "w", encoding="utf-8") as f:
+        model.dump(f)
+    return path_dir, model, inputs[:5]
+
+
+def test_clear_and_simulate_match_the_model(deployment) -> None:
+    """
+    Checks that both plaintext modes return the probabilities of the quantized model.
+    """
+    path_dir, model, inputs = deployment
+    expected = model.predict_proba(inputs, fhe="disable")
+    plaintext_model = PlaintextModel(path_dir)
+
+    assert plaintext_model.available_modes() == ["clear", "simulate", "execute"]
+    np.testing.assert_allclose(plaintext_model.predict_proba(inputs, "clear"), expected)
+    np.testing.assert_allclose(
+        plaintext_model.predict_proba(inputs, "simulate"), expected
+    )
+
+
+def test_clear_mode_needs_the_clear_model(deployment, tmp_path) -> None:
+    """
+    Checks that without clear_model.json, the clear mode is unavailable.
+    """
+    path_dir, _, inputs = deployment
+    for name in ("client.zip", "server.zip"):
+        os.link(os.path.join(path_dir, name), tmp_path / name)
+    plaintext_model = PlaintextModel(str(tmp_path))
+
+    assert plaintext_model.available_modes() == ["simulate", "execute"]
+    with pytest.raises(FileNotFoundError):
+        plaintext_model.predict_proba(inputs, "clear")
+    with pytest.raises(ValueError):
+        plaintext_model.predict_proba(inputs, "execute")
@@ -0,0 +1,101 @@
+"""This module contains tests for the prediction sessions of the streaming endpoint."""
+
+import asyncio
+import json
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from src.library.stream_protocol import pack_frame, unpack_frame
+from src.server.model_registry import ServedModel
+from src.server.prediction_session import PredictionSession
+
+
+class SlowBatcher:  # pylint: disable=too-few-public-methods
+    """
+    Batcher answering each input after a delay given by its first byte, in milliseconds, and
+    recording the largest number of inputs running at once.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def run(self, encrypted_data, serialized_evaluation_keys, digest):
+        """
+        Return the input reversed, or fail on an input starting with 0.
+        """
+        assert (serialized_evaluation_keys, digest) == (b"keys", "digest")
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(encrypted_data[0] / 1000)
+            if encrypted_data[0] == 0:
+                raise RuntimeError("FHE model failed")
+            return encrypted_data[::-1]
+        finally:
+            self.running -= 1
+
+
+def make_app(batcher, max_in_flight):
+    """
+    Creates an application serving prediction sessions on a model with the given batcher.
+    """
+    app = FastAPI()
+    served_model = ServedModel(
+        "default", "v1", fhe_pool=None, batcher=batcher, keys=None, plaintext_model=None
+    )
+
+    @app.websocket("/predict_stream")
+    async def predict_stream(websocket: WebSocket):
+        await websocket.accept()
+        session = PredictionSession(
+            websocket,
+            served_model,
+            "digest",
+            b"keys",
+            max_in_flight=max_in_flight,
+            is_served=lambda: True,
+        )
+        await session.run()
+
+    return app
+
+
+def test_results_are_tagged_in_completion_order() -> None:
+    """
+    Checks that pipelined inputs are answered as they complete, tagged with their request id,
+    and that a failed input is answered with an error.
+    """
+    client = TestClient(make_app(SlowBatcher(), max_in_flight=8))
+    with client.websocket_connect("/predict_stream") as websocket:
+        assert websocket.receive_json() == {
+            "model": "default",
+            "model_version": "v1",
+            "max_in_flight": 8,
+        }
+        for request_id, delay in enumerate((200, 100, 0)):
+            websocket.send_bytes(pack_frame(request_id, bytes([delay, 1, 2])))
+
+        assert json.loads(websocket.receive_text()) == {
+            "id": 2,
+            "error": "FHE model failed",
+        }
+        assert unpack_frame(websocket.receive_bytes()) == (1, bytes([2, 1, 100]))
+        assert unpack_frame(websocket.receive_bytes()) == (0, bytes([2, 1, 200]))
+
+
+def test_inputs_are_held_back_beyond_the_window() -> None:
+    """
+    Checks that no more than `max_in_flight` inputs of a session run at once.
+    """
+    batcher = SlowBatcher()
+    client = TestClient(make_app(batcher, max_in_flight=2))
+    with client.websocket_connect("/predict_stream") as websocket:
+        websocket.receive_json()
+        for request_id in range(6):
+            websocket.send_bytes(pack_frame(request_id, bytes([20])))
+        request_ids = {unpack_frame(websocket.receive_bytes())[0] for _ in range(6)}
+
+    assert request_ids == set(range(6))
+    assert batcher.max_running == 2
@@ -0,0 +1,98 @@
+"""This module contains tests for the result cache of the client."""
+
+import asyncio
+import time
+
+import pytest
+
+from src.client.result_cache import ResultCache
+
+
+def test_keys_normalize_features_and_separate_versions() -> None:
+    """
+    Checks that equal feature vectors have the same key whatever their types, and that the
+    model version is part of the key.
+    """
+    key = ResultCache.key([10, 0.0, 1], "v1")
+    assert ResultCache.key([10.0, -0.0, 1.0], "v1") == key
+    assert ResultCache.key([10.0, 0.0, 2.0], "v1") != key
+    assert ResultCache.key([10.0, 0.0, 1.0], "v2") != key
+
+
+def test_entries_expire_and_are_evicted(monkeypatch) -> None:
+    """
+    Checks that the least recently used result is evicted beyond the size of the cache, and
+    that results expire after the time to live.
+
+    Args:
+        monkeypatch: Pytest fixture to patch the clock of the cache.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = ResultCache(max_entries=2, ttl=60)
+    cache.put(b"a", 1)
+    cache.put(b"b", 2)
+    assert cache.get(b"a") == 1
+    cache.put(b"c", 3)
+
+    assert cache.get(b"b") is None
+    assert (cache.get(b"a"), cache.get(b"c")) == (1, 3)
+    now[0] += 61
+    assert cache.get(b"a") is None
+
+
+def test_identical_inputs_in_flight_are_coalesced() -> None:
+    """
+    Checks that identical inputs computed at once run once, that the result is then answered
+    from the cache, and that errors are not cached.
+    """
+    runs = []
+
+    async def run():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def fail():
+        raise RuntimeError("FHE model failed")
+
+    async def scenario():
+        cache = ResultCache(max_entries=10, ttl=60)
+        results = await asyncio.gather(
+            *[cache.get_or_run(b"key", run) for _ in range(3)]
+        )
+        assert results == [42, 42, 42]
+        assert await cache.get_or_run(b"key", run) == 42
+        assert len(runs) == 1
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await cache.get_or_run(b"other", fail)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_others() -> None:
+    """
+    Checks that the identical inputs waiting for a result still get it when the caller that
+    started its computation is cancelled.
+    """
+
+    async def run():
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def scenario():
+        cache = ResultCache(max_entries=10, ttl=60)
+        first = asyncio.create_task(cache.get_or_run(b"key", run))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_run(b"key", run))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert await second == 42
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert cache.get(b"key") == 42
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+"""This module contains tests for the hyperparameter sweep of the FHE models."""
+
+import numpy as np
+
+from src.library.models.sweep import candidate_parameters, pareto_frontier, parse_values
+
+
+def test_candidates_only_sweep_the_parameters_of_the_model() -> None:
+    """
+    Checks that a grid search combines the values of the hyperparameters the model has, and
+    that a random search samples distinct combinations.
+    """
+    grid = {
+        "n_estimators": [10, 50],
+        "max_depth": parse_values("3,none"),
+        "n_bits": [4],
+    }
+
+    assert candidate_parameters({"n_bits": 8}, grid) == [{"n_bits": 4}]
+    assert candidate_parameters(
+        {"n_estimators": 100, "max_depth": 4, "n_bits": 6}, grid
+    ) == [
+        {"n_estimators": 10, "max_depth": 3, "n_bits": 4},
+        {"n_estimators": 10, "max_depth": None, "n_bits": 4},
+        {"n_estimators": 50, "max_depth": 3, "n_bits": 4},
+        {"n_estimators": 50, "max_depth": None, "n_bits": 4},
+    ]
+
+    sampled = candidate_parameters(
+        {"n_estimators": 100, "max_depth": 4},
+        grid,
+        search="random",
+        samples=3,
+        rng=np.random.default_rng(0),
+    )
+    assert len(sampled) == 3
+    assert len({tuple(params.items()) for params in sampled}) == 3
+
+
+def test_pareto_frontier_drops_dominated_candidates() -> None:
+    """
+    Checks that the frontier keeps the candidates no other one beats on both latency and
+    accuracy, from the fastest to the most accurate, and skips failed candidates.
+    """
+    results = [
+        {"Model": "a", "latency": 10, "accuracy": 0.90},
+        {"Model": "b", "latency": 20, "accuracy": 0.85},
+        {"Model": "c", "latency": 30, "accuracy": 0.95},
+        {"Model": "d", "latency": 5, "accuracy": 0.80},
+        {"Model": "e", "latency": 10, "accuracy": 0.88},
+        {"Model": "f", "Error": "compilation failed"},
+    ]
+
+    frontier = pareto_frontier(results, "latency", "accuracy")
+
+    assert [result["Model"] for result in frontier] == ["d", "a", "c"]